@@ -0,0 +1,53 @@
+"""Micro-benchmark: LoincFormalName construction
+
+Compares the previous row-wise `DataFrame.apply` join with `CodeIngest.concatentate_formal_name` on a synthetic
+Loinc.csv table.
+
+# Example
+python benchmarks/bench_formal_name.py --rows 100000
+"""
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from comp_loinc.ingest.code_ingest import CodeIngest
+
+FORMAL_NAME_COLS = ['COMPONENT', 'PROPERTY', 'TIME_ASPCT', 'SYSTEM', 'SCALE_TYP', 'METHOD_TYP']
+
+
+def synthetic_code_dataframe(rows, seed=0):
+    """Build a Loinc.csv-like dataframe with the formal name columns; about a third of METHOD_TYP is empty."""
+    rng = np.random.default_rng(seed)
+    data = {'LOINC_NUM': [f"{i}-{i % 10}" for i in range(rows)]}
+    for col in FORMAL_NAME_COLS:
+        values = np.array([f"{col.lower()}{x}" for x in range(50)], dtype=object)
+        data[col] = values[rng.integers(0, len(values), rows)]
+    data['METHOD_TYP'][rng.random(rows) < 0.33] = np.nan
+    return pd.DataFrame(data)
+
+
+def apply_formal_name(code_dataframe):
+    """The row-wise implementation that concatentate_formal_name replaced."""
+    return code_dataframe[FORMAL_NAME_COLS].apply(lambda row: ':'.join(row.values.astype(str)), axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_code_dataframe(args.rows)
+    assert apply_formal_name(df).tolist() == CodeIngest.concatentate_formal_name(df)['LoincFormalName'].tolist()
+    apply_s = min(timeit.repeat(lambda: apply_formal_name(df), number=1, repeat=args.repeat))
+    vector_s = min(timeit.repeat(lambda: CodeIngest.concatentate_formal_name(df), number=1, repeat=args.repeat))
+    print(f"rows: {args.rows}")
+    print(f"apply:      {apply_s:.3f}s")
+    print(f"vectorized: {vector_s:.3f}s")
+    print(f"speedup:    {apply_s / vector_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
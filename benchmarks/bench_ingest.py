@@ -0,0 +1,161 @@
+"""Benchmark: ingest scaling
+
+Times and memory-profiles the part ontology, the code classes, the mapping conversion and their OWL dumps on synthetic
+releases (see synthetic_release.py) at each scale, and stores the results as JSON, in benchmarks/results/<commit>.json
+by default, so they can be compared between commits. Each case runs in a fresh process, so its peak RSS is its own;
+the steps recorded in it (table reads, class construction, OWL dump) come from comp_loinc.metrics. The release table
+cache is not used, so every run parses the CSV files.
+
+# Example
+python benchmarks/bench_ingest.py --codes 10000,100000,1000000
+python benchmarks/bench_ingest.py --codes 10000,100000 --compare benchmarks/results/<earlier commit>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from comp_loinc.ingest.code_ingest import CodeIngest
+from comp_loinc.ingest.part_ingest import PartOntology
+from comp_loinc.mapping.fhir_concept_map_ingest import CHEBI_CONCEPT_MAP, MappingIngest
+from comp_loinc.metrics import stage, write_metrics
+from synthetic_release import synthetic_concept_map_elements, write_synthetic_release
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'comp_loinc', 'schema')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+CASES = ['parts', 'codes', 'mappings']
+
+
+def build_parts(release_directory, output_directory):
+    po = PartOntology(os.path.join(SCHEMA_DIR, 'part_schema.yaml'), os.path.join(release_directory, 'part_files'))
+    po.generate_ontology()
+    po.write_to_output(os.path.join(output_directory, 'part_ontology.owl'))
+
+
+def build_codes(release_directory, output_directory):
+    lcc = CodeIngest(os.path.join(SCHEMA_DIR, 'code_schema.yaml'), os.path.join(release_directory, 'code_files'))
+    lcc.write_output_to_file(os.path.join(output_directory, 'code_classes.owl'))
+
+
+def convert_mappings(release_directory, output_directory):
+    """The mapping conversion of MappingIngest.ingest, on synthetic ConceptMap elements for every component"""
+    with open(os.path.join(release_directory, 'component_part_numbers.json')) as f:
+        elements = synthetic_concept_map_elements(json.load(f))
+    ingest = MappingIngest([CHEBI_CONCEPT_MAP], output_directory, user='benchmark', pwd='')
+    # no FHIR requests: the elements are served from memory
+    ingest.fhir_client.concept_map_elements = lambda url: iter(elements)
+    ingest.run()
+
+
+CASE_BUILDS = {'parts': build_parts, 'codes': build_codes, 'mappings': convert_mappings}
+
+
+def run_case(case, release_directory, profile=None):
+    """
+    Run one case, quietly, in a worker process. The modules are imported when the worker starts, so import time is
+    not measured.
+    :return: dict of the case's stage metrics
+    """
+    output_directory = tempfile.mkdtemp()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), stage(case, profile) as metrics:
+            CASE_BUILDS[case](release_directory, output_directory)
+    finally:
+        shutil.rmtree(output_directory)
+    return metrics.as_dict()
+
+
+def prepare_release(data_directory, codes):
+    """
+    Write the synthetic release for a scale, unless it is already in data_directory
+    :return: str release directory
+    """
+    release_directory = os.path.join(data_directory, f"codes_{codes}")
+    marker = os.path.join(release_directory, 'component_part_numbers.json')
+    if not os.path.exists(marker):
+        parts = write_synthetic_release(release_directory, codes)
+        with open(marker, 'w') as f:
+            json.dump(parts['COMPONENT'][0][1:].tolist(), f)
+    return release_directory
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def throughput(result):
+    """Items built per second: classes, or mappings"""
+    counts = {}
+    for x in result['steps']:
+        counts.update(x['counts'])
+    items = counts.get('classes', counts.get('mappings'))
+    return items / result['wall_s'] if items and result['wall_s'] else None
+
+
+def print_results(results, previous=None):
+    previous = {(x['stage'], x['codes']): x for x in (previous or [])}
+    print(f"{'case':<9} {'codes':>8} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'items/s':>9}  steps")
+    for result in results:
+        rate = throughput(result)
+        step_times = {}
+        for x in result['steps']:
+            step_times[x['step']] = step_times.get(x['step'], 0.0) + x['wall_s']
+        steps = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in step_times.items())
+        line = (f"{result['stage']:<9} {result['codes']:>8} {result['wall_s']:>8.2f} {result['cpu_s']:>8.2f} "
+                f"{result['peak_rss_mb'] or 0:>8.0f} {rate or 0:>9.0f}  {steps}")
+        before = previous.get((result['stage'], result['codes']))
+        if before:
+            line += (f"  (wall {result['wall_s'] / before['wall_s']:.2f}x, "
+                     f"peak {(result['peak_rss_mb'] or 0) / (before['peak_rss_mb'] or 1):.2f}x of {before['commit']})")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', default='10000,100000', help='comma separated scales, in number of codes')
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=None)
+    parser.add_argument('--data-directory', default=None,
+                        help='where the synthetic releases are kept between runs; a temporary directory by default')
+    parser.add_argument('--output', default=None, help=f"results JSON, {RESULTS_DIR}/<commit>.json by default")
+    parser.add_argument('--compare', default=None, help='results JSON of an earlier run to compare with')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    data_directory = args.data_directory or tempfile.mkdtemp()
+    results = []
+    try:
+        for codes in [int(x) for x in args.codes.split(',')]:
+            release_directory = prepare_release(data_directory, codes)
+            for case in args.cases.split(','):
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    result = pool.submit(run_case, case, release_directory, args.profile).result()
+                result.update(codes=codes, commit=commit)
+                results.append(result)
+                print(f"{case} at {codes} codes: {result['wall_s']:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        if not args.data_directory:
+            shutil.rmtree(data_directory)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'results'}.json")
+    write_metrics(output, results, commit=commit, profile=args.profile)
+    print(f"Wrote {output}")
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['stages']
+    print_results(results, previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark: code class construction
+
+Compares building one LoincCodeClass dataclass per code with per-row slotted records and with a column-built
+RecordTable, for time and tracemalloc peak memory, on synthetic codes.
+
+# Example
+python benchmarks/bench_records.py --codes 50000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from linkml_runtime import SchemaView
+
+from comp_loinc.datamodel import LoincCodeClass
+from comp_loinc.ingest.records import RecordTable, record_type
+
+CODE_SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'src', 'comp_loinc', 'schema', 'code_schema.yaml')
+PREDICATES = ['has_time', 'has_property', 'has_method', 'has_component', 'has_system', 'has_scale']
+
+
+def synthetic_code_columns(codes):
+    """Columns like the ones CodeIngest.generate_codes builds; every tenth code has no method part."""
+    loinc_numbers = [f"{i}-{i % 10}" for i in range(codes)]
+    columns = {
+        'id': [f"loinc:{x}" for x in loinc_numbers],
+        'label': [f"component{i % 500}:MCnc:Pt:Ser/Plas:Qn:" for i in range(codes)],
+        'loinc_number': loinc_numbers,
+        'long_common_name': [f"Component {i % 500} [Mass/volume] in Serum or Plasma" for i in range(codes)],
+        'status': ['ACTIVE'] * codes,
+        'short_name': [f"Comp{i % 500} SerPl-mCnc" for i in range(codes)],
+        'subClassOf': ['loinc:lc0000001'] * codes,
+    }
+    columns['formal_name'] = columns['label']
+    for j, predicate in enumerate(PREDICATES):
+        columns[predicate] = [None if predicate == 'has_method' and i % 10 == 0 else f"loinc:LP{j}{i % 700}-1"
+                              for i in range(codes)]
+    return columns
+
+
+def rows(columns):
+    """The per-code params dicts of columns, without the None values"""
+    fields = list(columns)
+    return [{k: v for k, v in zip(fields, values) if v is not None} for values in zip(*columns.values())]
+
+
+def measure(build):
+    """:return: tuple of seconds, peak MB and the built objects"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', type=int, default=50000)
+    args = parser.parse_args()
+
+    sv = SchemaView(CODE_SCHEMA)
+    record_class = record_type(LoincCodeClass, sv)
+    columns = synthetic_code_columns(args.codes)
+    params = rows(columns)
+
+    results = {
+        'dataclasses': measure(lambda: [LoincCodeClass(**p) for p in params]),
+        'records': measure(lambda: [record_class(**p) for p in params]),
+        'record table': measure(lambda: RecordTable(LoincCodeClass, sv, columns)),
+    }
+    assert results['record table'][2].to_dataclasses() == results['dataclasses'][2]
+    print(f"codes: {args.codes}")
+    dataclass_s = results['dataclasses'][0]
+    for name, (seconds, peak, _) in results.items():
+        print(f"{name:<13} {seconds:7.3f}s  peak {peak:7.1f} MB  {dataclass_s / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
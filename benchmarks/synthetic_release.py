@@ -0,0 +1,189 @@
+"""Synthetic LOINC release files
+
+Writes release files at a given scale, in the layout the ingest reads: `code_files/Loinc.csv` with all of the release's
+columns, `code_files/LoincPartLink_Primary.csv`, `code_files/included_codes.tsv` listing every code, and one part
+hierarchy TSV per part type in `part_files`. Every code links one part of each type, except that every tenth code has no
+method. The number of parts grows with the number of codes, and each part type's parts form a tree with a fan-out of
+8. The component and system trees also have a row for each code under its part, like the release's hierarchy files.
+The output depends only on the number of codes and the seed.
+
+# Example
+python benchmarks/synthetic_release.py --codes 100000 --output /tmp/loinc_100k
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+LOINC_CSV_COLUMNS = [
+    'LOINC_NUM', 'COMPONENT', 'PROPERTY', 'TIME_ASPCT', 'SYSTEM', 'SCALE_TYP', 'METHOD_TYP', 'CLASS',
+    'VersionLastChanged', 'CHNG_TYPE', 'DefinitionDescription', 'STATUS', 'CONSUMER_NAME', 'CLASSTYPE', 'FORMULA',
+    'EXMPL_ANSWERS', 'SURVEY_QUEST_TEXT', 'SURVEY_QUEST_SRC', 'UNITSREQUIRED', 'RELATEDNAMES2', 'SHORTNAME',
+    'ORDER_OBS', 'HL7_FIELD_SUBFIELD_ID', 'EXTERNAL_COPYRIGHT_NOTICE', 'EXAMPLE_UNITS', 'LONG_COMMON_NAME',
+    'EXAMPLE_UCUM_UNITS', 'STATUS_REASON', 'STATUS_TEXT', 'CHANGE_REASON_PUBLIC', 'COMMON_TEST_RANK',
+    'COMMON_ORDER_RANK', 'COMMON_SI_TEST_RANK', 'HL7_ATTACHMENT_STRUCTURE', 'EXTERNAL_COPYRIGHT_LINK', 'PanelType',
+    'AskAtOrderEntry', 'AssociatedObservations', 'VersionFirstReleased', 'ValidHL7AttachmentRequest', 'DisplayName'
+]
+LPL_CSV_COLUMNS = ['LoincNumber', 'LongCommonName', 'PartNumber', 'PartName', 'PartCodeSystem', 'PartTypeName',
+                   'LinkTypeName', 'Property']
+PART_FILE_COLUMNS = ['ParentPartNumber', 'ParentPart', 'ParentPartTypeName', 'ChildPartNumber', 'ChildPart',
+                     'ChildPartTypeName', 'LOINC_NUMBER', 'FormalName']
+# part type: Loinc.csv column, part hierarchy file, minimum number of parts, codes per part
+PART_TYPES = {
+    'COMPONENT': ('COMPONENT', 'ComponentTree.tsv', 10, 4),
+    'PROPERTY': ('PROPERTY', 'PropertyTree.tsv', 10, 500),
+    'TIME': ('TIME_ASPCT', 'TimeTree.tsv', 5, 2000),
+    'SYSTEM': ('SYSTEM', 'SystemTree.tsv', 10, 100),
+    'SCALE': ('SCALE_TYP', 'ScaleTree.tsv', 5, 20000),
+    'METHOD': ('METHOD_TYP', 'MethodTree.tsv', 10, 200),
+}
+CODE_PART_TREES = ['COMPONENT', 'SYSTEM']
+FAN_OUT = 8
+
+
+def check_digit(number):
+    """LOINC mod 10 check digit"""
+    digits = [int(x) for x in str(number)][::-1]
+    total = sum(sum(divmod(d * 2, 10)) if i % 2 == 0 else d for i, d in enumerate(digits))
+    return (10 - total % 10) % 10
+
+
+def loinc_number(number):
+    return f"{number}-{check_digit(number)}"
+
+
+def synthetic_parts(codes):
+    """
+    :param codes: int number of codes
+    :return: dict of part type to a tuple of numpy arrays of part numbers and part names; part 0 is the tree root
+    """
+    parts = {}
+    next_number = 100000
+    for part_type, (_, _, minimum, codes_per_part) in PART_TYPES.items():
+        n_parts = max(minimum, codes // codes_per_part)
+        numbers = np.array([f"LP{x}-{check_digit(x)}" for x in range(next_number, next_number + n_parts)],
+                           dtype=object)
+        names = np.array([f"{{{part_type.lower()}}}"] + [f"{part_type.lower()} {i}" for i in range(1, n_parts)],
+                         dtype=object)
+        parts[part_type] = (numbers, names)
+        next_number += n_parts
+    return parts
+
+
+def part_parent(index):
+    """Index of the parent of a part in its type's tree; the root is its own parent"""
+    return np.maximum(index - 1, 0) // FAN_OUT
+
+
+def synthetic_codes(codes, parts, seed=0):
+    """
+    :return: dict of LOINC number array and, per part type, the index of each code's part, -1 for no part
+    """
+    rng = np.random.default_rng(seed)
+    code_parts = {'LOINC_NUM': np.array([loinc_number(x) for x in range(10000, 10000 + codes)], dtype=object)}
+    for part_type, (numbers, _) in parts.items():
+        # the root is not linked to codes
+        code_parts[part_type] = rng.integers(1, len(numbers), codes) if len(numbers) > 1 else np.zeros(codes, int)
+    code_parts['METHOD'][np.arange(codes) % 10 == 0] = -1
+    return code_parts
+
+
+def write_loinc_csv(path, code_parts, parts):
+    names = {part_type: parts[part_type][1] for part_type in PART_TYPES}
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(LOINC_CSV_COLUMNS)
+        empty = {column: '' for column in LOINC_CSV_COLUMNS}
+        for i, number in enumerate(code_parts['LOINC_NUM']):
+            row = dict(empty)
+            for part_type, (column, _, _, _) in PART_TYPES.items():
+                index = code_parts[part_type][i]
+                row[column] = names[part_type][index] if index >= 0 else ''
+            formal_name = ':'.join(row[column] for column, _, _, _ in PART_TYPES.values())
+            row.update(LOINC_NUM=number, CLASS='CHEM', VersionLastChanged='2.74', CHNG_TYPE='ADD', STATUS='ACTIVE',
+                       CLASSTYPE='1', SHORTNAME=formal_name[:40], LONG_COMMON_NAME=formal_name,
+                       VersionFirstReleased='2.74', ORDER_OBS='Both')
+            writer.writerow(row.values())
+
+
+def write_lpl_csv(path, code_parts, parts):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(LPL_CSV_COLUMNS)
+        for i, number in enumerate(code_parts['LOINC_NUM']):
+            for part_type, (numbers, names) in parts.items():
+                index = code_parts[part_type][i]
+                if index >= 0:
+                    writer.writerow([number, '', numbers[index], names[index], 'http://loinc.org', part_type,
+                                     'Primary', f"http://loinc.org/property/{PART_TYPES[part_type][0]}"])
+
+
+def write_part_file(path, part_type, numbers, names, code_parts=None):
+    """
+    One row per part under its parent, and with code_parts, one row per code under its part's parent
+    """
+    parents = part_parent(np.arange(len(numbers)))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(PART_FILE_COLUMNS)
+        for child, parent in enumerate(parents):
+            writer.writerow([numbers[parent], names[parent], part_type, numbers[child], names[child], part_type, '',
+                             ''])
+        if code_parts is not None:
+            for number, child in zip(code_parts['LOINC_NUM'], code_parts[part_type]):
+                parent = parents[child]
+                writer.writerow([numbers[parent], names[parent], part_type, numbers[child], names[child], part_type,
+                                 number, f"{names[child]}:MCnc:Pt:Ser/Plas:Qn:"])
+
+
+def write_synthetic_release(directory, codes, seed=0):
+    """
+    Write the synthetic release files
+    :param directory: str; the files are written to its code_files and part_files directories
+    :param codes: int number of codes
+    :param seed: int random seed
+    :return: dict of the parts, see synthetic_parts
+    """
+    code_directory = os.path.join(directory, 'code_files')
+    part_directory = os.path.join(directory, 'part_files')
+    os.makedirs(code_directory, exist_ok=True)
+    os.makedirs(part_directory, exist_ok=True)
+    parts = synthetic_parts(codes)
+    code_parts = synthetic_codes(codes, parts, seed)
+    write_loinc_csv(os.path.join(code_directory, 'Loinc.csv'), code_parts, parts)
+    write_lpl_csv(os.path.join(code_directory, 'LoincPartLink_Primary.csv'), code_parts, parts)
+    with open(os.path.join(code_directory, 'included_codes.tsv'), 'w') as f:
+        f.writelines(f"{x}\n" for x in code_parts['LOINC_NUM'])
+    for part_type, (numbers, names) in parts.items():
+        write_part_file(os.path.join(part_directory, PART_TYPES[part_type][1]), part_type, numbers, names,
+                        code_parts if part_type in CODE_PART_TREES else None)
+    return parts
+
+
+def synthetic_concept_map_elements(part_numbers, seed=0):
+    """
+    FHIR ConceptMap elements mapping parts to ChEBI, for the mapping conversion; one in twenty elements has an
+    equivalence that is not converted
+    :param part_numbers: iterable of str LOINC part numbers
+    :return: list of element dicts
+    """
+    rng = np.random.default_rng(seed)
+    equivalences = np.array(['equivalent', 'wider', 'narrower', 'relatedto', 'equal'] * 4 + ['unmatched'])
+    return [{'code': number, 'target': [{'code': f"CHEBI:{10000 + i}", 'display': f"chebi {i}",
+                                         'equivalence': equivalence}]}
+            for i, (number, equivalence) in enumerate(zip(part_numbers, rng.choice(equivalences, len(part_numbers))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', type=int, default=10000)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    parts = write_synthetic_release(args.output, args.codes, args.seed)
+    print(f"Wrote {args.codes} codes and {sum(len(x[0]) for x in parts.values())} parts to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Build manifest
+
+Records, for each pipeline stage, the hashes of its input files, its options, the versions of the tools it runs and the
+hashes of the outputs it wrote. An incremental build reuses a stage when all of these match the last recorded build and
+its outputs are still on disk unchanged. Downstream stages list upstream outputs among their inputs, so a stage is
+rebuilt whenever an upstream stage wrote different output, and reused when the rebuilt upstream output is identical.
+
+File hashes are remembered with the file size and mtime, so unchanged files are not re-read on every build. The stages
+are checked and recorded by comp_loinc.pipeline.run_stages.
+
+# Example
+manifest = BuildManifest('./data/output/build_manifest.json')
+key = manifest.stage_key([schema_file, part_directory], {'output': output}, tool_versions('pandas'))
+if not manifest.is_current('parts', key):
+    build_part_ontology(...)
+    manifest.record('parts', key, [output])
+manifest.print_summary()
+"""
+import datetime
+import json
+import os
+import platform
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+
+# Bump when the manifest layout changes so that old manifests are ignored
+MANIFEST_VERSION = 1
+
+
+def package_version(name):
+    """
+    :param name: distribution name
+    :return: str version, or None if the package is not installed
+    """
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def tool_versions(*packages, files=()):
+    """
+    Versions of the tools a stage runs: python, the given packages, and the content hash of tool files such as the
+    ROBOT launcher, which has no version of its own
+    :param packages: distribution names
+    :param files: paths of tool files
+    :return: dict
+    """
+    # imported here, as the table cache loads pandas, so that importing the manifest stays cheap for the CLI
+    from comp_loinc.ingest.table_cache import file_digest
+
+    versions = {'python': platform.python_version(), 'comp-loinc': package_version('comp-loinc')}
+    versions.update({package: package_version(package) for package in packages})
+    versions.update({os.path.basename(path): file_digest(path) if os.path.isfile(path) else None for path in files})
+    return versions
+
+
+def schema_files(schema_path):
+    """
+    A LinkML schema file and the local schema files it imports, directly or through other imports, so that a stage
+    reading the schema is rebuilt when any of them changes. Prefixed imports, such as linkml:types, ship with linkml.
+    :param schema_path: str to a LinkML schema file
+    :return: list of str schema file paths, schema_path first
+    """
+    import yaml
+
+    files = []
+    pending = [os.path.abspath(schema_path)]
+    while pending:
+        path = pending.pop(0)
+        if path in files:
+            continue
+        files.append(path)
+        if not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            imports = (yaml.safe_load(f) or {}).get('imports') or []
+        pending.extend(os.path.join(os.path.dirname(path), f"{name}.yaml") for name in imports if ':' not in name)
+    return files
+
+
+class BuildManifest(object):
+    """
+    Build manifest of the pipeline stages, stored as JSON
+    """
+    def __init__(self, path):
+        """
+        :param path: str to the manifest JSON file; it is created on the first save
+        """
+        self.path = path
+        self.stages = {}
+        self.file_hashes = {}
+        self.reused = []
+        self.rebuilt = []
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.stages = manifest['stages']
+                self.file_hashes = manifest['file_hashes']
+
+    def save(self):
+        """
+        Write the manifest, replacing the previous one atomically
+        """
+        Path(os.path.dirname(self.path) or '.').mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'stages': self.stages, 'file_hashes': self.file_hashes}, f,
+                      indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def file_hash(self, path):
+        """
+        sha256 of a file, reusing the recorded hash when the size and mtime are unchanged
+        :param path: str
+        :return: str
+        """
+        from comp_loinc.ingest.table_cache import file_digest
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        recorded = self.file_hashes.get(path)
+        if recorded and recorded['size'] == stat.st_size and recorded['mtime_ns'] == stat.st_mtime_ns:
+            return recorded['sha256']
+        sha = file_digest(path)
+        self.file_hashes[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+        return sha
+
+    def path_hashes(self, paths):
+        """
+        Hashes of files, and of every file under directories; missing paths hash to None
+        :param paths: list of str to files or directories
+        :return: dict of path to sha256
+        """
+        hashes = {}
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, files in sorted(os.walk(path)):
+                    for name in sorted(files):
+                        hashes[os.path.join(root, name)] = self.file_hash(os.path.join(root, name))
+            else:
+                hashes[path] = self.file_hash(path) if os.path.isfile(path) else None
+        return hashes
+
+    def stage_key(self, inputs, options, tools):
+        """
+        :return: dict identifying one build of a stage
+        """
+        return {'inputs': self.path_hashes(inputs), 'options': options, 'tools': tools}
+
+    def is_current(self, stage, key):
+        """
+        Whether the recorded build of stage has the same inputs, options and tools, and its outputs are unchanged
+        :param stage: str stage name
+        :param key: dict from stage_key
+        :return: bool
+        """
+        recorded = self.stages.get(stage)
+        if recorded is None or {k: recorded[k] for k in key} != json.loads(json.dumps(key)):
+            return False
+        outputs = recorded['outputs']
+        return all(sha is not None for sha in outputs.values()) and self.path_hashes(list(outputs)) == outputs
+
+    def record(self, stage, key, outputs):
+        """
+        Record a finished build of stage and save the manifest
+        :param stage: str stage name
+        :param key: dict from stage_key
+        :param outputs: list of str output paths
+        """
+        self.stages[stage] = dict(key, outputs=self.path_hashes(outputs),
+                                  finished=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self.save()
+
+    def print_summary(self):
+        """
+        Print which stages were reused and which were built
+        """
+        print(f"Reused stages: {', '.join(self.reused) or 'none'}")
+        print(f"Built stages: {', '.join(self.rebuilt) or 'none'}")
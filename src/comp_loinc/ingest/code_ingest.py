@@ -1,38 +1,186 @@
+import numpy as np
 import pandas as pd
-from linkml_owl.dumpers.owl_dumper import OWLDumper
-from linkml_runtime import SchemaView
 import datetime
+import os
 from pathlib import Path
 import sys
 path_root = Path(__file__).parents[2]
 sys.path.append(str(path_root))
-from comp_loinc.ingest.source_data_utils import loincify, counter
+from comp_loinc.ingest.source_data_utils import loincify
+from comp_loinc.metrics import step
+from comp_loinc.ingest.table_cache import CACHE_AVAILABLE, cache_path, load_release_table, write_table_snapshot
+from comp_loinc.ingest.owl_writer import StreamingOWLWriter
+from comp_loinc.ingest.records import RecordTable, load_schema_view
+from comp_loinc.ingest.release_tables import LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS, \
+    LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS, LOINC_MEMBER, LPL_MEMBER
 from comp_loinc.datamodel import LoincCodeClass
 
+PART_PREDICATE_MAP = {
+    "TIME": "has_time",
+    "PROPERTY": "has_property",
+    "METHOD": "has_method",
+    "COMPONENT": "has_component",
+    "SYSTEM": "has_system",
+    "SCALE": "has_scale"
+}
+# Release tables read by the code ingest: file name in the code file directory, path suffix in the release zip, columns
+# kept and categorical columns
+CODE_TABLES = {
+    'Loinc.csv': (LOINC_MEMBER, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS),
+    'LoincPartLink_Primary.csv': (LPL_MEMBER, LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS),
+}
+
+
+def code_table_source(file_name, code_file_path, release_zip=None):
+    """
+    :param file_name: str key of CODE_TABLES
+    :return: tuple of the path and the zip member, or None, that the code table is read from
+    """
+    if release_zip:
+        return release_zip, CODE_TABLES[file_name][0]
+    return f'{code_file_path}/{file_name}', None
+
+
+def load_code_tables(code_file_path, cache_directory=None, release_zip=None, chunk_size=None):
+    """
+    Read the CODE_TABLES, see CodeIngest for the parameters
+    :return: dict of file name to Pandas Dataframe
+    """
+    tables = {}
+    for file_name, (_, columns, categorical_columns) in CODE_TABLES.items():
+        path, member = code_table_source(file_name, code_file_path, release_zip)
+        tables[file_name] = load_release_table(path, columns, categorical_columns, member=member,
+                                               cache_directory=cache_directory, chunk_size=chunk_size)
+    return tables
+
+
+def read_included_codes(code_file_path):
+    """
+    :param code_file_path: str to the code file directory
+    :return: list of the LOINC numbers in included_codes.tsv
+    """
+    with open(f"{code_file_path}/included_codes.tsv", 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+class CodePartGroups(object):
+    """
+    Parts linked to each code, kept as parallel arrays instead of a dict of lists per code.
+    The parts of codes[i] are part_numbers[offsets[i]:offsets[i + 1]] and part_types[offsets[i]:offsets[i + 1]], in
+    LoincPartLink_Primary.csv order. predicate_parts[i] holds the part number for each of PART_PREDICATE_MAP's
+    predicates (None where the code has no such part); the last linked part of a type wins.
+    """
+    predicates = list(PART_PREDICATE_MAP.values())
+
+    def __init__(self, lpl_dataframe):
+        """
+        :param lpl_dataframe: Pandas Dataframe with LoincNumber, PartNumber and PartTypeName columns
+        """
+        lpl_dataframe = lpl_dataframe.sort_values('LoincNumber', kind='stable')
+        loinc_numbers = lpl_dataframe['LoincNumber'].to_numpy(dtype=object)
+        self.codes, starts = np.unique(loinc_numbers, return_index=True)
+        self.offsets = np.append(starts, len(loinc_numbers))
+        self.part_numbers = lpl_dataframe['PartNumber'].to_numpy(dtype=object)
+        self.part_types = lpl_dataframe['PartTypeName'].to_numpy(dtype=object)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+
+        self.predicate_parts = np.full((len(self.codes), len(self.predicates)), None, dtype=object)
+        predicate_index = pd.Series(range(len(self.predicates)), index=list(PART_PREDICATE_MAP.keys()))
+        row_predicate = predicate_index.reindex(self.part_types).to_numpy()
+        row_code = np.repeat(np.arange(len(self.codes)), np.diff(self.offsets))
+        rows = pd.DataFrame({'code': row_code, 'predicate': row_predicate, 'part': self.part_numbers})
+        rows = rows.dropna(subset=['predicate'])
+        rows = rows.drop_duplicates(subset=['code', 'predicate'], keep='last')
+        self.predicate_parts[rows['code'].to_numpy(), rows['predicate'].to_numpy(dtype=int)] = rows['part'].to_numpy()
+
+    def __contains__(self, code):
+        return code in self.code_index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def keys(self):
+        return self.code_index.keys()
+
+    def parts(self, code):
+        """
+        :param code: LOINC number
+        :return: list of (part number, part type) tuples
+        """
+        i = self.code_index[code]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.part_numbers[start:end], self.part_types[start:end]))
+
+    def predicate_params(self, code):
+        """
+        :param code: LOINC number
+        :return: dict of has_* predicate to loincified part number
+        """
+        return {
+            predicate: loincify(part)
+            for predicate, part in zip(self.predicates, self.predicate_parts[self.code_index[code]])
+            if part is not None
+        }
+
 
 class CodeIngest(object):
     """
     Code ingest
 
     """
-    def __init__(self, schema_path: str, code_file_path: str):
+    def __init__(self, schema_path: str, code_file_path: str, cache_directory: str = None, validate: str = 'sample',
+                 release_zip: str = None, chunk_size: int = None, tables: dict = None, included_codes: list = None,
+                 codes=None):
+        """
+        :param schema_path: str to the code LinkML schema
+        :param code_file_path: str to the code file directory, holding included_codes.tsv and, unless release_zip is
+        given, Loinc.csv and LoincPartLink_Primary.csv
+        :param cache_directory: str to the release table cache, or None
+        :param validate: 'none', 'sample' or 'full' schema validation of the code classes, see records.validate_records
+        :param release_zip: str to a LOINC release zip to read Loinc.csv and LoincPartLink_Primary.csv from, without
+        extracting them
+        :param chunk_size: int number of rows parsed at a time, or None to parse each table at once
+        :param tables: optional dict of file name to Dataframe, as from load_code_tables, to build from instead of
+        reading the release files
+        :param included_codes: optional list of LOINC numbers to use instead of included_codes.tsv
+        :param codes: optional collection of LOINC numbers; only the included codes among them are built
+        """
         print(f"Beginning Code Ingest at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self.code_file_path = code_file_path
-        self.lpl_dataframe = self.process_lpl_file()
-        self.code_dataframe = self.process_loinc_file()
+        self.cache_directory = cache_directory
+        self.release_zip = release_zip
+        self.chunk_size = chunk_size
+        self.validate = validate
+        if tables is None:
+            self.lpl_dataframe = self.process_lpl_file()
+            self.code_dataframe = self.index_code_dataframe(self.process_loinc_file())
+        else:
+            self.lpl_dataframe = tables['LoincPartLink_Primary.csv']
+            self.code_dataframe = self.index_code_dataframe(tables['Loinc.csv'])
         self.code_classes = []
-        self.concatentate_formal_name()
-        self.group_map = self.group_by_code()
-        self.generate_codes()
-        self.sv = SchemaView(schema_path) # '../model/schema/code_schema.yaml'
-        self.od = OWLDumper()
+        self.missing_codes = pd.DataFrame(columns=['LOINC_NUM', 'missing_from'])
+        self.included_code_dataframe = None
+        self.included_codes = self.get_included_codes() if included_codes is None else list(included_codes)
+        self.built_codes = self.included_codes
+        if codes is not None:
+            codes = set(codes)
+            self.built_codes = [x for x in self.included_codes if x in codes]
+        with step('grouping') as metrics:
+            self.group_map = self.group_by_code(self.built_codes)
+            metrics.count(codes=len(self.group_map.codes))
+        self.sv = load_schema_view(schema_path) # '../model/schema/code_schema.yaml'
+        with step('class_construction') as metrics:
+            self.generate_codes()
+            metrics.count(classes=len(self.code_classes))
+        self.owl_writer = StreamingOWLWriter(self.sv)
 
     def process_lpl_file(self):
         """
         Read the LoincPartLink_Primary.csv file into a pandas dataframe
         "LoincNumber","LongCommonName","PartNumber","PartName","PartCodeSystem","PartTypeName","LinkTypeName","Property"
+        Only LPL_COLUMNS are kept.
         """
-        return pd.read_csv(f'{self.code_file_path}/LoincPartLink_Primary.csv', sep=",", dtype=str)
+        return self.load_table('LoincPartLink_Primary.csv', LPL_MEMBER, LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS)
 
     def process_loinc_file(self):
         """
@@ -44,71 +192,135 @@ class CodeIngest(object):
         "STATUS_REASON","STATUS_TEXT","CHANGE_REASON_PUBLIC","COMMON_TEST_RANK","COMMON_ORDER_RANK",
         "COMMON_SI_TEST_RANK","HL7_ATTACHMENT_STRUCTURE","EXTERNAL_COPYRIGHT_LINK","PanelType","AskAtOrderEntry",
         "AssociatedObservations","VersionFirstReleased","ValidHL7AttachmentRequest","DisplayName"
+        Only LOINC_COLUMNS are kept.
+        """
+        return self.load_table('Loinc.csv', LOINC_MEMBER, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS)
+
+    def load_table(self, file_name, member, columns, categorical_columns):
         """
-        return pd.read_csv(f'{self.code_file_path}/Loinc.csv', sep=",", dtype=str)
+        Load a release table from the code file directory, or from the release zip if one was given
+        :param file_name: str file name in the code file directory
+        :param member: str path suffix of the file in the release zip
+        :return: Pandas Dataframe
+        """
+        if self.release_zip:
+            return load_release_table(self.release_zip, columns, categorical_columns, member=member,
+                                      cache_directory=self.cache_directory, chunk_size=self.chunk_size)
+        return load_release_table(f'{self.code_file_path}/{file_name}', columns, categorical_columns,
+                                  cache_directory=self.cache_directory, chunk_size=self.chunk_size)
 
-    def concatentate_formal_name(self):
+    @staticmethod
+    def index_code_dataframe(code_dataframe):
+        """
+        Index the Loinc.csv dataframe on LOINC_NUM once so code rows can be selected by key instead of by scanning
+        the whole table for every code. The first row wins if a LOINC_NUM is repeated.
         """
-        Concatenate the columns of the LoincPartLink_Primary.csv file to create the LoincFormalName
+        code_dataframe = code_dataframe.drop_duplicates(subset='LOINC_NUM', keep='first')
+        return code_dataframe.set_index('LOINC_NUM', drop=False)
+
+    def select_included_codes(self, included_codes):
+        """
+        Select the Loinc.csv rows for all included codes in one keyed join, preserving the order of
+        included_codes.tsv. Codes that are missing from Loinc.csv or from LoincPartLink_Primary.csv are recorded in
+        self.missing_codes instead of being skipped silently.
+        :param included_codes: list of LOINC numbers
+        :return: Pandas Dataframe
+        """
+        included = pd.Index(included_codes, name='LOINC_NUM')
+        in_loinc = included.isin(self.code_dataframe.index)
+        in_lpl = included.isin(self.group_map.codes)
+        missing = [
+            pd.DataFrame({'LOINC_NUM': included[~in_loinc], 'missing_from': 'Loinc.csv'}),
+            pd.DataFrame({'LOINC_NUM': included[~in_lpl], 'missing_from': 'LoincPartLink_Primary.csv'})
+        ]
+        self.missing_codes = pd.concat(missing, ignore_index=True)
+        return self.code_dataframe.loc[included[in_loinc & in_lpl]]
+
+    def write_missing_codes(self, output_path):
+        """
+        Write the included codes that could not be found in the release files as a TSV side table
+        :param output_path: str
+        """
+        self.missing_codes.to_csv(output_path, sep="\t", index=False)
+
+    @staticmethod
+    def concatentate_formal_name(code_dataframe):
+        """
+        Concatenate the columns of the Loinc.csv file to create the LoincFormalName
         ‘COMPONENT:PROPERTY:TIME_ASPCT:SYSTEM:SCALE_TYP:METHOD_TYP’
+        Columns are joined with vectorized string concatenation; empty values are rendered as 'nan', as they were when
+        each row was joined with astype(str).
+        :param code_dataframe: Pandas Dataframe of Loinc.csv rows
+        :return: Pandas Dataframe with the added LoincFormalName column
         """
         cols = ['COMPONENT', 'PROPERTY', 'TIME_ASPCT', 'SYSTEM', 'SCALE_TYP', 'METHOD_TYP']
-        self.code_dataframe['LoincFormalName'] = self.code_dataframe[cols].apply(lambda row: ':'.join(row.values.astype(str)), axis=1)
+        code_dataframe = code_dataframe.copy()
+        code_dataframe['LoincFormalName'] = code_dataframe[cols[0]].astype(object).str.cat(
+            [code_dataframe[col].astype(object) for col in cols[1:]], sep=':', na_rep='nan')
+        return code_dataframe
 
     def get_included_codes(self):
         """
         Get the list of codes that should be ingested
         Initial set is chemical component codes
         """
-        with open(f"{self.code_file_path}/included_codes.tsv", 'r') as f:
-            return [line.strip() for line in f.readlines()]
+        return read_included_codes(self.code_file_path)
 
-    def group_by_code(self):
+    def group_by_code(self, included_codes):
         """
-        Group parts by code
+        Group the parts of the included codes by code. The part links are filtered to the included codes before
+        grouping.
+        :param included_codes: list of LOINC numbers
+        :return: CodePartGroups
         """
-        group_map = {}
-        groups = self.lpl_dataframe.groupby(['LoincNumber'])[["PartNumber", "PartTypeName"]]
-        for group, data in groups:
-            group_map[group] = {
-                "name": group,
-                "parts": list(zip(data['PartNumber'], data['PartTypeName']))
-            }
-        return group_map
+        lpl = self.lpl_dataframe[self.lpl_dataframe['LoincNumber'].isin(included_codes)]
+        return CodePartGroups(lpl[['LoincNumber', 'PartNumber', 'PartTypeName']])
 
     def generate_codes(self):
-        part_pred_map = {
-            "TIME": "has_time",
-            "PROPERTY": "has_property",
-            "METHOD": "has_method",
-            "COMPONENT": "has_component",
-            "SYSTEM": "has_system",
-            "SCALE": "has_scale"
+        """
+        Build the code classes of the included codes as a RecordTable, column by column, instead of constructing a
+        LoincCodeClass per code. Call `self.code_classes.to_dataclasses()` for the full LinkML instances.
+        """
+        self.included_code_dataframe = self.concatentate_formal_name(self.select_included_codes(self.built_codes))
+        code_rows = self.included_code_dataframe
+        if len(self.missing_codes):
+            print(f"{self.missing_codes['LOINC_NUM'].nunique()} included codes are missing from the release files")
+        loinc_numbers = code_rows['LOINC_NUM'].tolist()
+        columns = {
+            "id": [loincify(x) for x in loinc_numbers],
+            "label": code_rows['LoincFormalName'].tolist(),
+            "formal_name": code_rows['LoincFormalName'].tolist(),
+            "loinc_number": loinc_numbers,
+            "long_common_name": code_rows['LONG_COMMON_NAME'].astype(object).tolist(),
+            "status": code_rows['STATUS'].astype(object).tolist(),
+            "short_name": code_rows['SHORTNAME'].astype(object).tolist(),
+            "subClassOf": loincify("lc0000001")
         }
-        included_codes = self.get_included_codes()
-        for i, loinc_number in enumerate(included_codes):
-            counter(i + 1, len(included_codes))
-            if loinc_number in self.group_map.keys():
-                row = self.code_dataframe[self.code_dataframe['LOINC_NUM'] == loinc_number].iloc[0]
-                params = {
-                            "id": loincify(row.LOINC_NUM),
-                            "label": row.LoincFormalName,
-                            "formal_name": row.LoincFormalName,
-                            "loinc_number": row.LOINC_NUM,
-                            "long_common_name": row.LONG_COMMON_NAME,
-                            "status": row.STATUS,
-                            "short_name": row.SHORTNAME,
-                            "subClassOf": loincify("lc0000001")
-                        }
-                lpl = self.group_map[row.LOINC_NUM]
-                for part, part_type in lpl['parts']:
-                    if part_type in part_pred_map.keys():
-                        params[part_pred_map[part_type]] = loincify(part)
-                self.code_classes.append(LoincCodeClass(**params))
+        predicate_parts = self.group_map.predicate_parts[[self.group_map.code_index[x] for x in loinc_numbers]]
+        for j, predicate in enumerate(self.group_map.predicates):
+            columns[predicate] = [None if part is None else loincify(part) for part in predicate_parts[:, j]]
+        self.code_classes = RecordTable(LoincCodeClass, self.sv, columns, validate=self.validate)
+        print(f"Generated {len(self.code_classes)} code classes")
 
     def write_output_to_file(self, output_path):
         #"../../data/output/code_classes.owl"
         print(f"\nWriting to ouput at {output_path}")
-        with open(output_path, 'w') as ccl_owl:
-            ccl_owl.write(self.od.dumps(self.code_classes, schema=self.sv.schema))
+        with step('owl_dump', file=os.path.basename(output_path)) as metrics:
+            self.owl_writer.write(self.code_classes, output_path)
+            metrics.count(classes=len(self.code_classes))
         print(f"Finished Code Ingest at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def write_table_snapshot(self, output_path):
+        """
+        Record the cache entries of the code tables and the included codes that output_path was built from, so that
+        the `delta` command can update it to a later release. Nothing is recorded without the table cache.
+        :param output_path: str to the code ontology
+        """
+        if self.cache_directory is None or not CACHE_AVAILABLE:
+            return
+        tables = {}
+        for file_name, (_, columns, categorical_columns) in CODE_TABLES.items():
+            path, member = code_table_source(file_name, self.code_file_path, self.release_zip)
+            tables[file_name] = (cache_path(self.cache_directory, path, columns, categorical_columns, member=member),
+                                 categorical_columns)
+        write_table_snapshot(self.cache_directory, output_path, tables, included_codes=self.included_codes)
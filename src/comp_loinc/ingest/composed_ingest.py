@@ -0,0 +1,118 @@
+"""Composed class ingest
+
+Builds the composed classes, CodeByComponent and CodeBySystem, that the reasoner uses to group LOINC codes by their
+component or system part. One class is generated for every COMPONENT and SYSTEM part of the part hierarchy files, all
+parts of a type at once as one RecordTable, and the hand-written entries of composed_classes_data.yaml are added
+alongside, taking precedence over a generated class with the same id. The classes are written with the
+StreamingOWLWriter, in the same OWL as `linkml-data2owl` produces for the data file.
+
+# Example
+cc = ComposedClasses('./src/comp_loinc/schema/grouping_classes_schema.yaml', './data/composed_classes_data.yaml',
+                     './data/part_files')
+cc.write_to_output('./data/output/owl_component_files/composed_component_classes.owl')
+"""
+import datetime
+import os
+
+import yaml
+
+from comp_loinc import datamodel
+from comp_loinc.datamodel import CodeByComponent, CodeBySystem
+from comp_loinc.ingest.owl_writer import StreamingOWLWriter
+from comp_loinc.ingest.part_ingest import load_part_files
+from comp_loinc.ingest.records import RecordTable, load_schema_view, record_type, validate_records
+from comp_loinc.metrics import step
+
+# part type: composed class, its id prefix, label suffix and the slot pointing to the part
+COMPOSED_PART_TYPES = {
+    'COMPONENT': (CodeByComponent, 'CC-', ' Component Class', 'has_component'),
+    'SYSTEM': (CodeBySystem, 'SC-', ' System Class', 'has_system'),
+}
+
+
+def load_composed_classes_data(path, schema_view):
+    """
+    Read hand-written composed classes, a YAML list of objects whose `@type` is the LinkML class
+    :param path: str
+    :param schema_view: SchemaView of the grouping classes schema
+    :return: list of records
+    """
+    with open(path, 'r') as f:
+        entries = yaml.load(f, Loader=yaml.FullLoader) or []
+    records = []
+    for entry in entries:
+        params = dict(entry)
+        records.append(record_type(getattr(datamodel, params.pop('@type')), schema_view)(**params))
+    return records
+
+
+def composed_part_classes(parts_df, schema_view, validate='sample'):
+    """
+    A composed class for every COMPONENT and SYSTEM part
+    :param parts_df: Pandas Dataframe of part file rows; a part's label and type come from its first row
+    :param schema_view: SchemaView of the grouping classes schema
+    :param validate: 'none', 'sample' or 'full', see records.validate_records
+    :return: list of RecordTable, one per part type, in ChildPartNumber order
+    """
+    parts = parts_df.dropna(subset=['ChildPartNumber']).sort_values('ChildPartNumber', kind='stable') \
+        .drop_duplicates(subset='ChildPartNumber', keep='first')
+    tables = []
+    for part_type, (python_class, id_prefix, label_suffix, slot) in COMPOSED_PART_TYPES.items():
+        type_parts = parts[(parts['ChildPartTypeName'] == part_type).to_numpy()]
+        part_numbers = type_parts['ChildPartNumber'].astype(str)
+        tables.append(RecordTable(python_class, schema_view, {
+            'id': ('loinc:' + id_prefix + part_numbers).tolist(),
+            'label': (type_parts['ChildPart'].astype(str) + label_suffix).tolist(),
+            slot: ('loinc:' + part_numbers).tolist(),
+        }, validate=validate))
+    return tables
+
+
+class ComposedClasses(object):
+    """
+    Composed classes
+    Builds the composed class ontology from the part files and the hand-written composed classes
+    """
+    def __init__(self, schema_path: str, composed_classes_data_file: str = None, part_file_directory_path: str = None,
+                 cache_directory: str = None, validate: str = 'sample'):
+        """
+        :param schema_path: str to the grouping classes LinkML schema
+        :param composed_classes_data_file: str to the hand-written composed classes YAML file, or None
+        :param part_file_directory_path: str to the part hierarchy files, see part_ingest.PartOntology, or None to
+        build only the hand-written classes
+        :param cache_directory: str to the release table cache, or None
+        :param validate: 'none', 'sample' or 'full' schema validation of the composed classes
+        """
+        print(f"Beginning Composed Class Ingest at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self.sv = load_schema_view(schema_path)
+        self.owl_writer = StreamingOWLWriter(self.sv)
+        self.validate = validate
+        self.composed_classes = []
+        if composed_classes_data_file:
+            self.composed_classes = load_composed_classes_data(composed_classes_data_file, self.sv)
+            validate_records(self.composed_classes, validate)
+        if part_file_directory_path:
+            self.add_part_classes(load_part_files(part_file_directory_path, cache_directory))
+
+    def add_part_classes(self, parts_df):
+        """
+        Add the generated composed class of every COMPONENT and SYSTEM part, except those with a hand-written class
+        :param parts_df: Pandas Dataframe of part file rows
+        """
+        ids = {str(record.id) for record in self.composed_classes}
+        n_classes = len(self.composed_classes)
+        with step('class_construction') as metrics:
+            for table in composed_part_classes(parts_df, self.sv, self.validate):
+                self.composed_classes.extend(record for record in table if record.id not in ids)
+            metrics.count(classes=len(self.composed_classes) - n_classes)
+        print(f"Generated {len(self.composed_classes) - n_classes} composed classes from the part files")
+
+    def write_to_output(self, output_path):
+        """
+        Stream the composed classes to the output path as OWL functional syntax
+        :param output_path: str
+        """
+        print(f"Writing {len(self.composed_classes)} composed classes to output {output_path}")
+        with step('owl_dump', file=os.path.basename(output_path)) as metrics:
+            self.owl_writer.write(self.composed_classes, output_path)
+            metrics.count(classes=len(self.composed_classes))
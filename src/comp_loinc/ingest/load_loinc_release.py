@@ -1,36 +1,100 @@
-import subprocess
+"""Load LOINC release
+
+Copies the release files CompLOINC uses out of the LOINC release zip, reading only those members of the archive
+instead of extracting all of it. Each member is streamed in chunks to a temporary file next to its destination and
+moved into place once complete.
+
+# Example
+LoadLoincRelease('./data/loinc_release', cache_directory='./data/cache')
+"""
 import os
+import re
 import shutil
+import zipfile
 from pathlib import Path
 from os.path import dirname
 
+from comp_loinc.ingest.table_cache import load_release_table
+from comp_loinc.ingest.release_tables import LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS, \
+    LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS, LOINC_MEMBER, LPL_MEMBER, find_zip_member
+
 
 PROJECT_DIR = Path(dirname(dirname(dirname(dirname(__file__)))))
 SRC_DIR = os.path.join(PROJECT_DIR, 'src')
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
 
+# Release zip member path suffix, the file name it is copied to, and how it is parsed into the table cache
+CODE_FILE_MEMBERS = [
+    (LOINC_MEMBER, 'Loinc.csv', LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS),
+    (LPL_MEMBER, 'LoincPartLink_Primary.csv', LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS),
+]
+COPY_CHUNK_SIZE = 1 << 20
+
 
 class LoadLoincRelease(object):
-    def __init__(self, filepath):
+    def __init__(self, filepath, code_directory=None, part_directory=None, part_members=(), cache_directory=None,
+                 release=None):
+        """
+        :param filepath: str to the directory holding the release zip, or zips when release is given
+        :param code_directory: str where the code files are copied, defaults to data/code_files
+        :param part_directory: str where part hierarchy files are copied, defaults to data/part_files
+        :param part_members: path suffixes of part hierarchy files in the zip to copy, none by default
+        :param cache_directory: str to the release table cache; when given, the code files are parsed into it
+        :param release: optional str LOINC release version, e.g. '2.74', to pick the zip whose name has that version
+        """
         self.filepath = filepath
-        self.unzip_loinc_release()
-        self.move_files()
+        self.code_directory = code_directory or f"{DATA_DIR}/code_files"
+        self.part_directory = part_directory or f"{DATA_DIR}/part_files"
+        self.part_members = part_members
+        self.cache_directory = cache_directory
+        self.release = release
+        self.extract_release_files()
 
     def get_release_filename(self):
         release_files = [x for x in os.listdir(self.filepath) if x.endswith('.zip')]
+        if self.release:
+            # the version as a whole number, so that 2.7 does not match Loinc_2.74.zip
+            version = re.compile(rf"(?<![\d.]){re.escape(self.release)}(?!\d|\.\d)")
+            release_files = [x for x in release_files if version.search(x)]
+            if len(release_files) != 1:
+                raise Exception(f'Expected one release zip for LOINC {self.release} in {self.filepath}, found '
+                                f'{len(release_files)}.')
         if len(release_files) == 1 and release_files[0].endswith('.zip'):
             return release_files.pop()
         else:
             raise Exception('More than one file in release directory.')
 
-    def unzip_loinc_release(self):
-        filename = self.get_release_filename()
-        subprocess.call(['unzip', "-o", f"{self.filepath}/{filename}", '-d', f"{self.filepath}/extracted"])
-
-    def move_files(self):
-        filename = self.get_release_filename()
-        extracted_files = f"{self.filepath}/extracted/{filename.replace('.zip', '')}"
-        lpl = f"{extracted_files}/AccessoryFiles/PartFile/LoincPartLink_Primary.csv"
-        shutil.move(lpl, f"{DATA_DIR}/code_files/LoincPartLink_Primary.csv")
-        loinc_csv = f"{extracted_files}/LoincTable/Loinc.csv"
-        shutil.move(loinc_csv, f"{DATA_DIR}/code_files/Loinc.csv")
+    @staticmethod
+    def copy_member(release_zip, member, output_path):
+        """
+        Stream one zip member to output_path
+        :param release_zip: zipfile.ZipFile
+        :param member: zipfile.ZipInfo
+        :param output_path: str
+        """
+        Path(dirname(output_path)).mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with release_zip.open(member) as source, open(tmp_path, 'wb') as output:
+            shutil.copyfileobj(source, output, COPY_CHUNK_SIZE)
+        os.replace(tmp_path, output_path)
+
+    def extract_release_files(self):
+        """
+        Copy the code files, and the requested part hierarchy files, out of the release zip
+        :return: list of str paths written
+        """
+        written = []
+        with zipfile.ZipFile(f"{self.filepath}/{self.get_release_filename()}") as release_zip:
+            for suffix, file_name, columns, categorical_columns in CODE_FILE_MEMBERS:
+                output_path = f"{self.code_directory}/{file_name}"
+                self.copy_member(release_zip, find_zip_member(release_zip, suffix), output_path)
+                written.append(output_path)
+                if self.cache_directory:
+                    load_release_table(output_path, columns, categorical_columns,
+                                       cache_directory=self.cache_directory)
+            for suffix in self.part_members:
+                output_path = f"{self.part_directory}/{os.path.basename(suffix)}"
+                self.copy_member(release_zip, find_zip_member(release_zip, suffix), output_path)
+                written.append(output_path)
+        print(f"Copied {len(written)} release files: {', '.join(written)}")
+        return written
@@ -0,0 +1,198 @@
+"""Streaming OWL writer
+
+Writes LinkML class instances as OWL functional syntax (OFN), one instance at a time, instead of building the whole
+ontology in memory with `OWLDumper.dumps`. The axioms for each LinkML class are compiled once from the schema's `owl`
+slot annotations, using the same interpretation rules as linkml-owl's OWLDumper, and the output is identical to
+`OWLDumper.dumps` for the slot interpretations used by the CompLOINC schemas (AnnotationAssertion, SubClassOf,
+EquivalentClasses and ObjectSomeValuesFrom).
+
+# Example
+writer = StreamingOWLWriter(SchemaView('./src/comp_loinc/schema/part_schema.yaml'))
+writer.write(part_classes, './data/output/owl_component_files/part_ontology.owl')
+"""
+import dataclasses
+import os
+
+from funowl import Literal
+from funowl.writers.FunctionalWriter import FunctionalWriter
+from linkml_owl.dumpers.owl_dumper import OWLDumper
+from linkml_runtime import SchemaView
+from linkml_runtime.linkml_model.types import Uri, Uriorcurie
+from rdflib import URIRef
+
+from comp_loinc.progress import track
+
+SUPPORTED_INTERPRETATIONS = {'AnnotationAssertion', 'SubClassOf', 'EquivalentClasses', 'ObjectSomeValuesFrom'}
+# Literals containing these are rendered through funowl to reproduce its escaping exactly
+LITERAL_SPECIAL_CHARS = ('"', '\\', '\n', '\r')
+
+
+class StreamingOWLWriter(object):
+    """
+    Streaming OWL functional syntax writer for LinkML class instances
+    """
+    def __init__(self, schema_view: SchemaView):
+        self.sv = schema_view
+        self.dumper = OWLDumper(schema=self.sv.schema, schemaview=self.sv)
+        doc = self.dumper.to_ontology_document([], self.sv.schema)
+        self.dumper.schemaview = self.sv
+        writer = FunctionalWriter()
+        document = doc.to_functional(writer).getvalue()
+        self.prefix_header = document[:document.rindex('Ontology(')]
+        self.namespace_manager = writer.g.namespace_manager
+        self.ontology_iri = doc.ontology.iri.to_functional(FunctionalWriter(g=writer.g)).getvalue()
+        self.namespaces = dict(self.sv.namespaces())
+        self.class_templates = {}
+
+    def write(self, instances, output_path):
+        """
+        Write instances to output_path as an OWL functional syntax ontology
+        :param instances: iterable of LinkML class instances or records
+        :param output_path: str
+        :return: int number of axioms written
+        """
+        with open(output_path, 'w') as output:
+            return self.write_stream(track(instances, f"Writing {os.path.basename(output_path)}", unit='classes'),
+                                     output)
+
+    def write_stream(self, instances, output):
+        """
+        Write instances to an open text file handle, one instance's axioms at a time
+        :param instances: iterable of LinkML class instances
+        :param output: text file handle
+        :return: int number of axioms written
+        """
+        n_axioms = 0
+        output.write(f"{self.prefix_header}Ontology( {self.ontology_iri}")
+        for instance in instances:
+            for axiom in self.axioms(instance):
+                output.write(f"\n    {axiom}")
+                n_axioms += 1
+        output.write("\n)" if n_axioms else " )")
+        return n_axioms
+
+    def axioms(self, instance):
+        """
+        OWL functional syntax axioms for one instance
+        :param instance: LinkML class instance, or a record of one (see comp_loinc.ingest.records)
+        :return: list of str
+        """
+        # records carry the LinkML dataclass they stand in for
+        identifier, slot_templates = self.class_template(getattr(instance, 'linkml_class', None) or type(instance))
+        subject = self.iri(self.expand(getattr(instance, identifier)))
+        axioms = []
+        for field_name, render in slot_templates:
+            values = getattr(instance, field_name)
+            if values is None:
+                continue
+            for value in values if isinstance(values, list) else [values]:
+                if value is not None:
+                    axioms.append(render(subject, value))
+        return axioms
+
+    def class_template(self, python_class):
+        """
+        Compile, once per LinkML class, the identifier field and an axiom renderer for each slot that generates axioms
+        :param python_class: generated LinkML dataclass
+        :return: tuple of identifier field name, list of (field name, render function)
+        """
+        if python_class in self.class_templates:
+            return self.class_templates[python_class]
+        class_name = python_class.class_name
+        cls = self.sv.schema.classes[class_name]
+        class_annotations = [
+            self.dumper._get_inferred_class_annotations(cls, key) for key in ['owl.template', 'owl.fstring']
+        ]
+        if self.dumper._get_class_interpretations(cls) or any(class_annotations):
+            raise ValueError(f"Class level OWL annotations on {class_name} are not supported by StreamingOWLWriter")
+        identifier = None
+        slot_templates = []
+        for field_name in [field.name for field in dataclasses.fields(python_class)]:
+            slot = self.dumper._lookup_slot(cls, field_name)
+            if slot is None:
+                raise ValueError(f"Lookup slot in {class_name} failed for {field_name}")
+            if slot.identifier:
+                identifier = field_name
+                continue
+            render = self.slot_renderer(slot, class_name)
+            if render is not None:
+                slot_templates.append((field_name, render))
+        if identifier is None:
+            raise ValueError(f"{class_name} has no identifier slot")
+        self.class_templates[python_class] = (identifier, slot_templates)
+        return self.class_templates[python_class]
+
+    def slot_renderer(self, slot, class_name):
+        """
+        Axiom render function for one slot, following OWLDumper.transform for the supported interpretations
+        :return: function of (subject, value) to str, or None if the slot generates no axioms
+        """
+        if 'owl.ignore' in slot.annotations:
+            return None
+        for ann_key in ['owl.template', 'owl.fstring', 'boolean_form_of', 'owl.axiom_annotation.slots']:
+            if self.dumper._get_inferred_slot_annotations(slot, ann_key, class_name):
+                raise ValueError(f"{ann_key} on {class_name}.{slot.name} is not supported by StreamingOWLWriter")
+        interpretations = self.dumper._get_slot_interpretations(slot, class_name)
+        unsupported = interpretations - SUPPORTED_INTERPRETATIONS
+        if unsupported:
+            raise ValueError(f"{unsupported} on {class_name}.{slot.name} is not supported by StreamingOWLWriter")
+        if not interpretations:
+            return None
+        schema_level_slot = self.dumper._get_schema_level_slot(slot)
+        if schema_level_slot.slot_uri is not None:
+            slot_uri = self.dumper._get_IRI_str(schema_level_slot.slot_uri)
+        else:
+            slot_uri = self.dumper._get_IRI_str(self.sv.get_uri(slot.name))
+        predicate = self.iri(slot_uri)
+        is_object_ref = slot.range in self.sv.schema.classes
+
+        def value_term(value):
+            if is_object_ref or isinstance(value, (Uriorcurie, Uri)):
+                return self.iri(self.expand(value))
+            return self.literal(value)
+
+        # class expression fillers are always IRIs; funowl coerces CURIE strings to classes.
+        # The layouts below are funowl's: EquivalentClasses puts each operand on its own line, and a nested
+        # expression in SubClassOf is joined to the subject with the indent.
+        if 'EquivalentClasses' in interpretations:
+            if 'ObjectSomeValuesFrom' in interpretations:
+                return lambda s, v: f"EquivalentClasses(\n        {s}\n            " \
+                                    f"ObjectSomeValuesFrom( {predicate} {self.iri(self.expand(v))} )\n    )"
+            return lambda s, v: f"EquivalentClasses(\n        {s}\n        {self.iri(self.expand(v))}\n    )"
+        if 'ObjectSomeValuesFrom' in interpretations:
+            return lambda s, v: \
+                f"SubClassOf( {s}     ObjectSomeValuesFrom( {predicate} {self.iri(self.expand(v))} ) )"
+        if 'AnnotationAssertion' in interpretations:
+            return lambda s, v: f"AnnotationAssertion( {predicate} {s} {value_term(v)} )"
+        return lambda s, v: f"SubClassOf( {s} {self.iri(self.expand(v))} )"
+
+    def expand(self, curie):
+        """
+        Expand a CURIE with the schema prefixes, as OWLDumper._get_IRI_str does
+        :param curie: str
+        :return: str IRI
+        """
+        curie = str(curie)
+        prefix, sep, local_id = curie.partition(':')
+        if sep and prefix in self.namespaces:
+            return f"{self.namespaces[prefix]}{local_id}"
+        return self.dumper._get_IRI_str(curie)
+
+    def iri(self, uri):
+        """
+        Render an IRI the way funowl does, as a prefixed name where possible
+        :param uri: str
+        :return: str
+        """
+        return URIRef(uri).n3(self.namespace_manager)
+
+    def literal(self, value):
+        """
+        Render a literal the way funowl does
+        :param value: literal value
+        :return: str
+        """
+        if isinstance(value, str) and not value.startswith("'") \
+                and not any(char in value for char in LITERAL_SPECIAL_CHARS):
+            return f'"{value}"'
+        return Literal(value).to_functional(FunctionalWriter(g=self.namespace_manager.graph)).getvalue()
@@ -7,13 +7,19 @@
 # # po.write_to_output('./local_data/part_ontology_files/part_ontology.owl')
 """
 
-from comp_loinc.ingest.source_data_utils import loincify, counter
+from comp_loinc.ingest.source_data_utils import loincify
+from comp_loinc.metrics import step
+from comp_loinc.progress import track
+from comp_loinc.ingest.table_cache import CACHE_AVAILABLE, cache_path, load_release_table, write_table_snapshot
+from comp_loinc.ingest.owl_writer import StreamingOWLWriter
+from comp_loinc.ingest.records import load_schema_view, record_type, validate_records
+from comp_loinc.ingest.release_tables import PART_COLUMNS, PART_CATEGORICAL_COLUMNS
 from comp_loinc.datamodel import ComponentClass, SystemClass, ScaleClass, TimeClass, MethodClass, PropertyClass
 
+import numpy as np
 import pandas as pd
-from linkml_owl.dumpers.owl_dumper import OWLDumper
-from linkml_runtime import SchemaView
 import os
+import zipfile
 from pathlib import Path
 import sys
 import datetime
@@ -21,77 +27,165 @@ import datetime
 path_root = Path(__file__).parents[2]
 sys.path.append(str(path_root))
 
+PART_TYPE_CLASSES = {
+    "TIME": TimeClass,
+    "METHOD": MethodClass,
+    "COMPONENT": ComponentClass,
+    # Some components are of part type CLASS (I thought this was only for abstract classes)
+    "CLASS": ComponentClass,
+    "PROPERTY": PropertyClass,
+    "SYSTEM": SystemClass,
+    "SCALE": ScaleClass
+}
+
+
+def build_part_params(parts_df):
+    """
+    Build the params of each part in parts_df, for all parts at once. The label and part type of a part come from its
+    first row; its parents are the distinct ParentPartNumbers of its rows in order of appearance, without the part
+    itself, or owl:Thing if there are none. Empty values are rendered as 'nan'.
+    :param parts_df: Pandas Dataframe of part file rows
+    :return: list of params dicts, in ChildPartNumber order
+    """
+    parts_df = parts_df.dropna(subset=['ChildPartNumber']).sort_values('ChildPartNumber', kind='stable')
+    first_rows = parts_df.drop_duplicates(subset='ChildPartNumber', keep='first')
+    part_numbers = first_rows['ChildPartNumber'].to_numpy(dtype=object)
+
+    parents = parts_df[['ChildPartNumber', 'ParentPartNumber']].drop_duplicates()
+    parent_numbers = parents['ParentPartNumber'].astype(str)
+    parents = parents[(parent_numbers != parents['ChildPartNumber']).to_numpy()]
+    parent_children = parents['ChildPartNumber'].to_numpy(dtype=object)
+    parent_ids = ('loinc:' + parents['ParentPartNumber'].astype(str)).tolist()
+    starts = np.searchsorted(parent_children, part_numbers, side='left')
+    ends = np.searchsorted(parent_children, part_numbers, side='right')
+
+    return [
+        {
+            "id": loincify(part_number),
+            "part_number": part_number,
+            "label": label,
+            "part_type": part_type,
+            # if the part has a parent part, add it to the subClassOf list
+            "subClassOf": parent_ids[start:end] if end > start else "owl:Thing"
+        }
+        for part_number, label, part_type, start, end in zip(
+            part_numbers, first_rows['ChildPart'].tolist(), first_rows['ChildPartTypeName'].astype(object).tolist(),
+            starts, ends)
+    ]
+
+
+def part_file_sources(part_file_directory_path):
+    """
+    Part hierarchy files are the files, or zip members, whose names end in `.tsv` in any case
+    :param part_file_directory_path: str to the directory of part hierarchy TSV files, or to a zip of them
+    :return: list of tuples of the path and the zip member, or None, of each part hierarchy file
+    :raises FileNotFoundError: if there are no part hierarchy files
+    """
+    if zipfile.is_zipfile(part_file_directory_path):
+        with zipfile.ZipFile(part_file_directory_path) as part_zip:
+            sources = [(part_file_directory_path, name) for name in part_zip.namelist()
+                       if name.lower().endswith('.tsv')]
+    else:
+        sources = [(f'{part_file_directory_path}/{part_file}', None)
+                   for part_file in os.listdir(part_file_directory_path) if part_file.lower().endswith('.tsv')]
+    if not sources:
+        raise FileNotFoundError(f"No part hierarchy files (.tsv) found in {part_file_directory_path}")
+    return sources
+
+
+def load_part_files(part_file_directory_path, cache_directory=None, chunk_size=None):
+    """
+    Read the part hierarchy TSV files, keeping only PART_COLUMNS, into one dataframe
+    :param part_file_directory_path: str to the directory of part hierarchy TSV files, or to a zip of them
+    :param cache_directory: str to the release table cache, or None
+    :param chunk_size: int number of rows parsed at a time, or None to parse each file at once
+    :return: Pandas Dataframe
+    """
+    return pd.concat([
+        load_release_table(path, PART_COLUMNS, PART_CATEGORICAL_COLUMNS, sep="\t", cache_directory=cache_directory,
+                           member=member, chunk_size=chunk_size)
+        for path, member in part_file_sources(part_file_directory_path)
+    ])
+
 
 class PartOntology(object):
     """
     Part Ontology
     Builds the part ontology from the part files
     """
-    def __init__(self, schema_path: str, part_file_directory_path: str):
+    def __init__(self, schema_path: str, part_file_directory_path: str, cache_directory: str = None,
+                 validate: str = 'sample', chunk_size: int = None, parts_df=None):
+        """
+        :param schema_path: str to the part LinkML schema
+        :param part_file_directory_path: str to the directory of part hierarchy TSV files, or to a zip of them, whose
+        `.tsv` members are read without extracting them; see part_file_sources
+        :param cache_directory: str to the release table cache, or None
+        :param validate: 'none', 'sample' or 'full' schema validation of the part classes, see records.validate_records
+        :param chunk_size: int number of rows parsed at a time, or None to parse each file at once
+        :param parts_df: optional Dataframe of part file rows, as from load_part_files, to build from instead of reading
+        the part files
+        """
         print(f"Beginning Part Ingest at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        self.sv = SchemaView(schema_path) # '../model/schema/part_schema.yaml'
-        self.od = OWLDumper()
+        self.sv = load_schema_view(schema_path) # '../model/schema/part_schema.yaml'
+        self.owl_writer = StreamingOWLWriter(self.sv)
         self.part_classes = []
         self.part_file_directory_path = part_file_directory_path
-        self.all_parts_df = self.load_part_files()
+        self.cache_directory = cache_directory
+        self.validate = validate
+        self.chunk_size = chunk_size
+        self.all_parts_df = self.load_part_files() if parts_df is None else parts_df
 
     def load_part_files(self):
-        part_file_dfs = []
-        for part_file in os.listdir(self.part_file_directory_path):
-            part_file_dfs.append(pd.read_csv(f'{self.part_file_directory_path}/{part_file}', sep="\t"))
-        return pd.concat(part_file_dfs)
+        """
+        Read the part hierarchy TSV files, keeping only PART_COLUMNS, into one dataframe
+        :return: Pandas Dataframe
+        """
+        return load_part_files(self.part_file_directory_path, self.cache_directory, self.chunk_size)
 
-    def generate_ontology(self):
+    def generate_ontology(self, part_numbers=None):
         """
         Iterate through the part files and generate the part ontology
+        :param part_numbers: optional collection of part numbers; only those parts are built
         :return:
         """
-        part_groups = self.all_parts_df.groupby("ChildPartNumber")[['ChildPart', "ChildPartTypeName", "ParentPartNumber"]]
-        for i, pg in enumerate(part_groups):
-            counter(i+1, len(part_groups))
-            params = {
-                "id": loincify(pg[0]),
-                "part_number": pg[0]
-            }
-            part_attributes = pg[1].reset_index()
-            params['label'] = part_attributes["ChildPart"].unique()[0]
-            params['part_type'] = part_attributes["ChildPartTypeName"].unique()[0]
-            # if the part has a parent part, add it to the subClassOf list
-            parent_part_numbers = [
-                loincify(x) for x in part_attributes['ParentPartNumber'].unique() if loincify(x) != params['id']
-            ]
-            if len(parent_part_numbers):
-                params['subClassOf'] = parent_part_numbers
-            else:
-                params['subClassOf'] = "owl:Thing"
-            part = None
+        parts_df = self.all_parts_df
+        if part_numbers is not None:
+            parts_df = parts_df[parts_df['ChildPartNumber'].isin(list(part_numbers)).to_numpy()]
+        with step('class_construction') as metrics:
+            part_params = build_part_params(parts_df)
             # choose the proper data model class based on the part type
             # Currently, the only specific part types ingested are: TIME, METHOD, COMPONENT, PROPERTY, SYSTEM, SCALE
-            match params['part_type']:
-                case "TIME":
-                    part = TimeClass(**params)
-                case "METHOD":
-                    part = MethodClass(**params)
-                case "COMPONENT":
-                    part = ComponentClass(**params)
-                case "CLASS":
-                    # Some components are of part type CLASS (I thought this was only for abstract classes)
-                    part = ComponentClass(**params)
-                case "PROPERTY":
-                    part = PropertyClass(**params)
-                case "SYSTEM":
-                    part = SystemClass(**params)
-                case "SCALE":
-                    part = ScaleClass(**params)
-            if part:
-                self.part_classes.append(part)
+            # Parts are built as slotted records of that class, see comp_loinc.ingest.records
+            for params in track(part_params, 'Building part classes', unit='parts'):
+                part_class = PART_TYPE_CLASSES.get(params['part_type'])
+                if part_class:
+                    self.part_classes.append(record_type(part_class, self.sv)(**params))
+            validate_records(self.part_classes, self.validate)
+            metrics.count(parts=len(part_params), classes=len(self.part_classes))
 
     def write_to_output(self, output_path):
         """
-        Use the OWLDumper to write the ontology to the output path
+        Stream the part classes to the output path as OWL functional syntax
         :param output_path: str
         """
         print("\n" + f"Writing Part Ontology to output {output_path}")
-        with open(output_path, 'w') as ccl_owl:  # ./data/output/owl_component_files/part_ontology.owl
-            ccl_owl.write(self.od.dumps(self.part_classes, schema=self.sv.schema,))
+        with step('owl_dump', file=os.path.basename(output_path)) as metrics:
+            self.owl_writer.write(self.part_classes, output_path)
+            metrics.count(classes=len(self.part_classes))
         print("\n" + f"Finished writing Part Ontology to output {output_path} at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def write_table_snapshot(self, output_path):
+        """
+        Record the cache entries of the part files that output_path was built from, so that the `delta` command can
+        update it to a later release. Nothing is recorded without the table cache.
+        :param output_path: str to the part ontology
+        """
+        if self.cache_directory is None or not CACHE_AVAILABLE:
+            return
+        tables = {
+            member or os.path.basename(path): (
+                cache_path(self.cache_directory, path, PART_COLUMNS, PART_CATEGORICAL_COLUMNS, sep="\t", member=member),
+                PART_CATEGORICAL_COLUMNS)
+            for path, member in part_file_sources(self.part_file_directory_path)
+        }
+        write_table_snapshot(self.cache_directory, output_path, tables)
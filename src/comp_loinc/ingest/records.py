@@ -0,0 +1,200 @@
+"""Bulk LinkML records
+
+Lightweight stand-ins for the generated LinkML dataclasses in `comp_loinc.datamodel`, for the bulk code and part paths.
+Building a dataclass instance runs its `__post_init__` (type checks, URIorCURIE wrapping, YAMLRoot machinery) for
+every object; the records here only hold the slot values, with the value coercion that `__post_init__` would do applied
+once per column (RecordTable) or with a cheap per-field check (record_type). Schema validation by the real dataclasses
+runs on a sample of rows, or on every row with validate='full', and full dataclass instances are only built when
+asked for with `to_linkml`/`RecordTable.to_dataclasses`.
+
+The StreamingOWLWriter accepts records wherever it accepts dataclass instances.
+
+# Example
+table = RecordTable(LoincCodeClass, SchemaView('./src/comp_loinc/schema/code_schema.yaml'), {
+    'id': ['loinc:1-8'], 'subClassOf': ['loinc:lc0000001'], 'loinc_number': ['1-8']})
+code_classes = table.to_dataclasses()
+"""
+import dataclasses
+from functools import lru_cache
+
+from linkml_runtime import SchemaView
+from linkml_runtime.utils.formatutils import underscore
+
+VALIDATION_MODES = ('none', 'sample', 'full')
+
+_record_types = {}
+
+
+class LinkMLRecord(object):
+    """
+    Base class for slotted records. Subclasses are created by record_type, one per LinkML class.
+    """
+    __slots__ = ()
+    linkml_class = None
+    fields = ()
+    multivalued = frozenset()
+    required = frozenset()
+
+    def __init__(self, **params):
+        for field in self.fields:
+            setattr(self, field, None)
+        for field, value in params.items():
+            if field not in self.multivalued:
+                value = coerce_value(value)
+            elif value is not None:
+                value = [coerce_value(x) for x in value] if isinstance(value, list) else [coerce_value(value)]
+            setattr(self, field, value)
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Build a record from already coerced values in `fields` order
+        :param values: sequence of slot values
+        :return: record
+        """
+        record = cls.__new__(cls)
+        for field, value in zip(cls.fields, values):
+            setattr(record, field, value)
+        return record
+
+    def items(self):
+        """
+        :return: list of (field, value) tuples for the slots that are set
+        """
+        return [(field, getattr(self, field)) for field in self.fields if getattr(self, field) is not None]
+
+    def to_linkml(self):
+        """
+        Build the full LinkML dataclass instance for this record
+        :return: instance of linkml_class
+        """
+        return self.linkml_class(**dict(self.items()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.items() == other.items()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+
+def coerce_value(value):
+    """
+    Coerce a slot value the way the generated __post_init__ does for the string and URIorCURIE valued slots used by
+    CompLOINC: values other than None and str are converted with str(), so NaN becomes 'nan'.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+@lru_cache(maxsize=None)
+def load_schema_view(schema_path):
+    """
+    SchemaView of a schema file, loaded once per process and shared by the ingests that use the schema
+    :param schema_path: str
+    :return: SchemaView
+    """
+    return SchemaView(schema_path)
+
+
+def record_type(python_class, schema_view: SchemaView):
+    """
+    Slotted record class for a LinkML dataclass, created once per class
+    :param python_class: generated LinkML dataclass, e.g. LoincCodeClass
+    :param schema_view: SchemaView of a schema that defines the class
+    :return: LinkMLRecord subclass
+    """
+    if python_class in _record_types:
+        return _record_types[python_class]
+    fields = tuple(field.name for field in dataclasses.fields(python_class))
+    slots = {underscore(slot.name): slot for slot in schema_view.class_induced_slots(python_class.class_name)}
+    missing = [field for field in fields if field not in slots]
+    if missing:
+        raise ValueError(f"Fields {missing} of {python_class.__name__} are not slots of {python_class.class_name}")
+    record_class = type(f"{python_class.__name__}Record", (LinkMLRecord,), {
+        '__slots__': fields,
+        'linkml_class': python_class,
+        'fields': fields,
+        'multivalued': frozenset(field for field in fields if slots[field].multivalued),
+        'required': frozenset(field for field in fields if slots[field].required or slots[field].identifier),
+    })
+    _record_types[python_class] = record_class
+    return record_class
+
+
+def validate_records(records, mode='sample', sample_size=100):
+    """
+    Validate records by building their LinkML dataclass instances, which raise on invalid values
+    :param records: sequence of records
+    :param mode: 'none', 'sample' (sample_size evenly spaced records) or 'full'
+    :param sample_size: int
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Validation mode must be one of {VALIDATION_MODES}, not {mode}")
+    if mode == 'none' or not len(records):
+        return
+    step = 1 if mode == 'full' else max(1, len(records) // sample_size)
+    for i in range(0, len(records), step):
+        records[i].to_linkml()
+
+
+class RecordTable(object):
+    """
+    Column-oriented records of one LinkML class. Columns are checked against the schema and coerced once each;
+    iterating the table yields slotted records.
+    """
+    def __init__(self, python_class, schema_view: SchemaView, columns, validate='sample', sample_size=100):
+        """
+        :param python_class: generated LinkML dataclass, e.g. LoincCodeClass
+        :param schema_view: SchemaView of a schema that defines the class
+        :param columns: dict of field name to a sequence of values, or to a single value shared by every row
+        :param validate: 'none', 'sample' or 'full', see validate_records
+        :param sample_size: int
+        """
+        self.record_class = record_type(python_class, schema_view)
+        unknown = set(columns) - set(self.record_class.fields)
+        if unknown:
+            raise ValueError(f"{sorted(unknown)} are not slots of {python_class.class_name}")
+        missing = self.record_class.required - set(columns)
+        if missing:
+            raise ValueError(f"Required slots {sorted(missing)} of {python_class.class_name} have no column")
+        lengths = {len(values) for values in columns.values() if isinstance(values, (list, tuple)) or
+                   hasattr(values, '__array__')}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns of {python_class.class_name} have different lengths {sorted(lengths)}")
+        self.length = lengths.pop() if lengths else 0
+        self.columns = [self.coerce_column(field, columns.get(field)) for field in self.record_class.fields]
+        validate_records(self, validate, sample_size)
+
+    def coerce_column(self, field, values):
+        """
+        Coerce one column, see coerce_value; scalar values of multivalued slots are wrapped in a list
+        :return: list of values
+        """
+        if values is None or isinstance(values, str):
+            values = [values] * self.length
+        if field not in self.record_class.multivalued:
+            return [coerce_value(value) for value in values]
+        return [
+            None if value is None else
+            [coerce_value(x) for x in value] if isinstance(value, list) else [coerce_value(value)]
+            for value in values
+        ]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.record_class.from_values([column[i] for column in self.columns])
+
+    def __iter__(self):
+        from_values = self.record_class.from_values
+        for values in zip(*self.columns):
+            yield from_values(values)
+
+    def to_dataclasses(self):
+        """
+        Build the full LinkML dataclass instance for every row
+        :return: list
+        """
+        return [record.to_linkml() for record in self]
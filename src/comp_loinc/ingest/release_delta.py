@@ -0,0 +1,193 @@
+"""Release delta
+
+Updates the code or part ontology built from a previous LOINC release to a new release by rebuilding only the classes
+that may have changed. The previous release's tables are not read from its release files but from the release table
+cache, through the table snapshot written when the ontology was built (see table_cache.write_table_snapshot). The
+new release's tables are compared with them to select candidate classes:
+
+- codes: included codes whose VersionLastChanged or CHNG_TYPE differ, that were added to or removed from Loinc.csv, or
+  whose LoincPartLink_Primary.csv rows differ, and codes added to or removed from the included codes. LOINC updates
+  VersionLastChanged whenever a term changes, so the other Loinc.csv columns are not compared.
+- parts: parts whose rows in the part hierarchy files differ.
+
+Records are built for the candidates only, in both releases, and compared to find the classes that were added,
+changed, deprecated or removed. Axioms of changed classes are replaced where they stand in the previous OWL file, axioms
+of added classes are appended, and the rest of the file is copied line by line without being rendered again.
+
+A change report lists each changed class with the slots that changed; for codes it also has the CHNG_TYPE and
+VersionLastChanged of the new release.
+
+# Example
+previous_tables, snapshot = load_table_snapshot('./data/cache', code_owl)
+tables = load_code_tables('./data/code_files', './data/cache')
+included_codes = read_included_codes('./data/code_files')
+codes = candidate_codes(previous_tables, tables, snapshot['included_codes'], included_codes)
+previous = CodeIngest(schema, None, tables=previous_tables, included_codes=snapshot['included_codes'], codes=codes)
+current = CodeIngest(schema, './data/code_files', tables=tables, included_codes=included_codes, codes=codes)
+delta = ReleaseDelta(previous.code_classes, current.code_classes)
+delta.patch_owl(current.owl_writer, code_owl)
+delta.change_report(current.code_dataframe).to_csv('./data/output/code_changes.tsv', sep="\t", index=False)
+"""
+import os
+
+import pandas as pd
+
+from comp_loinc.ingest.release_tables import LOINC_CHANGE_COLUMNS, LPL_COLUMNS, PART_COLUMNS
+
+CHANGE_TYPES = ('added', 'changed', 'deprecated', 'removed')
+REPORT_COLUMNS = ['id', 'change', 'changed_slots', 'CHNG_TYPE', 'VersionLastChanged']
+
+
+def changed_keys(previous, current, key, columns):
+    """
+    Keys of the rows that are in only one of two tables, comparing the given columns
+    :param previous: Pandas Dataframe
+    :param current: Pandas Dataframe
+    :param key: str column the keys are taken from
+    :param columns: list of the compared columns, including key
+    :return: set
+    """
+    rows = pd.concat([previous[columns].astype(object).drop_duplicates(),
+                      current[columns].astype(object).drop_duplicates()], ignore_index=True)
+    return set(rows.loc[~rows.duplicated(keep=False), key])
+
+
+def candidate_codes(previous_tables, tables, previous_included_codes, included_codes):
+    """
+    Codes whose class may differ between two releases, see the module docstring
+    :param previous_tables: dict of file name to Dataframe of the previous release, see code_ingest.load_code_tables
+    :param tables: dict of file name to Dataframe of the new release
+    :param previous_included_codes: list of the LOINC numbers the previous ontology was built for
+    :param included_codes: list of the LOINC numbers to build for the new release
+    :return: set of LOINC numbers
+    """
+    included = set(included_codes)
+    previous_included = set(previous_included_codes)
+    codes = list(included | previous_included)
+    candidates = set()
+    for file_name, key, columns in [('Loinc.csv', 'LOINC_NUM', LOINC_CHANGE_COLUMNS),
+                                    ('LoincPartLink_Primary.csv', 'LoincNumber', LPL_COLUMNS)]:
+        previous, current = previous_tables[file_name], tables[file_name]
+        candidates |= changed_keys(previous[previous[key].isin(codes).to_numpy()],
+                                   current[current[key].isin(codes).to_numpy()], key, columns)
+    return candidates | (included ^ previous_included)
+
+
+def candidate_parts(previous_parts_df, parts_df):
+    """
+    Parts whose class may differ between two releases: those with rows in only one release's part hierarchy files
+    :param previous_parts_df: Dataframe of the previous release's part file rows, see part_ingest.load_part_files
+    :param parts_df: Dataframe of the new release's part file rows
+    :return: set of part numbers
+    """
+    return changed_keys(previous_parts_df, parts_df, 'ChildPartNumber', PART_COLUMNS)
+
+
+class ReleaseDelta(object):
+    """
+    Added, changed, deprecated and removed classes between two releases, matched on their identifier
+    """
+    def __init__(self, previous_records, records):
+        """
+        :param previous_records: iterable of records built from the previous release, see comp_loinc.ingest.records;
+        only classes with a record in either release are compared and patched
+        :param records: iterable of records built from the new release, for the same candidate classes
+        """
+        self.previous = {record.id: record for record in previous_records}
+        self.current = {record.id: record for record in records}
+        self.changes = []
+        for class_id, record in self.current.items():
+            previous = self.previous.get(class_id)
+            if previous is None:
+                self.changes.append((class_id, 'added', []))
+                continue
+            changed_slots = [
+                field for field in record.fields if getattr(record, field) != getattr(previous, field)
+            ]
+            if not changed_slots:
+                continue
+            deprecated = getattr(record, 'status', None) == 'DEPRECATED' != getattr(previous, 'status', None)
+            self.changes.append((class_id, 'deprecated' if deprecated else 'changed', changed_slots))
+        self.changes += [(class_id, 'removed', []) for class_id in self.previous if class_id not in self.current]
+
+    def counts(self):
+        """
+        :return: dict of change type to number of classes
+        """
+        counts = dict.fromkeys(CHANGE_TYPES, 0)
+        for _, change, _ in self.changes:
+            counts[change] += 1
+        return counts
+
+    def patch_owl(self, owl_writer, owl_path, output_path=None):
+        """
+        Patch the OWL functional syntax file written for the previous release with the changed classes
+        :param owl_writer: StreamingOWLWriter for the classes' schema
+        :param owl_path: str to the previous release's OWL file, as written by StreamingOWLWriter
+        :param output_path: str, defaults to replacing owl_path
+        :return: int number of axioms written for added and changed classes
+        """
+        output_path = output_path or owl_path
+        replaced_axioms = {}
+        for class_id, change, _ in self.changes:
+            if change != 'added':
+                for axiom in owl_writer.axioms(self.previous[class_id]):
+                    replaced_axioms[axiom] = class_id
+        new_axioms = {
+            class_id: owl_writer.axioms(self.current[class_id])
+            for class_id, change, _ in self.changes if change != 'removed'
+        }
+        if any('\n' in axiom for axioms in new_axioms.values() for axiom in axioms) or \
+                any('\n' in axiom for axiom in replaced_axioms):
+            raise ValueError("Patching OWL files supports single line axioms only")
+
+        n_axioms = 0
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(owl_path) as previous_owl, open(tmp_path, 'w') as output:
+            for line in previous_owl:
+                axiom = line.rstrip('\n')[4:] if line.startswith('    ') else None
+                if axiom in replaced_axioms:
+                    # changed classes' new axioms take the place of the first of their previous axioms
+                    for new_axiom in new_axioms.pop(replaced_axioms[axiom], []):
+                        output.write(f"    {new_axiom}\n")
+                        n_axioms += 1
+                    continue
+                stripped = line.rstrip('\n')
+                if stripped == ')' or (stripped.startswith('Ontology(') and stripped.endswith(' )')):
+                    # the end of the ontology: append the axioms of added classes, and of changed classes whose
+                    # previous axioms were not found
+                    remaining = [new_axiom for axioms in new_axioms.values() for new_axiom in axioms]
+                    new_axioms = {}
+                    if stripped != ')' and remaining:
+                        # an ontology without axioms is written on one line, "Ontology( iri )"
+                        output.write(f"{stripped[:-2]}\n")
+                        line = ")"
+                    for new_axiom in remaining:
+                        output.write(f"    {new_axiom}\n")
+                        n_axioms += 1
+                output.write(line)
+        os.replace(tmp_path, output_path)
+        return n_axioms
+
+    def change_report(self, loinc_changes=None):
+        """
+        One row per changed class
+        :param loinc_changes: optional Dataframe of the new release's Loinc.csv indexed on LOINC_NUM, for code classes,
+        e.g. CodeIngest.code_dataframe
+        :return: Pandas Dataframe with REPORT_COLUMNS
+        """
+        rows = []
+        for class_id, change, changed_slots in self.changes:
+            record = self.current.get(class_id) or self.previous[class_id]
+            loinc_number = getattr(record, 'loinc_number', None)
+            release_change = {}
+            if loinc_changes is not None and loinc_number in loinc_changes.index:
+                release_change = loinc_changes.loc[loinc_number]
+            rows.append({
+                'id': class_id,
+                'change': change,
+                'changed_slots': ",".join(changed_slots),
+                'CHNG_TYPE': release_change.get('CHNG_TYPE'),
+                'VersionLastChanged': release_change.get('VersionLastChanged'),
+            })
+        return pd.DataFrame(rows, columns=REPORT_COLUMNS)
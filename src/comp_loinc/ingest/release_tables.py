@@ -0,0 +1,138 @@
+"""Release table loading
+
+Column-pruned loading of the LOINC release tables used by the ingest classes. Only the columns an ingest step uses are
+parsed, low-cardinality columns are stored as pandas categoricals, and the pyarrow CSV engine is used when it is
+installed.
+
+Tables can also be parsed straight from a member of the release zip, without writing the decompressed file to disk, and
+in chunks of rows, so that peak memory is bounded by the kept columns rather than by the size of the file.
+
+# Example
+loinc_df = read_release_table('./data/code_files/Loinc.csv', LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS)
+loinc_df = read_release_table('./data/loinc_release/Loinc_2.74.zip', LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS,
+                              member=LOINC_MEMBER, chunk_size=100000)
+"""
+from importlib.util import find_spec
+import os
+import zipfile
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from comp_loinc.ingest.source_data_utils import peak_rss_mb
+
+CSV_ENGINE = 'pyarrow' if find_spec('pyarrow') is not None else 'c'
+
+# Release zip member path suffixes
+LOINC_MEMBER = 'LoincTable/Loinc.csv'
+LPL_MEMBER = 'AccessoryFiles/PartFile/LoincPartLink_Primary.csv'
+
+# Loinc.csv
+LOINC_COLUMNS = [
+    'LOINC_NUM', 'COMPONENT', 'PROPERTY', 'TIME_ASPCT', 'SYSTEM', 'SCALE_TYP', 'METHOD_TYP', 'STATUS', 'SHORTNAME',
+    'LONG_COMMON_NAME', 'VersionLastChanged', 'CHNG_TYPE'
+]
+LOINC_CATEGORICAL_COLUMNS = ['PROPERTY', 'TIME_ASPCT', 'SCALE_TYP', 'STATUS', 'VersionLastChanged', 'CHNG_TYPE']
+# Loinc.csv change columns, which select the codes a release delta rebuilds
+LOINC_CHANGE_COLUMNS = ['LOINC_NUM', 'VersionLastChanged', 'CHNG_TYPE']
+
+# LoincPartLink_Primary.csv
+LPL_COLUMNS = ['LoincNumber', 'PartNumber', 'PartTypeName', 'LinkTypeName']
+LPL_CATEGORICAL_COLUMNS = ['PartTypeName', 'LinkTypeName']
+
+# Part.csv / supplementary part files
+PART_LOOKUP_COLUMNS = ['PartNumber', 'PartTypeName', 'PartName']
+PART_LOOKUP_CATEGORICAL_COLUMNS = ['PartTypeName']
+
+# Part hierarchy TSV files
+PART_COLUMNS = ['ParentPartNumber', 'ChildPartNumber', 'ChildPart', 'ChildPartTypeName']
+PART_CATEGORICAL_COLUMNS = ['ChildPartTypeName']
+
+
+def find_zip_member(release_zip, suffix):
+    """
+    Find a release file in a zip by the end of its path, whatever the release's top level directory is called
+    :param release_zip: zipfile.ZipFile
+    :param suffix: str path suffix, e.g. LOINC_MEMBER, or a full member name
+    :return: zipfile.ZipInfo
+    """
+    for info in release_zip.infolist():
+        if info.filename == suffix or info.filename.endswith(f"/{suffix}"):
+            return info
+    raise FileNotFoundError(f"{suffix} is not in the release zip {release_zip.filename}")
+
+
+def read_release_table(path, columns, categorical_columns=(), sep=",", engine=None, member=None, chunk_size=None):
+    """
+    Read the given columns of a release CSV/TSV file as strings, with categorical_columns stored as categoricals.
+    Empty values are NaN whichever CSV engine is used, matching `pd.read_csv(path, dtype=str)`.
+    :param path: str to the release file, or to a zip holding it
+    :param columns: list of column names to keep
+    :param categorical_columns: columns of `columns` to store as categoricals
+    :param sep: str field separator
+    :param engine: pandas CSV engine, defaults to CSV_ENGINE
+    :param member: path suffix of the file in the zip at path, see find_zip_member; None if path is the file itself
+    :param chunk_size: int number of rows parsed at a time, or None to parse the whole file at once. Chunked reads use
+    the c engine, as the pyarrow engine does not read in chunks.
+    :return: Pandas Dataframe
+    """
+    engine = 'c' if chunk_size else engine or CSV_ENGINE
+    rss_before = peak_rss_mb()
+    if engine == 'pyarrow':
+        # the pyarrow engine parses object and categorical columns with inferred types, e.g. VersionLastChanged as
+        # floats, and casts them afterwards, so columns are parsed as strings and converted below
+        dtype = {col: 'string[pyarrow]' for col in columns}
+    else:
+        dtype = {col: 'category' if col in categorical_columns else object for col in columns}
+
+    def parse(source):
+        if not chunk_size:
+            return pd.read_csv(source, sep=sep, usecols=columns, dtype=dtype, engine=engine)
+        with pd.read_csv(source, sep=sep, usecols=columns, dtype=dtype, engine=engine, chunksize=chunk_size) as chunks:
+            return concat_chunks(list(chunks), columns, categorical_columns)
+
+    if member:
+        with zipfile.ZipFile(path) as release_zip, release_zip.open(find_zip_member(release_zip, member)) as source:
+            df = parse(source)
+    else:
+        df = parse(path)
+    if engine == 'pyarrow':
+        for col in columns:
+            df[col] = df[col].astype(object)
+            if col in categorical_columns:
+                df[col] = df[col].astype('category')
+    df = normalize_empty_values(df, categorical_columns)
+    print(f"Loaded {os.path.basename(member or path)} ({len(df)} rows, {len(columns)} columns, {engine} engine"
+          f"{f', {chunk_size} row chunks' if chunk_size else ''}); peak RSS {rss_before} MB -> {peak_rss_mb()} MB")
+    return df[columns]
+
+
+def concat_chunks(chunks, columns, categorical_columns=()):
+    """
+    Concatenate chunks of a table, merging the categories that each chunk's categorical columns were parsed with
+    :param chunks: list of Pandas Dataframes
+    :param columns: list of column names
+    :param categorical_columns: columns of `columns` that are categoricals
+    :return: Pandas Dataframe
+    """
+    if not chunks:
+        return pd.DataFrame({col: pd.Series(dtype='category' if col in categorical_columns else object)
+                             for col in columns})
+    categoricals = {col: union_categoricals([chunk[col] for chunk in chunks]) for col in categorical_columns}
+    df = pd.concat([chunk.drop(columns=list(categorical_columns)) for chunk in chunks], ignore_index=True)
+    for col, values in categoricals.items():
+        df[col] = values
+    return df
+
+
+def normalize_empty_values(df, categorical_columns=()):
+    """
+    Use NaN for empty values in the string columns of df. The pyarrow CSV engine and Arrow files return None instead.
+    :param df: Pandas Dataframe
+    :param categorical_columns: columns to leave as they are
+    :return: Pandas Dataframe
+    """
+    for col in df.columns:
+        if col not in categorical_columns:
+            df[col] = df[col].fillna(float('nan'))
+    return df
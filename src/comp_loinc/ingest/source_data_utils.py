@@ -2,13 +2,9 @@ import pandas as pd
 import json
 from collections import defaultdict
 import os
-import sys
 
+from comp_loinc.metrics import peak_rss_mb
 
-def counter(i, total_i):
-    sys.stdout.write('\r')
-    sys.stdout.write(f"{i}/{total_i}")
-    sys.stdout.flush()
 
 def loincify(id):
     """
@@ -61,13 +57,21 @@ class PartLookups(object):
     """
     Generates  part type lookup dictionaries from the Part.csv file (too big to push to git)
     """
-    def __init__(self, part_primary_file_path, part_supplementarty_file_path):
+    def __init__(self, part_primary_file_path, part_supplementarty_file_path, cache_directory=None):
         self.part_primary_file_path = part_primary_file_path
         self.part_supplementarty_file_path = part_supplementarty_file_path
+        self.cache_directory = cache_directory
         self.part_file = self.combine_part_files_to_df()
 
     def combine_part_files_to_df(self):
-        return pd.concat([pd.read_csv(self.part_primary_file_path), pd.read_csv(self.part_supplementarty_file_path)])
+        # imported here, the table cache imports this module
+        from comp_loinc.ingest.table_cache import load_release_table
+        from comp_loinc.ingest.release_tables import PART_LOOKUP_COLUMNS, PART_LOOKUP_CATEGORICAL_COLUMNS
+        return pd.concat([
+            load_release_table(path, PART_LOOKUP_COLUMNS, PART_LOOKUP_CATEGORICAL_COLUMNS,
+                               cache_directory=self.cache_directory)
+            for path in [self.part_primary_file_path, self.part_supplementarty_file_path]
+        ])
 
     def generate_part_type_lookup(self):
         """
@@ -0,0 +1,162 @@
+"""Release table cache
+
+Persistent cache of parsed release tables. Each table read through `load_release_table` is stored as an uncompressed
+Arrow IPC file in the cache directory, keyed by the content hash of the source file (for a table read from a release
+zip, the CRC and size of its zip member), the columns read, and CACHE_SCHEMA_VERSION. A valid cache entry is read back
+with memory mapping instead of re-parsing the CSV/TSV; a missing or stale one is rebuilt. The cache needs pyarrow;
+without it tables are always parsed from the source files.
+
+A table snapshot records which cache entries an output was built from, in `snapshots/` in the cache directory, so that
+the `delta` command can compare a new release with the release of an existing output without its release files.
+
+# Example
+loinc_df = load_release_table('./data/code_files/Loinc.csv', LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS,
+                              cache_directory='./data/cache')
+entry = cache_path('./data/cache', './data/code_files/Loinc.csv', LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS)
+write_table_snapshot('./data/cache', './data/output/owl_component_files/code_classes.owl',
+                     {'Loinc.csv': (entry, LOINC_CATEGORICAL_COLUMNS)}, included_codes=['1-8'])
+tables, attributes = load_table_snapshot('./data/cache', './data/output/owl_component_files/code_classes.owl')
+"""
+from importlib.util import find_spec
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+
+from comp_loinc.ingest.release_tables import read_release_table, normalize_empty_values, find_zip_member
+from comp_loinc.metrics import step
+
+# Bump when the parsing in release_tables changes so that existing cache entries are rebuilt
+CACHE_SCHEMA_VERSION = 2
+SNAPSHOT_VERSION = 1
+CACHE_AVAILABLE = find_spec('pyarrow') is not None
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    sha256 hex digest of a file's content
+    :param path: str
+    :param chunk_size: int bytes read at a time
+    :return: str
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_path(cache_directory, path, columns, categorical_columns=(), sep=",", member=None):
+    """
+    Path of the cache entry for a table read, keyed by source file content and table layout
+    :return: str
+    """
+    if member:
+        # the zip member's CRC-32 and size identify its content without decompressing it
+        with zipfile.ZipFile(path) as release_zip:
+            info = find_zip_member(release_zip, member)
+        source, name = f"{info.filename}:{info.CRC:08x}:{info.file_size}", os.path.basename(info.filename)
+    else:
+        source, name = file_digest(path), os.path.basename(path)
+    table_spec = json.dumps({
+        'schema_version': CACHE_SCHEMA_VERSION,
+        'file': source,
+        'columns': list(columns),
+        'categorical_columns': sorted(categorical_columns),
+        'sep': sep,
+    }, sort_keys=True)
+    key = hashlib.sha256(table_spec.encode()).hexdigest()[:24]
+    return os.path.join(cache_directory, f"{name}-{key}.arrow")
+
+
+def load_release_table(path, columns, categorical_columns=(), sep=",", cache_directory=None, member=None,
+                       chunk_size=None):
+    """
+    Read a release table through the cache, see `read_release_table` for the parameters.
+    :param cache_directory: str to the cache directory; None reads the source file without caching
+    :return: Pandas Dataframe
+    """
+    with step('csv_read', file=os.path.basename(member or path)) as metrics:
+        df = read_cached_release_table(path, columns, categorical_columns, sep, cache_directory, member, chunk_size,
+                                       metrics)
+        metrics.count(rows=len(df), columns=len(columns))
+    return df
+
+
+def read_cached_release_table(path, columns, categorical_columns, sep, cache_directory, member, chunk_size, metrics):
+    """load_release_table, recording in metrics whether the table came from the cache"""
+    if cache_directory is None or not CACHE_AVAILABLE:
+        metrics.attributes['source'] = 'file'
+        return read_release_table(path, columns, categorical_columns, sep=sep, member=member, chunk_size=chunk_size)
+    from pyarrow import feather
+
+    entry = cache_path(cache_directory, path, columns, categorical_columns, sep, member=member)
+    if os.path.exists(entry):
+        metrics.attributes['source'] = 'cache'
+        print(f"Loaded {os.path.basename(member or path)} from cache {entry}")
+        df = feather.read_table(entry, memory_map=True).to_pandas()
+        return normalize_empty_values(df, categorical_columns)
+
+    metrics.attributes['source'] = 'file'
+    df = read_release_table(path, columns, categorical_columns, sep=sep, member=member, chunk_size=chunk_size)
+    Path(cache_directory).mkdir(parents=True, exist_ok=True)
+    tmp_entry = f"{entry}.{os.getpid()}.tmp"
+    feather.write_feather(df.reset_index(drop=True), tmp_entry, compression='uncompressed')
+    os.replace(tmp_entry, entry)
+    return df
+
+
+def snapshot_path(cache_directory, output_path):
+    """
+    Path of the table snapshot of an output, keyed by the output's absolute path
+    :return: str
+    """
+    key = hashlib.sha256(os.path.abspath(output_path).encode()).hexdigest()[:24]
+    return os.path.join(cache_directory, 'snapshots', f"{os.path.basename(output_path)}-{key}.json")
+
+
+def write_table_snapshot(cache_directory, output_path, tables, **attributes):
+    """
+    Record the cache entries of the tables an output was built from
+    :param cache_directory: str to the cache directory
+    :param output_path: str to the output built from the tables
+    :param tables: dict of table name to a tuple of its cache entry, see cache_path, and its categorical columns
+    :param attributes: JSON serializable values stored with the tables, e.g. the codes the output was built for
+    """
+    path = snapshot_path(cache_directory, output_path)
+    Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+    snapshot = dict(attributes, version=SNAPSHOT_VERSION, tables={
+        name: {'entry': entry, 'categorical_columns': list(categorical_columns)}
+        for name, (entry, categorical_columns) in tables.items()})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def load_table_snapshot(cache_directory, output_path):
+    """
+    Read back the tables an output was built from
+    :param cache_directory: str to the cache directory
+    :param output_path: str to the output, as given to write_table_snapshot
+    :return: tuple of a dict of table name to Pandas Dataframe, and a dict of the snapshot's attributes
+    :raises FileNotFoundError: if the output has no snapshot, or one of its cache entries was removed
+    """
+    from pyarrow import feather
+
+    path = snapshot_path(cache_directory, output_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No table snapshot of {output_path} in {cache_directory}; build it with the table "
+                                f"cache enabled first")
+    with open(path) as f:
+        snapshot = json.load(f)
+    if snapshot.pop('version', None) != SNAPSHOT_VERSION:
+        raise FileNotFoundError(f"The table snapshot of {output_path} is from another version; build it again")
+    tables = {}
+    for name, table in snapshot.pop('tables').items():
+        if not os.path.exists(table['entry']):
+            raise FileNotFoundError(f"Cache entry {table['entry']} of {output_path} was removed; build it again")
+        tables[name] = normalize_empty_values(feather.read_table(table['entry'], memory_map=True).to_pandas(),
+                                              table['categorical_columns'])
+    return tables, snapshot
@@ -13,20 +13,27 @@ todo's (minor)
 """
 import os
 import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from os.path import dirname
 import typer
 
+# Only modules that import quickly are imported here. The ingest and mapping modules load pandas, linkml_runtime,
+# linkml_owl, rdflib and requests, so they are imported in the commands that use them, and `--help`, `merge` and
+# `reason` start without them.
 try:
-    from comp_loinc.ingest.part_ingest import PartOntology
-    from comp_loinc.ingest.code_ingest import CodeIngest
-    from comp_loinc.mapping.fhir_concept_map_ingest import ChebiFhirIngest
-    from comp_loinc.ingest.load_loinc_release import LoadLoincRelease
+    from comp_loinc.build_manifest import BuildManifest, schema_files, tool_versions
+    from comp_loinc.pipeline import PipelineError, Stage, run_stages
+    from comp_loinc.metrics import PROFILERS, step
+    from comp_loinc.owl_merge import merge_ofn
+    from comp_loinc.workspace import release_paths, prepare_release_workspace
 except ModuleNotFoundError:
-    from comp_loinc.ingest.part_ingest import PartOntology
-    from comp_loinc.ingest.code_ingest import CodeIngest
-    from comp_loinc.mapping.fhir_concept_map_ingest import ChebiFhirIngest
-    from comp_loinc.ingest.load_loinc_release import LoadLoincRelease
+    from comp_loinc.build_manifest import BuildManifest, schema_files, tool_versions
+    from comp_loinc.pipeline import PipelineError, Stage, run_stages
+    from comp_loinc.metrics import PROFILERS, step
+    from comp_loinc.owl_merge import merge_ofn
+    from comp_loinc.workspace import release_paths, prepare_release_workspace
 
 
 app = typer.Typer(help='CompLOINC. A tool for creating an OWL version of LOINC.')
@@ -34,81 +41,211 @@ PROJECT_DIR = Path(dirname(dirname(dirname(__file__))))
 
 SRC_DIR = os.path.join(PROJECT_DIR, 'src')
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+SCHEMA_DIR = os.path.join(SRC_DIR, 'comp_loinc', 'schema')
 ROBOT_BIN_PATH = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'ROBOT',  'robot')
 
 DEFAULTS = {
-    'schema_file.parts': os.path.join(SRC_DIR, 'schema', 'part_schema.yaml'),
-    'schema_file.codes': os.path.join(SRC_DIR, 'schema', 'code_schema.yaml'),
-    'schema_file.composed': os.path.join(SRC_DIR, 'schema', 'grouping_classes_schema.yaml'),
+    'schema_file.parts': os.path.join(SCHEMA_DIR, 'part_schema.yaml'),
+    'schema_file.codes': os.path.join(SCHEMA_DIR, 'code_schema.yaml'),
+    'schema_file.composed': os.path.join(SCHEMA_DIR, 'grouping_classes_schema.yaml'),
     'output.parts': os.path.join(DATA_DIR, 'output', 'owl_component_files', 'part_ontology.owl'),
     'output.codes': os.path.join(DATA_DIR, 'output', 'owl_component_files', 'code_classes.owl'),
     'output.composed': os.path.join(DATA_DIR, 'output', 'owl_component_files', 'composed_component_classes.owl'),
-    'output.map': os.path.join(DATA_DIR, 'output', 'sssom_mapping_files', 'loinc2chebi_sssom.tsv'),
+    'output.delta_report': os.path.join(DATA_DIR, 'output', 'release_changes.tsv'),
+    'sssom_directory': os.path.join(DATA_DIR, 'output', 'sssom_mapping_files'),
     'output.merge': os.path.join(DATA_DIR, 'output', 'merged_loinc.owl'),
     'output.reason': os.path.join(DATA_DIR, 'output', 'merged_reasoned_loinc.owl'),
     'part_directory': os.path.join(DATA_DIR, 'part_files'),
     'code_directory': os.path.join(DATA_DIR, 'code_files'),
     'release_directory': os.path.join(DATA_DIR, 'loinc_release'),
-    'code_file': os.path.join(SRC_DIR, 'schema', 'code_schema.yaml'),
+    'cache_directory': os.path.join(DATA_DIR, 'cache'),
+    'fhir_cache_directory': os.path.join(DATA_DIR, 'cache', 'fhir'),
+    'code_file': os.path.join(SCHEMA_DIR, 'code_schema.yaml'),
     'composed_classes_data_file': os.path.join(DATA_DIR, 'composed_classes_data.yaml'),
     'owl_directory': os.path.join(DATA_DIR, 'output', 'owl_component_files'),
     'merged_owl': os.path.join(DATA_DIR, 'output', 'merged_loinc.owl'),
     'owl_reasoner': 'elk',
+    'workers': 1,
+    'manifest': os.path.join(DATA_DIR, 'output', 'build_manifest.json'),
 }
 
 @app.command(name='load_release')
-def load_release():
+def load_release(
+    release: str = typer.Option(default=None),
+    cache_directory: str = typer.Option(default=DEFAULTS['cache_directory'], resolve_path=True, writable=True)
+):
     """Load LOINC release into local data directory.
 
-    :param release: str to LOINC release version to download and load.
+    Only the release files CompLOINC uses are read out of the release zip.
+
+    :param release: str to LOINC release version to download and load. When given, the release zip for that version
+    is picked from the release directory and loaded into the release's workspace, `data/releases/<release>`, instead
+    of `data/code_files`.
+    :param cache_directory: str to directory where the code files are parsed and cached. Pass an empty string to skip
+    this.
     """
-    l = LoadLoincRelease(DEFAULTS['release_directory'])
+    if release:
+        paths = release_paths(DEFAULTS, DATA_DIR, release)
+        prepare_release_workspace(paths, release, DEFAULTS['release_directory'], DEFAULTS['code_directory'],
+                                  cache_directory or None)
+        return
+    from comp_loinc.ingest.load_loinc_release import LoadLoincRelease
+
+    l = LoadLoincRelease(DEFAULTS['release_directory'], cache_directory=cache_directory or None)
 
 
 @app.command(name='parts')
 def build_part_ontology(
     schema_file: str = typer.Option(default=DEFAULTS['schema_file.parts'], resolve_path=True, exists=False),
     part_directory: str = typer.Option(default=DEFAULTS['part_directory'], resolve_path=True, exists=False),
-    output: str = typer.Option(default=DEFAULTS['output.parts'], resolve_path=True, writable=True)
+    output: str = typer.Option(default=DEFAULTS['output.parts'], resolve_path=True, writable=True),
+    cache_directory: str = typer.Option(default=DEFAULTS['cache_directory'], resolve_path=True, writable=True),
+    chunk_size: int = typer.Option(default=None, min=1)
 ):
     """Build ontology for LOINC term parts. Part 1/5 of the pipeline.
 
     :param schema_file: str to LinkML `.yaml` file that defines data model for LOINC term 'parts', which are
     essentially subcomponents of LOINC terms.
     :param part_directory: str to directory containing TSV files which define the entire LOINC hierarchy of terms and
-    their subcomponent parts.
+    their subcomponent parts, or to a zip of these files, which are then read without extracting them.
     :param output: str where output will be saved.
+    :param cache_directory: str to directory where parsed part files are cached. Pass an empty string to disable the
+    cache. The cache also records which part files the output was built from, for `delta`.
+    :param chunk_size: int number of rows of each part file parsed at a time. Bounds peak memory by the kept columns
+    instead of the file size. Each file is parsed at once by default.
 
     # Example
     po = PartOntology("./model/schema/part_schema.yaml", "./local_data/part_files")
     po.generate_ontology()
     po.write_to_output('./data/output/owl_component_files/part_ontology.owl')
     """
-    po = PartOntology(str(schema_file), str(part_directory))
+    from comp_loinc.ingest.part_ingest import PartOntology
+
+    po = PartOntology(str(schema_file), str(part_directory), cache_directory=cache_directory or None,
+                      chunk_size=chunk_size)
     po.generate_ontology()
     po.write_to_output(output)
+    po.write_table_snapshot(output)
 
 
 @app.command(name='codes')
 def build_codes(
     schema_file: str = typer.Option(default=DEFAULTS['schema_file.codes'], resolve_path=True, exists=False),
     code_directory: str = typer.Option(default=DEFAULTS['code_directory'], resolve_path=True, exists=False),
-    output: str = typer.Option(default=DEFAULTS['output.codes'], resolve_path=True, writable=True)
+    output: str = typer.Option(default=DEFAULTS['output.codes'], resolve_path=True, writable=True),
+    missing_codes_output: str = typer.Option(default=None, resolve_path=True, writable=True),
+    cache_directory: str = typer.Option(default=DEFAULTS['cache_directory'], resolve_path=True, writable=True),
+    release_zip: str = typer.Option(default=None, resolve_path=True, exists=False),
+    chunk_size: int = typer.Option(default=None, min=1)
 ):
     """Build ontology for LOINC codes.  Part 2/5 of the pipeline.
 
     :param schema_file: str to LinkML `.yaml` file that defines data model for LOINC terms, which are identified by
     LOINC codes.
-    :param part_directory: str to directory containing TSV files which define the entire LOINC hierarchy of terms and
-    their subcomponent parts.
+    :param code_directory: str to directory containing included_codes.tsv, the codes to build, and unless
+    `release_zip` is given, the release's Loinc.csv and LoincPartLink_Primary.csv.
     :param output: str where output will be saved.
+    :param missing_codes_output: optional str where a TSV of included codes missing from the release files will be
+    saved.
+    :param cache_directory: str to directory where parsed code files are cached. Pass an empty string to disable the
+    cache. The cache also records which code files and included codes the output was built from, for `delta`.
+    :param release_zip: optional str to a LOINC release zip. Loinc.csv and LoincPartLink_Primary.csv are then read
+    from the zip without extracting them; included_codes.tsv is still read from `code_directory`.
+    :param chunk_size: int number of rows of each code file parsed at a time. Bounds peak memory by the kept columns
+    instead of the file size. Each file is parsed at once by default.
 
     # Example
-    lcc = CodeIngest("./model/schema/code_schema.yaml", "./data/part_files")
+    lcc = CodeIngest("./model/schema/code_schema.yaml", "./data/code_files")
     lcc.write_output_to_file("./data/output/owl_component_files/code_classes.owl")
     """
-    lcc = CodeIngest(str(schema_file), str(code_directory))
+    from comp_loinc.ingest.code_ingest import CodeIngest
+
+    lcc = CodeIngest(str(schema_file), str(code_directory), cache_directory=cache_directory or None,
+                     release_zip=release_zip, chunk_size=chunk_size)
     lcc.write_output_to_file(output)
+    lcc.write_table_snapshot(output)
+    if missing_codes_output:
+        lcc.write_missing_codes(missing_codes_output)
+
+
+@app.command(name='delta')
+def build_delta(
+    code_directory: str = typer.Option(default=DEFAULTS['code_directory'], resolve_path=True, exists=False),
+    release_zip: str = typer.Option(default=None, resolve_path=True, exists=False),
+    part_directory: str = typer.Option(default=DEFAULTS['part_directory'], resolve_path=True, exists=False),
+    code_schema_file: str = typer.Option(default=DEFAULTS['schema_file.codes'], resolve_path=True, exists=False),
+    part_schema_file: str = typer.Option(default=DEFAULTS['schema_file.parts'], resolve_path=True, exists=False),
+    code_owl: str = typer.Option(default=DEFAULTS['output.codes'], resolve_path=True, writable=True),
+    part_owl: str = typer.Option(default=DEFAULTS['output.parts'], resolve_path=True, writable=True),
+    report: str = typer.Option(default=DEFAULTS['output.delta_report'], resolve_path=True, writable=True),
+    cache_directory: str = typer.Option(default=DEFAULTS['cache_directory'], resolve_path=True, writable=True),
+    parts: bool = typer.Option(False, "--parts")
+):
+    """Update the code ontology, and with `--parts` the part ontology, built from a previous release to a new release,
+    only rebuilding the classes that may have changed. Alternative to re-running `codes` and `parts`.
+
+    The previous release's tables are read from the release table cache, where `codes` and `parts` record the tables
+    each ontology was built from, so its release files are not needed. Candidate codes are the included codes whose
+    VersionLastChanged or CHNG_TYPE changed, that were added or removed, or whose part links changed; candidate parts
+    are the parts whose part file rows changed. Only the candidates' classes are built, in both releases, and only the
+    ones that differ are patched into the ontology. See comp_loinc.ingest.release_delta.
+
+    :param code_directory: str to the code files of the new release.
+    :param release_zip: optional str to the new LOINC release zip, to read Loinc.csv and LoincPartLink_Primary.csv
+    from, as in `codes`.
+    :param part_directory: str to the part files of the new release.
+    :param code_schema_file: str to LinkML `.yaml` file that defines data model for LOINC terms.
+    :param part_schema_file: str to LinkML `.yaml` file that defines data model for LOINC term 'parts'.
+    :param code_owl: str to the code ontology of the previous release, which is patched in place.
+    :param part_owl: str to the part ontology of the previous release, which is patched in place.
+    :param report: str where the TSV change report will be saved.
+    :param cache_directory: str to the release table cache that `code_owl` and `part_owl` were built with.
+    :param parts: bool also update the part ontology.
+    """
+    import pandas as pd
+    from comp_loinc.ingest.code_ingest import CodeIngest, load_code_tables, read_included_codes
+    from comp_loinc.ingest.part_ingest import PartOntology, load_part_files
+    from comp_loinc.ingest.release_delta import ReleaseDelta, candidate_codes, candidate_parts
+    from comp_loinc.ingest.table_cache import CACHE_AVAILABLE, load_table_snapshot
+
+    if not cache_directory or not CACHE_AVAILABLE:
+        raise typer.BadParameter("delta reads the previous release from the table cache, which needs "
+                                 "--cache-directory and pyarrow")
+    try:
+        previous_tables, snapshot = load_table_snapshot(cache_directory, code_owl)
+        previous_part_tables = load_table_snapshot(cache_directory, part_owl)[0] if parts else None
+    except FileNotFoundError as e:
+        print(e)
+        raise typer.Exit(code=1)
+
+    tables = load_code_tables(str(code_directory), cache_directory, release_zip)
+    included_codes = read_included_codes(str(code_directory))
+    codes = candidate_codes(previous_tables, tables, snapshot['included_codes'], included_codes)
+    print(f"{len(codes)} candidate codes of {len(included_codes)} included codes")
+    previous_codes = CodeIngest(str(code_schema_file), None, tables=previous_tables,
+                                included_codes=snapshot['included_codes'], codes=codes)
+    current_codes = CodeIngest(str(code_schema_file), str(code_directory), cache_directory=cache_directory,
+                               release_zip=release_zip, tables=tables, included_codes=included_codes, codes=codes)
+    code_delta = ReleaseDelta(previous_codes.code_classes, current_codes.code_classes)
+    code_delta.patch_owl(current_codes.owl_writer, code_owl)
+    current_codes.write_table_snapshot(code_owl)
+    print(f"\nPatched {code_owl}: {code_delta.counts()}")
+    reports = [code_delta.change_report(current_codes.code_dataframe)]
+    if parts:
+        previous_parts_df = pd.concat(previous_part_tables.values())
+        parts_df = load_part_files(str(part_directory), cache_directory)
+        part_numbers = candidate_parts(previous_parts_df, parts_df)
+        print(f"{len(part_numbers)} candidate parts")
+        previous_parts = PartOntology(str(part_schema_file), None, parts_df=previous_parts_df)
+        previous_parts.generate_ontology(part_numbers=part_numbers)
+        current_parts = PartOntology(str(part_schema_file), str(part_directory), cache_directory, parts_df=parts_df)
+        current_parts.generate_ontology(part_numbers=part_numbers)
+        part_delta = ReleaseDelta(previous_parts.part_classes, current_parts.part_classes)
+        part_delta.patch_owl(current_parts.owl_writer, part_owl)
+        current_parts.write_table_snapshot(part_owl)
+        print(f"\nPatched {part_owl}: {part_delta.counts()}")
+        reports.append(part_delta.change_report())
+    pd.concat(reports, ignore_index=True).to_csv(report, sep="\t", index=False)
 
 
 @app.command(name='composed')
@@ -116,7 +253,9 @@ def build_composed_classes(
     schema_file: str = typer.Option(default=DEFAULTS['schema_file.composed'], resolve_path=True, exists=False),
     composed_classes_data_file: str = typer.Option(
         default=DEFAULTS['composed_classes_data_file'], resolve_path=True, exists=False),
-    output: str = typer.Option(default=DEFAULTS['output.composed'], resolve_path=True, writable=True)
+    output: str = typer.Option(default=DEFAULTS['output.composed'], resolve_path=True, writable=True),
+    part_directory: str = typer.Option(default=DEFAULTS['part_directory'], resolve_path=True, exists=False),
+    cache_directory: str = typer.Option(default=DEFAULTS['cache_directory'], resolve_path=True, writable=True)
 ):
     """Build composed classes ontology.  Part 3/5 of the pipeline.
 
@@ -126,43 +265,88 @@ def build_composed_classes(
     more granular groupings of classes, and their are a greater number of them than the grouping classes in the
     `schema_file`.
     :param output: str where output will be saved.
-
-    todo: this is just calling a linkml owl cli, should be written as code with python code
+    :param part_directory: str to the part hierarchy files, or a zip of them. A composed class is generated for every
+    COMPONENT and SYSTEM part in them. Pass an empty string to build only the classes in `composed_classes_data_file`.
+    :param cache_directory: str to directory where parsed release tables are cached. Pass an empty string to disable
+    the cache.
     """
-    subprocess.call(["linkml-data2owl", "-s", schema_file, composed_classes_data_file, "-o", output])
+    from comp_loinc.ingest.composed_ingest import ComposedClasses
+
+    composed_classes = ComposedClasses(schema_file, composed_classes_data_file, part_directory or None,
+                                       cache_directory=cache_directory or None)
+    composed_classes.write_to_output(output)
 
 
 @app.command(name='map')
 def build_mappings(
     username: str = typer.Option(default=None),
     password: str = typer.Option(default=None),
-    output: str = typer.Option(default=DEFAULTS['output.map'], resolve_path=True, writable=True)
+    concept_maps_file: str = typer.Option(default=None, resolve_path=True, exists=True),
+    owl_directory: str = typer.Option(default=DEFAULTS['owl_directory'], resolve_path=True, writable=True),
+    write_sssom: bool = typer.Option(False, "--write-sssom"),
+    sssom_directory: str = typer.Option(default=DEFAULTS['sssom_directory'], resolve_path=True, writable=True),
+    fhir_cache_directory: str = typer.Option(default=DEFAULTS['fhir_cache_directory'], resolve_path=True,
+                                             writable=True),
+    offline: bool = typer.Option(False, "--offline"),
+    workers: int = typer.Option(default=4),
+    rate_limit: float = typer.Option(default=None)
 ):
     """Build mappings ontology.  Part 3/5 of the pipeline.
 
     :param password: str to password for LOINC API.
     :param username: str to username for LOINC API.
-    :param output: str where output will be saved."""
-
-    chebi_fhir = ChebiFhirIngest(pwd=password, user=username, output=output)
-    chebi_fhir.get_fhir_chebi_mappings()
-
+    :param concept_maps_file: str to a YAML file listing the ConceptMaps to ingest, each with `name`, `url`,
+    `target_prefix` and `target_iri`. Defaults to the LOINC part to ChEBI map.
+    :param owl_directory: str where one OWL file per ConceptMap, `loinc2<name>.owl`, will be saved.
+    :param write_sssom: bool also save the mappings as SSSOM TSV files.
+    :param sssom_directory: str where one SSSOM file per ConceptMap, `loinc2<name>.tsv`, will be saved with
+    --write-sssom.
+    :param fhir_cache_directory: str to directory where LOINC FHIR server responses are cached and revalidated with
+    conditional requests. Pass an empty string to disable the cache.
+    :param offline: bool build the mappings from the FHIR response cache only, without network access.
+    :param workers: int number of ConceptMaps fetched concurrently.
+    :param rate_limit: float maximum number of requests per second to the FHIR server, across all workers."""
+    from comp_loinc.mapping.fhir_concept_map_ingest import MappingIngest, CONCEPT_MAPS, load_concept_maps
+
+    concept_maps = load_concept_maps(concept_maps_file) if concept_maps_file else CONCEPT_MAPS
+    mapping_ingest = MappingIngest(concept_maps, owl_directory, sssom_directory if write_sssom else None,
+                                   user=username, pwd=password, cache_directory=fhir_cache_directory or None,
+                                   offline=offline, max_workers=workers, rate_limit=rate_limit)
+    mapping_ingest.run()
 
 
 @app.command(name="merge")
 def merge_owl(
     owl_directory: str = typer.Option(default=DEFAULTS['owl_directory'], resolve_path=True, exists=False),
-    output: str = typer.Option(default=DEFAULTS['output.merge'], resolve_path=True, writable=True)
+    output: str = typer.Option(default=DEFAULTS['output.merge'], resolve_path=True, writable=True),
+    engine: str = typer.Option(default='native'),
+    workers: int = typer.Option(default=DEFAULTS['workers'], min=1)
 ):
     """Merge all OWL ontology files into a single ontology. Part 4/5 of the pipeline.
 
     :param owl_directory: str to directory where unmerged `.owl` files are stored.
     :param output: str where output will be saved.
+    :param engine: `native` streams the OWL functional syntax files into one, dropping duplicate axioms; `robot` runs
+    ROBOT's merge, which also reads other serializations and follows imports.
+    :param workers: int number of files the native engine parses at the same time.
 
     TODO: Consider removing the files created from this point each time this code executes e.g. any file with 'merge_*'
     """
-    files = [os.path.join(owl_directory, str(x)) for x in os.listdir(owl_directory) if ".owl" in str(x)]
-    subprocess.call([ROBOT_BIN_PATH, "merge", "-i"] + " -i ".join(files).split() + ['-o', output])
+    files = owl_component_files(owl_directory)
+    if engine == 'robot':
+        with step('robot_merge', files=len(files)):
+            return_code = subprocess.call([ROBOT_BIN_PATH, "merge"] + robot_inputs(files) + ['-o', output])
+        if return_code != 0:
+            print(f"ROBOT merge failed with exit code {return_code}")
+            raise typer.Exit(code=return_code)
+    elif engine == 'native':
+        with step('owl_merge', files=len(files)) as metrics:
+            stats = merge_ofn(files, output, workers=workers)
+            metrics.count(axioms=stats['axioms'], duplicates=stats['duplicates'])
+        print(f"Merged {stats['axioms']} axioms from {stats['files']} files, skipping {stats['duplicates']} "
+              f"duplicates")
+    else:
+        raise typer.BadParameter(f"Unknown merge engine {engine}, expected native or robot")
 
 
 @app.command(name="reason")
@@ -177,33 +361,268 @@ def reason_owl(
     :param owl_reasoner: The name of the OWL reasoner to use.
     :param output: str where output will be saved."""
     call_list = [ROBOT_BIN_PATH, "reason", "-r", owl_reasoner, '-i', f"{merged_owl}", '-o', f"{output}"]
-    subprocess.call(call_list)
+    with step('robot_reason', reasoner=owl_reasoner):
+        return_code = subprocess.call(call_list)
+    if return_code != 0:
+        print(f"ROBOT reason failed with exit code {return_code}")
+        raise typer.Exit(code=return_code)
+
+
+@app.command(name="merge-reason")
+def merge_reason_owl(
+    owl_directory: str = typer.Option(default=DEFAULTS['owl_directory'], resolve_path=True, exists=False),
+    merged_output: str = typer.Option(default=DEFAULTS['output.merge'], resolve_path=True, writable=True),
+    owl_reasoner: str = typer.Option(default=DEFAULTS['owl_reasoner']),
+    output: str = typer.Option(default=DEFAULTS['output.reason'], resolve_path=True, writable=True)
+):
+    """Merge all OWL ontology files and reason over the result in a single chained ROBOT command. Parts 4 and 5/5 of
+    the pipeline in one step.
+
+    ROBOT starts once, and hands the merged ontology to the reasoner in memory instead of writing it out and parsing
+    it again. The merged ontology is still saved. Prints the time spent in each phase; merge includes JVM startup and
+    saving the merged ontology, and is measured up to when that file is written.
+
+    :param owl_directory: str to directory where unmerged `.owl` files are stored.
+    :param merged_output: str where the merged ontology will be saved.
+    :param owl_reasoner: The name of the OWL reasoner to use.
+    :param output: str where the reasoned ontology will be saved."""
+    call_list = [ROBOT_BIN_PATH, "merge"] + robot_inputs(owl_component_files(owl_directory)) + [
+        '-o', merged_output, "reason", "-r", owl_reasoner, '-o', output]
+    start = time.time()
+    with step('robot_merge_reason', reasoner=owl_reasoner):
+        return_code = subprocess.call(call_list)
+    end = time.time()
+    if return_code != 0:
+        print(f"ROBOT merge and reason failed with exit code {return_code} after {end - start:.1f}s")
+        raise typer.Exit(code=return_code)
+    merged_at = min(max(os.path.getmtime(merged_output), start), end)
+    print(f"merge: {merged_at - start:.1f}s, reason: {end - merged_at:.1f}s, total: {end - start:.1f}s")
+
+
+def owl_component_files(owl_directory):
+    """The `.owl` files in owl_directory, sorted
+    :param owl_directory: str
+    :return: list of str paths"""
+    return sorted(os.path.join(owl_directory, x) for x in os.listdir(owl_directory) if x.endswith('.owl'))
+
+
+def robot_inputs(files):
+    """ROBOT `-i` options for files
+    :param files: list of str paths
+    :return: list of str arguments"""
+    return [arg for path in files for arg in ['-i', path]]
 
 
 @app.command(name="all")
-def run_all():
+def run_all(
+    incremental: bool = typer.Option(False, "--incremental"),
+    manifest: str = typer.Option(default=DEFAULTS['manifest'], resolve_path=True, writable=True),
+    releases: str = typer.Option(default=None),
+    jobs: int = typer.Option(default=1, min=1),
+    robot_chain: bool = typer.Option(False, "--robot-chain"),
+    with_mappings: bool = typer.Option(False, "--with-mappings"),
+    metrics_out: str = typer.Option(default=None, resolve_path=True, writable=True),
+    profile: str = typer.Option(default=None)
+):
     """Runs the whole pipeline.
 
-    Uses default values for all steps. For something more custom, it is recommended to run the steps 1 at a time."""
-    build_part_ontology(
-        schema_file=DEFAULTS['schema_file.parts'],
-        part_directory=DEFAULTS['part_directory'],
-        output=DEFAULTS['output.parts'])
-    build_codes(
-        schema_file=DEFAULTS['schema_file.codes'],
-        part_directory=DEFAULTS['part_directory'],
-        output=DEFAULTS['output.codes'])
-    build_composed_classes(
-        schema_file=DEFAULTS['schema_file.composed'],
-        composed_classes_data_file=DEFAULTS['composed_classes_data_file'],
-        output=DEFAULTS['output.composed'])
-    merge_owl(
-        owl_directory=DEFAULTS['owl_directory'],
-        output=DEFAULTS['output.merge'])
-    reason_owl(
-        merged_owl=DEFAULTS['merged_owl'],
-        owl_reasoner=DEFAULTS['owl_reasoner'],
-        output=DEFAULTS['output.reason'])
+    Uses default values for all steps. For something more custom, it is recommended to run the steps 1 at a time.
+
+    The stages run as a graph: parts, codes, composed classes and mappings do not depend on each other and run side by
+    side, and merge and reason wait for the stages whose outputs they read. The wall time of each stage and the critical
+    path are printed at the end.
+
+    :param incremental: bool skip the stages whose inputs, options, tools and upstream outputs are unchanged since they
+    were last built. The mapping stage always runs, as its concept maps come from the FHIR server; they are
+    revalidated against the FHIR cache.
+    :param manifest: str to the build manifest, which records each stage's input hashes, options and tool versions. It
+    is updated on every run, incremental or not. Release workspaces have their own manifest.
+    :param releases: optional comma separated LOINC release versions, e.g. `2.74,2.76,2.77`. Each release is built in
+    its own workspace, `data/releases/<release>`, loading its code files from the matching zip in
+    `data/loinc_release` if they are not there yet. The parsed release table cache is shared.
+    :param jobs: int number of stages run at the same time, or with --releases, number of releases built at the same
+    time.
+    :param robot_chain: bool merge and reason in one chained ROBOT command, see `merge-reason`.
+    :param with_mappings: bool also build the mappings with `map`, which needs LOINC FHIR server credentials in
+    `secrets.yaml`.
+    :param metrics_out: optional str where the wall time, CPU time, peak RSS and row/class counts of each stage, and
+    of its steps (release table reads, grouping, class construction, OWL dump, merge and ROBOT runs), are saved as
+    JSON. With --releases, each release's metrics are saved with the release appended to the file name.
+    :param profile: optional `cprofile` or `tracemalloc`, to profile each stage that is built. The profile summary is
+    saved with the metrics, and cProfile stats are saved next to them as `<metrics file>.<stage>.prof`. Needs
+    --metrics-out.
+    """
+    if profile and profile not in PROFILERS:
+        raise typer.BadParameter(f"Unknown profiler {profile}, expected one of {', '.join(PROFILERS)}")
+    if profile and not metrics_out:
+        raise typer.BadParameter("--profile needs --metrics-out")
+    if not releases:
+        try:
+            run_pipeline(dict(DEFAULTS, manifest=manifest), incremental, robot_chain, jobs, with_mappings, metrics_out,
+                         profile)
+        except PipelineError as e:
+            print(e)
+            raise typer.Exit(code=1)
+        return
+    releases = [x.strip() for x in releases.split(',') if x.strip()]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(releases))) as pool:
+        futures = {pool.submit(run_release_pipeline, release, incremental, robot_chain, with_mappings,
+                               release_metrics_path(metrics_out, release), profile): release
+                   for release in releases}
+        failed = []
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                print(f"LOINC {futures[future]} failed: {future.exception()!r}")
+                failed.append(futures[future])
+            else:
+                print(f"LOINC {futures[future]} finished")
+    if failed:
+        raise typer.Exit(code=1)
+
+
+def release_metrics_path(metrics_out, release):
+    """The metrics file of one release, `<name>-<release><ext>`, or None without metrics_out"""
+    if not metrics_out:
+        return None
+    root, ext = os.path.splitext(metrics_out)
+    return f"{root}-{release}{ext}"
+
+
+def run_release_pipeline(release, incremental=False, robot_chain=False, with_mappings=False, metrics_out=None,
+                         profile=None):
+    """Run the whole pipeline in the workspace of one release. Module level so that it can run in a worker process.
+    The stages of the release run one at a time.
+
+    :param release: str LOINC release version.
+    :param incremental: bool, see `run_all`.
+    :param robot_chain: bool, see `run_all`.
+    :param with_mappings: bool, see `run_all`.
+    :param metrics_out: optional str, see `run_all`.
+    :param profile: optional str, see `run_all`.
+    """
+    paths = release_paths(DEFAULTS, DATA_DIR, release)
+    prepare_release_workspace(paths, release, DEFAULTS['release_directory'], DEFAULTS['code_directory'],
+                              DEFAULTS['cache_directory'])
+    run_pipeline(paths, incremental, robot_chain, 1, with_mappings, metrics_out, profile)
+
+
+def run_pipeline(paths, incremental=False, robot_chain=False, jobs=1, with_mappings=False, metrics_out=None,
+                 profile=None):
+    """Run the pipeline stages with the given paths.
+
+    :param paths: dict with the keys of DEFAULTS, e.g. from `release_paths`.
+    :param incremental: bool, see `run_all`.
+    :param robot_chain: bool, see `run_all`.
+    :param jobs: int number of stages run at the same time.
+    :param with_mappings: bool, see `run_all`.
+    :param metrics_out: optional str, see `run_all`.
+    :param profile: optional str, see `run_all`.
+    """
+    build_manifest = BuildManifest(paths['manifest'])
+    try:
+        run_stages(pipeline_stages(paths, robot_chain, with_mappings), build_manifest, jobs, incremental, metrics_out,
+                   profile)
+    finally:
+        build_manifest.print_summary()
+
+
+def pipeline_stages(paths, robot_chain=False, with_mappings=False):
+    """The pipeline stages, with their inputs and outputs, for run_stages. The inputs of the ingest stages include
+    every schema file their schema imports.
+
+    :param paths: dict with the keys of DEFAULTS.
+    :param robot_chain: bool, see `run_all`.
+    :param with_mappings: bool, see `run_all`.
+    :return: list of Stage
+    """
+    robot_files = [ROBOT_BIN_PATH, os.path.join(dirname(ROBOT_BIN_PATH), 'robot.jar')]
+    stages = [
+        Stage('parts', build_part_ontology, dict(
+            schema_file=paths['schema_file.parts'],
+            part_directory=paths['part_directory'],
+            output=paths['output.parts'],
+            cache_directory=paths['cache_directory'],
+            chunk_size=None),
+            inputs=[*schema_files(paths['schema_file.parts']), paths['part_directory']],
+            outputs=[paths['output.parts']],
+            options={'output': paths['output.parts']},
+            tools=tool_versions('linkml-owl', 'pandas')),
+        Stage('codes', build_codes, dict(
+            schema_file=paths['schema_file.codes'],
+            code_directory=paths['code_directory'],
+            output=paths['output.codes'],
+            missing_codes_output=None,
+            cache_directory=paths['cache_directory'],
+            release_zip=None,
+            chunk_size=None),
+            inputs=[*schema_files(paths['schema_file.codes']), paths['code_directory']],
+            outputs=[paths['output.codes']],
+            options={'output': paths['output.codes']},
+            tools=tool_versions('linkml-owl', 'pandas')),
+        Stage('composed', build_composed_classes, dict(
+            schema_file=paths['schema_file.composed'],
+            composed_classes_data_file=paths['composed_classes_data_file'],
+            output=paths['output.composed'],
+            part_directory=paths['part_directory'],
+            cache_directory=paths['cache_directory']),
+            inputs=[*schema_files(paths['schema_file.composed']), paths['composed_classes_data_file'],
+                    paths['part_directory']],
+            outputs=[paths['output.composed']],
+            options={'output': paths['output.composed']},
+            tools=tool_versions('linkml-owl', 'pandas')),
+    ]
+    if with_mappings:
+        from comp_loinc.mapping.fhir_concept_map_ingest import CONCEPT_MAPS
+
+        stages.append(Stage('map', build_mappings, dict(
+            username=None,
+            password=None,
+            concept_maps_file=None,
+            owl_directory=paths['owl_directory'],
+            write_sssom=False,
+            sssom_directory=paths['sssom_directory'],
+            fhir_cache_directory=paths['fhir_cache_directory'],
+            offline=False,
+            workers=4,
+            rate_limit=None),
+            inputs=[],
+            outputs=[os.path.join(paths['owl_directory'], f"loinc2{x.name}.owl") for x in CONCEPT_MAPS],
+            options={'concept_maps': [x.url for x in CONCEPT_MAPS]},
+            tools=tool_versions(),
+            # the concept maps are read from the FHIR server, so the manifest cannot tell when they change; the FHIR
+            # cache revalidates them, which is cheap when they have not, and merge is still reused if the OWL files
+            # come out the same
+            always_run=True))
+    # merge reads every OWL file in owl_directory, which holds the outputs of the stages above
+    if robot_chain:
+        stages.append(Stage('merge_reason', merge_reason_owl, dict(
+            owl_directory=paths['owl_directory'],
+            merged_output=paths['output.merge'],
+            owl_reasoner=paths['owl_reasoner'],
+            output=paths['output.reason']),
+            inputs=[paths['owl_directory']],
+            outputs=[paths['output.merge'], paths['output.reason']],
+            options={'owl_reasoner': paths['owl_reasoner'], 'output': paths['output.reason']},
+            tools=tool_versions(files=robot_files)))
+    else:
+        stages.append(Stage('merge', merge_owl, dict(
+            owl_directory=paths['owl_directory'],
+            output=paths['output.merge'],
+            engine='native',
+            workers=paths['workers']),
+            inputs=[paths['owl_directory']],
+            outputs=[paths['output.merge']],
+            options={'output': paths['output.merge'], 'engine': 'native'},
+            tools=tool_versions()))
+        stages.append(Stage('reason', reason_owl, dict(
+            merged_owl=paths['merged_owl'],
+            owl_reasoner=paths['owl_reasoner'],
+            output=paths['output.reason']),
+            inputs=[paths['merged_owl']],
+            outputs=[paths['output.reason']],
+            options={'owl_reasoner': paths['owl_reasoner'], 'output': paths['output.reason']},
+            tools=tool_versions(files=robot_files)))
+    return stages
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+"""FHIR client
+
+Fetches FHIR searches from the LOINC FHIR server with a pooled HTTP session, following the Bundle `next` links of
+paginated results. Requests time out, and are retried with exponential backoff on connection errors and on 429/5xx
+responses. Responses are kept in an on-disk cache and revalidated with conditional requests (If-None-Match /
+If-Modified-Since), so an unchanged resource is not downloaded again; with offline=True everything is served from the
+cache without touching the network.
+
+A RateLimiter can be shared by clients used from several threads to bound the request rate to the server.
+
+The HTTP transport is pluggable: any callable with the signature of RequestsTransport.__call__ can stand in for it, and
+base_url can point at a local stub server.
+
+# Example
+client = FhirClient('https://fhir.loinc.org', auth=(user, pwd), cache_directory='./data/cache/fhir')
+elements = list(client.concept_map_elements('http://loinc.org/cm/loinc-parts-to-chebi'))
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FhirRequestError(Exception):
+    """A FHIR request failed, or could not be served from the cache in offline mode"""
+
+
+class FhirResponse(object):
+    """
+    Transport independent HTTP response
+    """
+    def __init__(self, status, headers, body):
+        """
+        :param status: int HTTP status code
+        :param headers: dict of header name to value; names are matched case-insensitively
+        :param body: bytes
+        """
+        self.status = status
+        self.headers = {k.lower(): v for k, v in headers.items()}
+        self.body = body
+
+
+class RequestsTransport(object):
+    """
+    HTTP transport on a pooled requests session
+    """
+    def __init__(self, pool_size=10):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __call__(self, url, headers, auth, timeout):
+        """
+        GET url
+        :param url: str
+        :param headers: dict of request headers
+        :param auth: (user, password) tuple or None
+        :param timeout: float seconds
+        :return: FhirResponse; connection errors and timeouts are raised as OSError
+        """
+        r = self.session.get(url, headers=headers, auth=auth, timeout=timeout)
+        return FhirResponse(r.status_code, dict(r.headers), r.content)
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of response bodies with their ETag and Last-Modified validators, one JSON file per URL
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, url):
+        return os.path.join(self.directory, f"{hashlib.sha256(url.encode()).hexdigest()}.json")
+
+    def get(self, url):
+        """
+        :return: dict with url, etag, last_modified and body, or None
+        """
+        if not os.path.exists(self.path(url)):
+            return None
+        with open(self.path(url)) as f:
+            return json.load(f)
+
+    def put(self, url, response):
+        """
+        Store a 200 response, replacing the previous entry atomically
+        :param response: FhirResponse
+        """
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        entry = {
+            'url': url,
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'body': response.body.decode('utf-8'),
+        }
+        tmp_path = f"{self.path(url)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.path(url))
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls to wait() from any number of threads to at most requests_per_second
+    """
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class FhirClient(object):
+    """
+    FHIR read client with paging, retries and a conditional-request cache
+    """
+    def __init__(self, base_url, auth=None, transport=None, cache_directory=None, offline=False, timeout=30.0,
+                 retries=3, backoff=1.0, rate_limiter=None):
+        """
+        :param base_url: str FHIR server base URL
+        :param auth: (user, password) tuple for basic auth, or None
+        :param transport: callable, defaults to a RequestsTransport
+        :param cache_directory: str to the response cache directory, or None for no cache
+        :param offline: bool serve every request from the cache; requests that are not cached raise FhirRequestError
+        :param timeout: float seconds per request
+        :param retries: int number of retries after a failed attempt
+        :param backoff: float seconds before the first retry, doubled for each further retry
+        :param rate_limiter: optional RateLimiter every request waits on
+        """
+        if offline and cache_directory is None:
+            raise ValueError("Offline mode needs a cache directory")
+        self.base_url = base_url.rstrip('/')
+        self.auth = auth
+        self.transport = transport or RequestsTransport()
+        self.cache = ResponseCache(cache_directory) if cache_directory else None
+        self.offline = offline
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+
+    def get_json(self, url):
+        """
+        GET a URL, through the cache
+        :param url: str absolute URL
+        :return: parsed JSON
+        """
+        cached = self.cache.get(url) if self.cache else None
+        if self.offline:
+            if cached is None:
+                raise FhirRequestError(f"{url} is not in the response cache and the client is offline")
+            return json.loads(cached['body'])
+        headers = {'Accept': 'application/fhir+json'}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        response = self.send(url, headers)
+        if response.status == 304 and cached:
+            return json.loads(cached['body'])
+        if response.status != 200:
+            raise FhirRequestError(f"GET {url} returned HTTP {response.status}")
+        if self.cache:
+            self.cache.put(url, response)
+        return json.loads(response.body)
+
+    def send(self, url, headers):
+        """
+        Send a request, retrying connection errors and retryable statuses
+        :return: FhirResponse
+        """
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            try:
+                response = self.transport(url, headers, self.auth, self.timeout)
+            except OSError as e:
+                if last_attempt:
+                    raise FhirRequestError(f"GET {url} failed after {attempt + 1} attempts: {e!r}") from e
+                delay = self.backoff * 2 ** attempt
+            else:
+                if response.status not in RETRY_STATUSES or last_attempt:
+                    return response
+                delay = self.backoff * 2 ** attempt
+                retry_after = response.headers.get('retry-after', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            print(f"Retrying GET {url} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def search(self, resource_type, **params):
+        """
+        Run a FHIR search, following the Bundle `next` links
+        :param resource_type: str e.g. 'ConceptMap'
+        :param params: search parameters
+        :return: generator of Bundle dicts, one per page
+        """
+        url = f"{self.base_url}/{resource_type}/?{urlencode(params)}"
+        seen = set()
+        while url and url not in seen:
+            seen.add(url)
+            bundle = self.get_json(url)
+            yield bundle
+            url = next((link['url'] for link in bundle.get('link', []) if link.get('relation') == 'next'), None)
+
+    def concept_map_elements(self, concept_map_url):
+        """
+        Elements of every group of every ConceptMap with the given canonical URL, across all result pages
+        :param concept_map_url: str canonical URL of the ConceptMap
+        :return: generator of element dicts
+        """
+        for bundle in self.search('ConceptMap', url=concept_map_url):
+            for entry in bundle.get('entry', []):
+                for group in entry.get('resource', {}).get('group', []):
+                    yield from group.get('element', [])
@@ -1,11 +1,27 @@
-import json
-import requests
+"""FHIR ConceptMap ingest
+
+Turns LOINC part ConceptMaps on the LOINC FHIR server into OWL mapping ontologies. MappingIngest takes any number of
+ConceptMaps, each described by a ConceptMapSource with its canonical URL and the prefix of its target codes, fetches
+them concurrently on a thread pool whose requests share one rate limit, and writes one OWL file per map. The mappings
+are streamed from the FHIR elements to OWL (see sssom_owl), and the SSSOM TSV file is only written alongside when an
+SSSOM directory is given. ChebiFhirIngest is the LOINC part to ChEBI map on its own.
+
+# Example
+ingest = MappingIngest(CONCEPT_MAPS, owl_directory='./data/output/owl_component_files',
+                       sssom_directory='./data/output/sssom_mapping_files', max_workers=4, rate_limit=5)
+ingest.run()
+"""
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
 import yaml
-from requests.auth import HTTPBasicAuth
-import pandas as pd
-from sssom.io import convert_file
 from comp_loinc.ingest.source_data_utils import loincify
-from comp_loinc.mapping.mapping_utils import build_context
+from comp_loinc.mapping.mapping_utils import build_context, context_metadata
+from comp_loinc.mapping.sssom_owl import SSSOMOWLWriter
+from comp_loinc.mapping.fhir_client import FhirClient, RateLimiter
+from comp_loinc.metrics import step
+from comp_loinc.progress import track
 from pathlib import Path
 import os
 import sys
@@ -13,16 +29,81 @@ import sys
 path_root = Path(__file__).parents[3]
 sys.path.append(str(path_root))
 
+# FHIR ConceptMap equivalence to SSSOM predicate; elements with other equivalences (unmatched, disjoint) are skipped
+PREDICATE_MAP = {
+    'equal': 'skos:exactMatch',
+    'equivalent': 'skos:exactMatch',
+    'relatedto': 'skos:relatedMatch',
+    'inexact': 'skos:closeMatch',
+    'wider': 'skos:broadMatch',
+    'subsumes': 'skos:broadMatch',
+    'narrower': 'skos:narrowMatch',
+    'specializes': 'skos:narrowMatch',
+}
+SSSOM_COLUMNS = ['subject_id', 'predicate_id', 'object_id', 'object_label', 'mapping_justification']
+
+
+class ConceptMapSource(object):
+    """
+    A LOINC part ConceptMap and the namespace of its target codes
+    """
+    def __init__(self, name, url, target_prefix, target_iri):
+        """
+        :param name: str short name used in the output file names, e.g. 'chebi'
+        :param url: str canonical URL of the ConceptMap
+        :param target_prefix: str CURIE prefix of the target codes, e.g. 'CHEBI'
+        :param target_iri: str IRI the target prefix expands to
+        """
+        self.name = name
+        self.url = url
+        self.target_prefix = target_prefix
+        self.target_iri = target_iri
+
+    def __repr__(self):
+        return f"ConceptMapSource({self.name!r}, {self.url!r})"
+
+
+CHEBI_CONCEPT_MAP = ConceptMapSource('chebi', 'http://loinc.org/cm/loinc-parts-to-chebi', 'CHEBI',
+                                     'http://purl.obolibrary.org/obo/CHEBI_')
+CONCEPT_MAPS = [CHEBI_CONCEPT_MAP]
+
+
+def load_concept_maps(path):
+    """
+    Read ConceptMap sources from a YAML file holding a list of mappings with the ConceptMapSource parameters, e.g.
+    `- {name: radlex, url: 'http://loinc.org/cm/loinc-parts-to-radlex', target_prefix: RID,
+        target_iri: 'http://radlex.org/RID/'}`
+    :param path: str
+    :return: list of ConceptMapSource
+    """
+    with open(path, 'r') as f:
+        return [ConceptMapSource(**x) for x in yaml.load(f, Loader=yaml.FullLoader)]
+
 
 class Mappings(object):
-    def __init__(self, output, user=None, pwd=None):
-        self.fhir_endpoint = 'https://fhir.loinc.org'
+    def __init__(self, output, user=None, pwd=None, cache_directory=None, offline=False, transport=None,
+                 fhir_endpoint='https://fhir.loinc.org', rate_limit=None):
+        """
+        :param output: str output file name
+        :param user: str LOINC FHIR server user, read from secrets.yaml if None
+        :param pwd: str LOINC FHIR server password
+        :param cache_directory: str to the FHIR response cache, or None
+        :param offline: bool serve the FHIR requests from the response cache only
+        :param transport: optional HTTP transport, see fhir_client.FhirClient
+        :param fhir_endpoint: str FHIR server base URL
+        :param rate_limit: optional float maximum number of FHIR requests per second
+        """
+        self.fhir_endpoint = fhir_endpoint
 
         self.output = output
         self.user = user
         self.pwd = pwd
-        if self.user is None:
+        if self.user is None and not offline:
             self.secrets_import()
+        auth = (self.user, self.pwd) if self.user is not None else None
+        rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.fhir_client = FhirClient(self.fhir_endpoint, auth=auth, transport=transport,
+                                      cache_directory=cache_directory, offline=offline, rate_limiter=rate_limiter)
 
     def secrets_import(self):
         with open(os.path.join(path_root, 'secrets.yaml'), 'r') as f:
@@ -31,41 +112,123 @@ class Mappings(object):
         self.pwd = secrets['loinc']['pwd']
 
 
-class ChebiFhirIngest(Mappings):
-    def __init__(self, output, user, pwd):
-        super().__init__(output, user, pwd)
-        self.chebi_loinc_sssom = self.create_chebi_loinc_sssom()
-        self.sssom_chebi_to_owl()
+class MappingIngest(Mappings):
+    def __init__(self, concept_maps, owl_directory, sssom_directory=None, user=None, pwd=None, cache_directory=None,
+                 offline=False, transport=None, fhir_endpoint='https://fhir.loinc.org', max_workers=4,
+                 rate_limit=None):
+        """
+        :param concept_maps: list of ConceptMapSource
+        :param owl_directory: str where the OWL files, loinc2<name>.owl, are written
+        :param sssom_directory: str where the SSSOM files, loinc2<name>.tsv, are written, or None for OWL files only
+        :param max_workers: int number of ConceptMaps fetched at the same time
+        :param rate_limit: optional float maximum number of FHIR requests per second, across all workers
+        See Mappings for the other parameters.
+        """
+        super().__init__(None, user, pwd, cache_directory=cache_directory, offline=offline, transport=transport,
+                         fhir_endpoint=fhir_endpoint, rate_limit=rate_limit)
+        self.concept_maps = concept_maps
+        self.owl_directory = owl_directory
+        self.sssom_directory = sssom_directory
+        self.max_workers = max_workers
+
+    def sssom_path(self, concept_map):
+        return os.path.join(self.sssom_directory, f"loinc2{concept_map.name}.tsv")
+
+    def owl_path(self, concept_map):
+        return os.path.join(self.owl_directory, f"loinc2{concept_map.name}.owl")
+
+    def run(self):
+        """
+        Fetch all ConceptMaps concurrently and write their OWL, and SSSOM, files
+        :return: dict of ConceptMap name to its number of mappings
+        """
+        Path(self.owl_directory).mkdir(parents=True, exist_ok=True)
+        if self.sssom_directory:
+            Path(self.sssom_directory).mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            counts = dict(zip([x.name for x in self.concept_maps], executor.map(self.ingest, self.concept_maps)))
+        print(f"Wrote mappings: {', '.join(f'{name} {n}' for name, n in counts.items())}")
+        return counts
+
+    def ingest(self, concept_map):
+        """
+        Fetch one ConceptMap and stream its mappings to the OWL file, and the SSSOM file if requested. The files are
+        written to temporary paths and moved into place once the whole ConceptMap is converted, so a failed request
+        leaves the previous files, if any, rather than truncated ones.
+        :param concept_map: ConceptMapSource
+        :return: int number of mappings
+        """
+        metadata = context_metadata({'loinc': 'https://loinc.org/', concept_map.target_prefix: concept_map.target_iri},
+                                    mapping_set_id=concept_map.url)
+        mappings = track(self.sssom_mappings(concept_map, self.fhir_client.concept_map_elements(concept_map.url)),
+                         f"Converting {concept_map.name} mappings", unit='mappings')
+        owl_writer = SSSOMOWLWriter(metadata, predicates=PREDICATE_MAP.values())
+        paths = [self.owl_path(concept_map)] + ([self.sssom_path(concept_map)] if self.sssom_directory else [])
+        tmp_paths = [f"{path}.{os.getpid()}.tmp" for path in paths]
+        try:
+            with ExitStack() as stack:
+                # the ConceptMap is fetched as it is converted, so the step includes the FHIR requests
+                metrics = stack.enter_context(step('mapping_conversion', concept_map=concept_map.name))
+                if self.sssom_directory:
+                    sssom_file = stack.enter_context(open(tmp_paths[1], 'w'))
+                    sssom_file.write(build_context(metadata['curie_map'], mapping_set_id=concept_map.url))
+                    tsv = csv.writer(sssom_file, delimiter='\t', lineterminator='\n')
+                    tsv.writerow(SSSOM_COLUMNS)
+                    mappings = self.tee(mappings, tsv.writerow)
+                with open(tmp_paths[0], 'w') as owl_file:
+                    n_mappings = owl_writer.write_stream(mappings, owl_file)
+                metrics.count(mappings=n_mappings)
+        except BaseException:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+        for tmp_path, path in zip(tmp_paths, paths):
+            os.replace(tmp_path, path)
+        return n_mappings
+
+    @staticmethod
+    def tee(rows, write):
+        for row in rows:
+            write(row)
+            yield row
+
+    @staticmethod
+    def sssom_mappings(concept_map, elements):
+        """
+        :param concept_map: ConceptMapSource
+        :param elements: iterable of ConceptMap element dicts
+        :return: generator of tuples with SSSOM_COLUMNS, one per element target
+        """
+        prefix = f"{concept_map.target_prefix}:"
+        for element in elements:
+            for target in element.get('target', []):
+                predicate = PREDICATE_MAP.get(target.get('equivalence'))
+                if predicate is None:
+                    continue
+                code = target['code']
+                yield (loincify(element['code']), predicate, code if code.startswith(prefix) else prefix + code,
+                       target.get('display'), 'sempav:HumanCuration')
+
+
+class ChebiFhirIngest(MappingIngest):
+    def __init__(self, output, user, pwd, cache_directory=None, offline=False, transport=None):
+        """
+        :param output: str OWL file name in data/output/owl_component_files, or a path
+        See MappingIngest for the other parameters.
+        """
+        super().__init__([CHEBI_CONCEPT_MAP], f"{path_root}/data/output/owl_component_files",
+                         f"{path_root}/data/output/sssom_mapping_files", user, pwd, cache_directory=cache_directory,
+                         offline=offline, transport=transport)
+        self.output = output
+        self.run()
+
+    def owl_path(self, concept_map):
+        return os.path.join(self.owl_directory, self.output)
 
     def get_fhir_chebi_mappings(self):
-        r = requests.get(f"{self.fhir_endpoint}/ConceptMap/?url=http://loinc.org/cm/loinc-parts-to-chebi",
-                         auth=HTTPBasicAuth(self.user, self.pwd))
-        return r.json()
-
-    def create_chebi_loinc_sssom(self):
-        chebi_context_map = build_context({"loinc": "https://loinc.org/"})
-        chebi_loinc_fhir = self.get_fhir_chebi_mappings()
-        part_mappings = chebi_loinc_fhir['entry'][0]['resource']['group'][0]['element']
-        sssom_mappings = []
-        for part_map in part_mappings:
-            predicate_map = {
-                "equivalent": 'skos:exactMatch',
-                "relatedto": 'skos:relatedMatch'
-            }
-            sssom_obj = dict()
-
-            sssom_obj['subject_id'] = loincify(part_map['code'])
-            sssom_obj['predicate_id'] = predicate_map[part_map['target'][0]['equivalence']]
-            sssom_obj['object_id'] = part_map['target'][0]['code']
-            sssom_obj['object_label'] = part_map['target'][0]['display']
-            sssom_obj['mapping_justification'] = "sempav:HumanCuration"
-            sssom_mappings.append(sssom_obj)
-        l2c_df = pd.DataFrame(sssom_mappings)
-
-        with open(f"{path_root}/data/output/sssom_mapping_files/loinc2chebi.tsv", 'w') as lc:
-            lc.write(chebi_context_map)
-            l2c_df.to_csv(lc, sep="\t", index=False)
-
-    def sssom_chebi_to_owl(self):
-        with open(f"{path_root}/data/output/owl_component_files/{self.output}", 'w') as l2co:
-            convert_file(f"{path_root}/data/output/sssom_mapping_files/loinc2chebi.tsv", output=l2co, output_format='owl')
+        """
+        Fetch the LOINC part to ChEBI ConceptMap elements, from all result pages, entries and groups
+        :return: list of element dicts
+        """
+        return list(self.fhir_client.concept_map_elements(CHEBI_CONCEPT_MAP.url))
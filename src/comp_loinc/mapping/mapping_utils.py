@@ -2,8 +2,8 @@ import yaml
 import textwrap
 
 
-def build_context(prefix_set=None):
-    """Build context for SSSOM files."""
+def context_metadata(prefix_set=None, mapping_set_id=None):
+    """Mapping set metadata, including the curie_map, for SSSOM files."""
     cmap = {
         "curie_map": {
             "linkml": "https://w3id.org/linkml/",
@@ -18,5 +18,12 @@ def build_context(prefix_set=None):
 
     if prefix_set is not None:
         cmap['curie_map'].update(prefix_set)
-    cmap_yml = yaml.dump(cmap)
+    if mapping_set_id is not None:
+        cmap['mapping_set_id'] = mapping_set_id
+    return cmap
+
+
+def build_context(prefix_set=None, mapping_set_id=None):
+    """Build context for SSSOM files."""
+    cmap_yml = yaml.dump(context_metadata(prefix_set, mapping_set_id))
     return "".join([f"#{x}" for x in cmap_yml.splitlines(True)])
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""SSSOM to OWL
+
+Writes SSSOM mappings straight to OWL functional syntax (OFN), one mapping at a time, without the SSSOM TSV and
+`sssom.io.convert_file` round trip. Like sssom-py's OWL output, each mapping becomes an annotation assertion of its
+predicate between the subject and object, annotated with the mapping's justification and object label.
+
+# Example
+writer = SSSOMOWLWriter(context_metadata({'loinc': 'https://loinc.org/'}))
+with open('./data/output/owl_component_files/loinc2chebi.owl', 'w') as f:
+    writer.write_stream(mappings, f)
+"""
+OWL_PREFIXES = {
+    'owl': 'http://www.w3.org/2002/07/owl#',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+    'sssom': 'https://w3id.org/sssom/',
+}
+MAPPING_ANNOTATIONS = ['sssom:mapping_justification', 'sssom:object_label']
+
+
+class SSSOMOWLWriter(object):
+    """
+    Streaming OWL functional syntax writer for SSSOM mappings
+    """
+    def __init__(self, metadata, predicates=()):
+        """
+        :param metadata: dict of mapping set metadata with a curie_map and mapping_set_id, see
+        mapping_utils.context_metadata
+        :param predicates: CURIEs of the mapping predicates, declared as annotation properties
+        """
+        self.curie_map = {**OWL_PREFIXES, **metadata['curie_map']}
+        self.ontology_iri = metadata['mapping_set_id']
+        self.predicates = sorted(set(predicates))
+
+    def write_stream(self, mappings, output):
+        """
+        Write mappings to an open text file handle
+        :param mappings: iterable of (subject_id, predicate_id, object_id, object_label, mapping_justification)
+        :param output: text file handle
+        :return: int number of mappings written
+        """
+        n_mappings = 0
+        for prefix, iri in self.curie_map.items():
+            output.write(f"Prefix( {prefix}: = <{iri}> )\n")
+        output.write(f"\nOntology( <{self.ontology_iri}>")
+        for curie in self.predicates + MAPPING_ANNOTATIONS:
+            output.write(f"\n    Declaration( AnnotationProperty( {curie} ) )")
+        for mapping in mappings:
+            output.write(f"\n    {self.axiom(*mapping)}")
+            n_mappings += 1
+        output.write("\n)\n")
+        return n_mappings
+
+    def axiom(self, subject_id, predicate_id, object_id, object_label, mapping_justification):
+        """
+        :return: str OFN annotation assertion of one mapping
+        """
+        annotations = f"Annotation( sssom:mapping_justification {self.iri(mapping_justification)} ) "
+        if object_label is not None:
+            annotations += f"Annotation( sssom:object_label {self.literal(object_label)} ) "
+        return f"AnnotationAssertion( {annotations}{predicate_id} {self.iri(subject_id)} {self.iri(object_id)} )"
+
+    def iri(self, curie):
+        """
+        Expand a CURIE with the curie_map to a full IRI, so that any local identifier is valid
+        :param curie: str CURIE, or IRI
+        :return: str
+        """
+        prefix, sep, local_id = curie.partition(':')
+        if sep and prefix in self.curie_map:
+            return f"<{self.curie_map[prefix]}{local_id}>"
+        return f"<{curie}>"
+
+    @staticmethod
+    def literal(value):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        return f'"{escaped}"'
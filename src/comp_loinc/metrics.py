@@ -0,0 +1,244 @@
+"""Metrics
+
+Records the wall time, CPU time, peak RSS and item counts of pipeline stages and of the steps inside them, such as
+reading a release table, building classes, writing OWL or running ROBOT, so throughput can be compared across releases
+and commits. A stage is opened around a whole stage build; `step` can be used anywhere in the ingest code and records
+into the innermost open stage of the process, or only times the step when there is none.
+
+CPU time is the process's user and system time, so it includes every thread of the process; the CPU time of
+subprocesses that finished during a step, ROBOT for example, is recorded separately. Peak RSS is the high-water mark
+of the process at the end of a step or stage, not of that step alone: a process that runs several stages carries its
+peak over from one to the next.
+
+A stage can also be profiled, with cProfile, written as a `.prof` file for pstats or snakeviz alongside the slowest
+functions by cumulative time, or with tracemalloc, recording peak traced memory and the lines that allocated most.
+Only the stage's own process is profiled, not the worker processes it starts.
+
+# Example
+with stage('codes', profile='cprofile', profile_path='./data/output/metrics.codes.prof') as codes_metrics:
+    with step('csv_read', file='Loinc.csv') as read_metrics:
+        loinc_df = read_release_table(...)
+        read_metrics.count(rows=len(loinc_df))
+write_metrics('./data/output/metrics.json', [codes_metrics.as_dict()])
+"""
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ('cprofile', 'tracemalloc')
+TOP_ENTRIES = 10
+
+# open stages of this process, innermost last
+open_stages = []
+
+
+def max_rss_mb(who):
+    """
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return: float MB, or None where the resource module is unavailable
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def peak_rss_mb():
+    """
+    peak resident set size of the current process in MB, or None where the resource module is unavailable
+    :return: float
+    """
+    return max_rss_mb(resource.RUSAGE_SELF) if resource else None
+
+
+def child_cpu_seconds():
+    """
+    :return: float user and system time of the subprocesses that have finished and been waited for, or 0.0 where the
+    resource module is unavailable
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StepMetrics(object):
+    """
+    Wall time, CPU time, peak RSS and counts of one step
+    """
+    def __init__(self, name, attributes=None):
+        """
+        :param name: str step name, e.g. 'csv_read'
+        :param attributes: dict of values describing the step, e.g. the file read
+        """
+        self.name = name
+        self.attributes = attributes or {}
+        self.counts = {}
+        self.wall_s = self.cpu_s = self.child_cpu_s = None
+        self.peak_rss_mb = None
+        self.started = None
+
+    def count(self, **counts):
+        """
+        Record item counts, e.g. count(rows=47000)
+        """
+        self.counts.update(counts)
+
+    def start(self):
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self._start = (time.perf_counter(), time.process_time(), child_cpu_seconds())
+
+    def stop(self):
+        wall, cpu, child_cpu = self._start
+        self.wall_s = round(time.perf_counter() - wall, 4)
+        self.cpu_s = round(time.process_time() - cpu, 4)
+        self.child_cpu_s = round(child_cpu_seconds() - child_cpu, 4)
+        self.peak_rss_mb = peak_rss_mb()
+
+    def as_dict(self):
+        return dict(step=self.name, **self.attributes, started=self.started, wall_s=self.wall_s, cpu_s=self.cpu_s,
+                    child_cpu_s=self.child_cpu_s, peak_rss_mb=self.peak_rss_mb, counts=self.counts)
+
+
+class StageMetrics(StepMetrics):
+    """
+    Metrics of one stage: its own totals, its steps and, if it was profiled, the profile summary
+    """
+    def __init__(self, name, attributes=None):
+        super().__init__(name, attributes)
+        self.steps = []
+        self.profile = None
+        self.pid = os.getpid()
+        self.child_peak_rss_mb = None
+
+    def stop(self):
+        super().stop()
+        self.child_peak_rss_mb = max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+
+    def as_dict(self):
+        metrics = super().as_dict()
+        metrics['stage'] = metrics.pop('step')
+        metrics.update(pid=self.pid, child_peak_rss_mb=self.child_peak_rss_mb,
+                       steps=[x.as_dict() for x in self.steps])
+        if self.profile:
+            metrics['profile'] = self.profile
+        return metrics
+
+
+@contextmanager
+def step(name, **attributes):
+    """
+    Record a step in the innermost open stage
+    :param name: str step name
+    :param attributes: values describing the step, written with its metrics
+    :return: context manager yielding StepMetrics
+    """
+    metrics = StepMetrics(name, attributes)
+    if open_stages:
+        open_stages[-1].steps.append(metrics)
+    metrics.start()
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+
+
+@contextmanager
+def stage(name, profile=None, profile_path=None):
+    """
+    Record a stage, and the steps run in it
+    :param name: str stage name
+    :param profile: None, 'cprofile' or 'tracemalloc'
+    :param profile_path: str where the cProfile stats are written, or None to keep only the summary
+    :return: context manager yielding StageMetrics
+    """
+    if profile not in (None,) + PROFILERS:
+        raise ValueError(f"Unknown profiler {profile}, expected one of {', '.join(PROFILERS)}")
+    metrics = StageMetrics(name)
+    open_stages.append(metrics)
+    profiler = None
+    started_tracing = False
+    if profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    elif profile == 'tracemalloc':
+        tracemalloc.reset_peak()
+    metrics.start()
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+        open_stages.remove(metrics)
+        if profiler:
+            profiler.disable()
+            metrics.profile = cprofile_summary(profiler, profile_path)
+        elif profile == 'tracemalloc':
+            metrics.profile = tracemalloc_summary()
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def cprofile_summary(profiler, profile_path=None):
+    """
+    :param profiler: cProfile.Profile
+    :param profile_path: str where the stats are written, or None
+    :return: dict with the slowest functions by cumulative time
+    """
+    if profile_path:
+        profiler.dump_stats(profile_path)
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_ENTRIES]
+    return {
+        'profiler': 'cprofile',
+        'path': profile_path,
+        'top_cumulative': [{'function': f"{path}:{line}({function})", 'calls': calls, 'total_s': round(total, 4),
+                            'cumulative_s': round(cumulative, 4)}
+                           for (path, line, function), (_, calls, total, cumulative, _) in top],
+    }
+
+
+def tracemalloc_summary():
+    """
+    :return: dict with the current and peak traced memory and the lines that allocated most of the current memory
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    statistics = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ENTRIES]
+    return {
+        'profiler': 'tracemalloc',
+        'current_mb': round(current / 2 ** 20, 2),
+        'peak_mb': round(peak / 2 ** 20, 2),
+        'top_allocations': [{'location': str(x.traceback[0]), 'size_mb': round(x.size / 2 ** 20, 3),
+                             'blocks': x.count} for x in statistics],
+    }
+
+
+def write_metrics(path, stages, **run):
+    """
+    Write stage metrics as JSON
+    :param path: str
+    :param stages: list of StageMetrics.as_dict() dicts
+    :param run: values describing the run, e.g. jobs
+    """
+    metrics = dict(created=datetime.datetime.now().isoformat(timespec='seconds'), python=sys.version.split()[0],
+                   **run, stages=stages)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+    os.replace(tmp_path, path)
@@ -0,0 +1,189 @@
+"""OWL merge
+
+Merges the OWL functional syntax (OFN) component ontologies into one ontology without ROBOT. OFN is line oriented: the
+CompLOINC writers put every axiom on its own line, or on consecutive lines for nested expressions, so the files are
+streamed one axiom at a time instead of being loaded into an OWL API model. Axioms are written to the merged ontology
+in one pass, in file order, skipping any seen before; seen axioms are kept as 64-bit hashes of their text, so the
+memory held for deduplication does not grow with axiom length.
+
+The merged ontology has the union of the files' prefixes and the IRI of the first file's ontology. As with ROBOT's
+merge, ontology annotations are not carried over. Files in other serializations, and ontologies with imports, are
+merged with ROBOT instead.
+
+# Example
+merge_ofn(sorted(glob('./data/output/owl_component_files/*.owl')), './data/output/merged_loinc.owl', workers=4)
+"""
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from comp_loinc.progress import track
+
+PREFIX_PATTERN = re.compile(r'Prefix\(\s*([^\s:]*):\s*=\s*<([^>]*)>\s*\)')
+
+
+class OFNSyntaxError(ValueError):
+    """A file is not in OWL functional syntax, or uses constructs the native merge does not handle"""
+
+
+def scan(line, depth, in_string):
+    """
+    Track the parenthesis depth of OFN text, skipping quoted literals and IRIs
+    :param line: str
+    :param depth: int depth before line
+    :param in_string: bool whether line starts inside a quoted literal
+    :return: tuple of int depth and bool in_string after line
+    """
+    if not in_string and '"' not in line and '<' not in line:
+        return depth + line.count('(') - line.count(')'), False
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if in_string:
+            if char == '\\':
+                i += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '<':
+            end = line.find('>', i)
+            i = len(line) if end == -1 else end
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        i += 1
+    return depth, in_string
+
+
+def read_header(path):
+    """
+    Read the prefixes and the ontology IRI of an OFN file, stopping at the Ontology( line
+    :param path: str
+    :return: tuple of dict prefix name to IRI, and str ontology IRI, with version IRI if any, or '' if there is none
+    """
+    prefixes = {}
+    with open(path) as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith('Prefix('):
+                match = PREFIX_PATTERN.match(stripped)
+                if match is None:
+                    raise OFNSyntaxError(f"{path}: malformed prefix declaration {stripped}")
+                prefixes[match.group(1)] = match.group(2)
+            elif stripped.startswith('Ontology('):
+                iri = stripped[len('Ontology('):]
+                if scan(stripped, 0, False)[0] == 0:
+                    iri = iri[:iri.rindex(')')]
+                return prefixes, iri.strip()
+            else:
+                raise OFNSyntaxError(f"{path} is not in OWL functional syntax; merge it with ROBOT")
+    raise OFNSyntaxError(f"{path} has no Ontology declaration")
+
+
+def read_axioms(path):
+    """
+    Stream the axioms of an OFN file
+    :param path: str
+    :return: generator of str axioms, without indentation on their first line or a trailing newline
+    """
+    with open(path) as f:
+        for line in f:
+            if line.lstrip().startswith('Ontology('):
+                depth, in_string = scan(line, 0, False)
+                break
+        else:
+            raise OFNSyntaxError(f"{path} has no Ontology declaration")
+        buffer = []
+        for line in f:
+            if depth == 0:
+                if line.strip():
+                    raise OFNSyntaxError(f"{path}: unexpected text after the ontology")
+                continue
+            if not buffer:
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                if stripped == ')':
+                    depth = 0
+                    continue
+                if stripped.startswith('Import('):
+                    raise OFNSyntaxError(f"{path} has imports; merge it with ROBOT")
+            buffer.append(line)
+            depth, in_string = scan(line, depth, in_string)
+            if depth > 1 or in_string:
+                continue
+            axiom = ''.join(buffer).strip()
+            buffer = []
+            if depth == 0:
+                # the ontology's closing parenthesis on the axiom's last line
+                axiom = axiom[:-1].rstrip()
+            if not axiom.startswith('Annotation('):
+                yield axiom
+        if buffer or depth:
+            raise OFNSyntaxError(f"{path} ends inside {'an axiom' if buffer else 'the ontology'}")
+
+
+def read_axiom_list(path):
+    """read_axioms as a list, for worker processes"""
+    return list(read_axioms(path))
+
+
+def axiom_hash(axiom):
+    return int.from_bytes(hashlib.blake2b(axiom.encode(), digest_size=8).digest(), 'little')
+
+
+def merge_ofn(paths, output_path, workers=1):
+    """
+    Merge OFN files into one ontology
+    :param paths: list of str paths to OFN files; the merged ontology gets the first one's IRI
+    :param output_path: str
+    :param workers: int number of processes parsing files at the same time; with 1, files are streamed in-process
+    :return: dict with the number of files, axioms written and duplicate axioms skipped
+    """
+    if not paths:
+        raise ValueError("No OWL files to merge")
+    prefixes = {}
+    headers = [read_header(path) for path in paths]
+    for path, (file_prefixes, _) in zip(paths, headers):
+        for name, iri in file_prefixes.items():
+            if prefixes.setdefault(name, iri) != iri:
+                raise OFNSyntaxError(f"{path} binds prefix {name}: to <{iri}>, another file to <{prefixes[name]}>; "
+                                     f"merge with ROBOT")
+    seen = set()
+    n_axioms = n_duplicates = 0
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as output:
+            for name, iri in prefixes.items():
+                output.write(f"Prefix( {name}: = <{iri}> )\n")
+            output.write(f"\nOntology( {headers[0][1]}")
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=min(workers, len(paths)))
+                file_axioms = executor.map(read_axiom_list, paths)
+            else:
+                executor = None
+                file_axioms = (read_axioms(path) for path in paths)
+            try:
+                for axioms in track(file_axioms, 'Merging', total=len(paths), unit='files'):
+                    for axiom in axioms:
+                        key = axiom_hash(axiom)
+                        if key in seen:
+                            n_duplicates += 1
+                            continue
+                        seen.add(key)
+                        output.write(f"\n    {axiom}")
+                        n_axioms += 1
+            finally:
+                if executor:
+                    executor.shutdown()
+            output.write("\n)" if n_axioms else " )")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return {'files': len(paths), 'axioms': n_axioms, 'duplicates': n_duplicates}
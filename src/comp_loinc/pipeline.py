@@ -0,0 +1,235 @@
+"""Pipeline scheduler
+
+Runs the pipeline as a graph of stages. Each stage declares its input and output paths, and a stage depends on every
+stage with an output at or under one of its inputs, so producers that only meet at merge (parts, codes, composed
+classes and mappings) run side by side while merge and reason wait for them. Up to `jobs` stages run at the same time
+in a process pool; with jobs=1 they run one after another in-process, in dependency order.
+
+Every stage is checked against the build manifest when it becomes ready, so with incremental=True a stage whose
+inputs, including the outputs of the stages before it, are unchanged is reused instead of built; stages marked
+always_run, whose real inputs are not files, are built every time. When the run ends
+the wall time of each stage and the critical path, the chain of dependent stages that took the longest, are printed.
+
+With metrics_out, the metrics of every stage that was built, with the steps recorded in it, are written as JSON when
+the run ends, see comp_loinc.metrics; each stage can also be profiled with cProfile or tracemalloc.
+
+# Example
+stages = [Stage('parts', build_part_ontology, {...}, inputs=[part_directory], outputs=[part_owl]),
+          Stage('merge', merge_owl, {...}, inputs=[owl_directory], outputs=[merged_owl])]
+run_stages(stages, BuildManifest('./data/output/build_manifest.json'), jobs=4,
+           metrics_out='./data/output/metrics.json', profile='cprofile')
+"""
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from comp_loinc.build_manifest import tool_versions
+from comp_loinc.metrics import stage as record_stage, write_metrics
+
+
+class PipelineError(Exception):
+    """One or more pipeline stages failed"""
+
+
+class Stage(object):
+    """
+    One pipeline stage: a module level function called with keyword arguments, so that it can run in a worker
+    process, and the paths it reads and writes
+    """
+    def __init__(self, name, build, kwargs, inputs, outputs, options=None, tools=None, always_run=False):
+        """
+        :param name: str stage name, also its build manifest entry
+        :param build: module level function that runs the stage
+        :param kwargs: dict of keyword arguments for build
+        :param inputs: list of str input files or directories
+        :param outputs: list of str output files
+        :param options: dict of the options that affect the output, see BuildManifest.stage_key
+        :param tools: dict from tool_versions
+        :param always_run: bool build the stage even when it is current in the build manifest, for stages that read
+        inputs the manifest cannot hash, such as a remote server
+        """
+        self.name = name
+        self.build = build
+        self.kwargs = kwargs
+        self.inputs = inputs
+        self.outputs = outputs
+        self.options = options or {}
+        self.tools = tools or tool_versions()
+        self.always_run = always_run
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def stage_dependencies(stages):
+    """
+    :param stages: list of Stage
+    :return: dict of stage name to the set of names of the stages it depends on
+    """
+    producers = [(os.path.abspath(output), stage.name) for stage in stages for output in stage.outputs]
+    dependencies = {stage.name: set() for stage in stages}
+    for stage in stages:
+        for path in map(os.path.abspath, stage.inputs):
+            dependencies[stage.name].update(
+                producer for output, producer in producers
+                if producer != stage.name and (output == path or output.startswith(path + os.sep)))
+    return dependencies
+
+
+def topological_order(stages, dependencies):
+    """
+    Stages in dependency order, keeping the given order among independent stages
+    :return: list of Stage
+    :raises ValueError: on a dependency cycle
+    """
+    ordered = []
+    done = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if dependencies[stage.name] <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages {', '.join(stage.name for stage in remaining)}")
+        ordered.extend(ready)
+        done.update(stage.name for stage in ready)
+        remaining = [stage for stage in remaining if stage.name not in done]
+    return ordered
+
+
+def critical_path(stages, dependencies, wall_times):
+    """
+    The chain of dependent stages with the longest total wall time
+    :param wall_times: dict of stage name to seconds; stages that did not run count as 0
+    :return: tuple of list of stage names and float total seconds
+    """
+    finish = {}
+    previous = {}
+    for stage in topological_order(stages, dependencies):
+        before = max(dependencies[stage.name], key=lambda name: finish[name], default=None)
+        previous[stage.name] = before
+        finish[stage.name] = wall_times.get(stage.name, 0.0) + (finish[before] if before else 0.0)
+    if not finish:
+        return [], 0.0
+    name = max(finish, key=finish.get)
+    total = finish[name]
+    path = []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return path[::-1], total
+
+
+def timed_build(name, build, kwargs, profile=None, profile_path=None):
+    """
+    Run a stage build, in the worker process when there is one, recording its metrics
+    :param name: str stage name
+    :param profile: None, 'cprofile' or 'tracemalloc', see metrics.stage
+    :param profile_path: str where the cProfile stats are written, or None
+    :return: dict of the stage metrics, see metrics.StageMetrics.as_dict
+    """
+    with record_stage(name, profile, profile_path) as metrics:
+        build(**kwargs)
+    return metrics.as_dict()
+
+
+def stage_profile_path(metrics_out, name):
+    """The cProfile stats file of a stage, next to the metrics file"""
+    return f"{os.path.splitext(metrics_out)[0]}.{name}.prof"
+
+
+def run_stages(stages, build_manifest, jobs=1, incremental=False, metrics_out=None, profile=None):
+    """
+    Run the stages in dependency order, up to jobs at a time
+    :param stages: list of Stage
+    :param build_manifest: BuildManifest the stages are checked against and recorded in
+    :param jobs: int maximum number of stages running at the same time
+    :param incremental: bool reuse stages that are current in the build manifest, except those marked always_run
+    :param metrics_out: str where the stage metrics are written as JSON, or None
+    :param profile: None, 'cprofile' or 'tracemalloc' to profile each stage that is built; cProfile stats are written
+    next to metrics_out as <name>.<stage>.prof
+    :return: dict of stage name to wall time in seconds, for the stages that were built
+    :raises PipelineError: after the stages that could still run have finished, if any stage failed
+    """
+    dependencies = stage_dependencies(stages)
+    pending = topological_order(stages, dependencies)
+    wall_times = {}
+    metrics = []
+    done = set()
+    failed = set()
+    skipped = []
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+    def build_args(stage):
+        return (stage.name, stage.build, stage.kwargs, profile,
+                stage_profile_path(metrics_out, stage.name) if metrics_out and profile == 'cprofile' else None)
+
+    def finish(stage, key, result=None, error=None):
+        if error is not None:
+            print(f"Stage {stage.name} failed:\n{''.join(traceback.format_exception(error))}")
+            failed.add(stage.name)
+            return
+        build_manifest.record(stage.name, key, stage.outputs)
+        build_manifest.rebuilt.append(stage.name)
+        metrics.append(result)
+        wall_times[stage.name] = result['wall_s']
+        done.add(stage.name)
+        print(f"Finished {stage.name} in {result['wall_s']:.1f}s")
+
+    try:
+        while pending or running:
+            for stage in list(pending):
+                if dependencies[stage.name] & (failed | set(skipped)):
+                    pending.remove(stage)
+                    skipped.append(stage.name)
+                    continue
+                if not dependencies[stage.name] <= done or (executor and len(running) >= jobs):
+                    continue
+                pending.remove(stage)
+                key = build_manifest.stage_key(stage.inputs, stage.options, stage.tools)
+                if incremental and not stage.always_run and build_manifest.is_current(stage.name, key):
+                    print(f"Reusing {stage.name}: inputs, options and tools unchanged since "
+                          f"{build_manifest.stages[stage.name]['finished']}")
+                    build_manifest.reused.append(stage.name)
+                    done.add(stage.name)
+                elif executor:
+                    print(f"Starting {stage.name}")
+                    running[executor.submit(timed_build, *build_args(stage))] = (stage, key)
+                else:
+                    print(f"Starting {stage.name}")
+                    try:
+                        finish(stage, key, timed_build(*build_args(stage)))
+                    except Exception as e:
+                        finish(stage, key, error=e)
+            if running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, key = running.pop(future)
+                    if future.exception() is not None:
+                        finish(stage, key, error=future.exception())
+                    else:
+                        finish(stage, key, future.result())
+    finally:
+        if executor:
+            executor.shutdown()
+
+    print_timings(stages, dependencies, wall_times)
+    if metrics_out:
+        path, total = critical_path(stages, dependencies, wall_times)
+        write_metrics(metrics_out, metrics, jobs=jobs, incremental=incremental, profile=profile,
+                      reused=[x.name for x in stages if x.name in build_manifest.reused], failed=sorted(failed),
+                      skipped=skipped, critical_path={'stages': path, 'wall_s': round(total, 4)})
+        print(f"Wrote stage metrics to {metrics_out}")
+    if failed:
+        raise PipelineError(f"Stages failed: {', '.join(sorted(failed))}; not run: {', '.join(skipped) or 'none'}")
+    return wall_times
+
+
+def print_timings(stages, dependencies, wall_times):
+    """
+    Print the wall time of each stage that was built, and the critical path
+    """
+    print("Stage wall times: " + (', '.join(f"{stage.name} {wall_times[stage.name]:.1f}s" for stage in stages
+                                            if stage.name in wall_times) or 'none'))
+    path, total = critical_path(stages, dependencies, wall_times)
+    print(f"Critical path: {' -> '.join(path)} ({total:.1f}s)")
@@ -0,0 +1,129 @@
+"""Progress reporting
+
+Reports the progress of long loops without slowing them down or flooding logs. `Progress.update` only counts items
+until a check is due: the clock is read once every `every` items, a stride that by default adapts to the loop's rate so
+that it is read a few times per report interval, and a report is written at most once per interval. On a terminal the
+report is one line rewritten in place, every `interval` seconds; when the output is not a terminal, as in CI logs, a
+full line is written every `log_interval` seconds instead. Reports give the items done, items per second and, when the
+total is known, the percentage and ETA. A closing line with the count, time and rate is written when the loop ends.
+
+# Example
+for params in track(part_params, 'Building part classes'):
+    ...
+with Progress('Merging', unit='axioms') as progress:
+    for axiom in axioms:
+        progress.update()
+"""
+import sys
+import time
+
+
+def format_seconds(seconds):
+    """:return: str e.g. '42s', '3m05s' or '1h02m'"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Progress(object):
+    """
+    Throttled progress of one loop
+    """
+    def __init__(self, description, total=None, unit='items', interval=0.5, log_interval=30.0, every=None,
+                 stream=None):
+        """
+        :param description: str what is being done, e.g. 'Writing code_classes.owl'
+        :param total: int number of items expected, or None if unknown
+        :param unit: str name of the items
+        :param interval: float minimum seconds between reports on a terminal
+        :param log_interval: float minimum seconds between report lines when the output is not a terminal
+        :param every: int number of items between clock reads, or None to adapt it to the rate
+        :param stream: text stream written to, sys.stdout by default
+        """
+        self.description = description
+        self.total = total
+        self.unit = unit
+        self.stream = stream or sys.stdout
+        self.tty = getattr(self.stream, 'isatty', lambda: False)()
+        self.interval = interval if self.tty else log_interval
+        self.every = every
+        self.count = 0
+        self.next_check = every or 1
+        self.start = self.last_report = time.perf_counter()
+        self.reported = False
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, n=1):
+        """
+        Count n more items done
+        """
+        self.count += n
+        if self.count >= self.next_check:
+            self.check()
+
+    def check(self):
+        now = time.perf_counter()
+        elapsed = now - self.start
+        stride = self.every or max(1, int(self.count / elapsed * self.interval / 4) if elapsed > 0 else 1)
+        self.next_check = self.count + stride
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(self.status(elapsed))
+
+    def status(self, elapsed):
+        """
+        :param elapsed: float seconds since the start
+        :return: str report of the progress so far
+        """
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        if not self.total:
+            return f"{self.description}: {self.count} {self.unit}, {rate:.0f} {self.unit}/s"
+        eta = f", ETA {format_seconds((self.total - self.count) / rate)}" if rate and self.count < self.total else ''
+        return (f"{self.description}: {self.count}/{self.total} {self.unit} ({100 * self.count / self.total:.0f}%), "
+                f"{rate:.0f} {self.unit}/s{eta}")
+
+    def report(self, line):
+        if self.tty:
+            self.stream.write(f"\r{line}\033[K")
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+        self.reported = True
+
+    def close(self):
+        """
+        Write the closing line
+        """
+        if self.closed:
+            return
+        self.closed = True
+        elapsed = time.perf_counter() - self.start
+        rate = f" ({self.count / elapsed:.0f} {self.unit}/s)" if elapsed > 0 else ''
+        line = f"{self.description}: {self.count} {self.unit} in {elapsed:.1f}s{rate}"
+        self.stream.write(f"\r{line}\033[K\n" if self.tty and self.reported else f"{line}\n")
+        self.stream.flush()
+
+
+def track(iterable, description, total=None, **kwargs):
+    """
+    Iterate with progress reports, see Progress for the keyword arguments
+    :param iterable: iterable of items
+    :param description: str
+    :param total: int number of items, len(iterable) by default when it has one
+    :return: generator of the items
+    """
+    if total is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+    with Progress(description, total, **kwargs) as progress:
+        for item in iterable:
+            yield item
+            progress.update()
@@ -0,0 +1,84 @@
+"""Release workspaces
+
+Per-release data and output directories, so that several LOINC releases can be built side by side. The workspace of
+release `2.74` is `<data directory>/releases/2.74`:
+
+    releases/2.74/code_files/        Loinc.csv, LoincPartLink_Primary.csv and included_codes.tsv of the release
+    releases/2.74/part_files/        optional; the shared part files are used when it does not exist
+    releases/2.74/output/            the pipeline outputs and build manifest, laid out as in the shared data directory
+
+The parsed release table cache stays shared: its entries are keyed by file content, so releases with identical input
+files reuse each other's entries.
+
+# Example
+paths = release_paths(DEFAULTS, DATA_DIR, '2.74')
+prepare_release_workspace(paths, '2.74', DEFAULTS['release_directory'], DEFAULTS['code_directory'])
+"""
+import os
+import shutil
+
+
+# DEFAULTS keys of the per-release outputs, and their path relative to the workspace output directory
+OUTPUT_PATHS = {
+    'output.parts': ('owl_component_files', 'part_ontology.owl'),
+    'output.codes': ('owl_component_files', 'code_classes.owl'),
+    'output.composed': ('owl_component_files', 'composed_component_classes.owl'),
+    'output.merge': ('merged_loinc.owl',),
+    'output.reason': ('merged_reasoned_loinc.owl',),
+    'output.delta_report': ('release_changes.tsv',),
+    'owl_directory': ('owl_component_files',),
+    'sssom_directory': ('sssom_mapping_files',),
+    'merged_owl': ('merged_loinc.owl',),
+    'manifest': ('build_manifest.json',),
+}
+
+
+def workspace_directory(data_directory, release):
+    """
+    :param data_directory: str to the shared data directory
+    :param release: str LOINC release version, e.g. '2.74'
+    :return: str
+    """
+    return os.path.join(data_directory, 'releases', release)
+
+
+def release_paths(defaults, data_directory, release):
+    """
+    The pipeline paths of a release workspace
+    :param defaults: dict of the shared pipeline paths and options, main.DEFAULTS
+    :param data_directory: str to the shared data directory
+    :param release: str LOINC release version
+    :return: dict with the keys of defaults
+    """
+    workspace = workspace_directory(data_directory, release)
+    paths = dict(defaults)
+    paths.update({key: os.path.join(workspace, 'output', *parts) for key, parts in OUTPUT_PATHS.items()})
+    paths['code_directory'] = os.path.join(workspace, 'code_files')
+    if os.path.isdir(os.path.join(workspace, 'part_files')):
+        paths['part_directory'] = os.path.join(workspace, 'part_files')
+    return paths
+
+
+def prepare_release_workspace(paths, release, release_directory, shared_code_directory, cache_directory=None):
+    """
+    Create the workspace directories and fill in the code files: Loinc.csv and LoincPartLink_Primary.csv are read out
+    of the release's zip in release_directory unless they are already there, and included_codes.tsv is copied from
+    the shared code directory unless the workspace has its own.
+    :param paths: dict from release_paths
+    :param release: str LOINC release version
+    :param release_directory: str to the directory holding the release zips
+    :param shared_code_directory: str to the shared code file directory
+    :param cache_directory: str to the release table cache, or None
+    """
+    code_directory = paths['code_directory']
+    os.makedirs(code_directory, exist_ok=True)
+    os.makedirs(paths['owl_directory'], exist_ok=True)
+    os.makedirs(paths['sssom_directory'], exist_ok=True)
+    if not all(os.path.exists(os.path.join(code_directory, x)) for x in ['Loinc.csv', 'LoincPartLink_Primary.csv']):
+        from comp_loinc.ingest.load_loinc_release import LoadLoincRelease
+
+        LoadLoincRelease(release_directory, code_directory=code_directory, release=release,
+                         cache_directory=cache_directory)
+    included_codes = os.path.join(code_directory, 'included_codes.tsv')
+    if not os.path.exists(included_codes):
+        shutil.copy(os.path.join(shared_code_directory, 'included_codes.tsv'), included_codes)
@@ -0,0 +1,108 @@
+"""Unit tests: build manifest"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from comp_loinc.build_manifest import BuildManifest, schema_files
+from comp_loinc.pipeline import Stage, run_stages
+
+
+def transform_file(source, output, transform):
+    with open(source) as f:
+        text = transform(f.read())
+    with open(output, 'w') as f:
+        f.write(text)
+
+
+def exclaim(text):
+    return text + '!'
+
+
+class BuildManifestTests(unittest.TestCase):
+    """Incremental builds reuse a stage only when its inputs, options, tools and outputs are unchanged"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.work_dir, 'build_manifest.json')
+        self.source = self.path('source.tsv')
+        self.stage_output = self.path('stage.owl')
+        self.downstream_output = self.path('downstream.owl')
+        self.write(self.source, 'a')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def run_pipeline(self, incremental=True, option='x', transform=str.upper):
+        """Two stage pipeline; returns the names of the stages that were built"""
+        manifest = BuildManifest(self.manifest_path)
+        stages = [
+            Stage('stage', transform_file, dict(source=self.source, output=self.stage_output, transform=transform),
+                  inputs=[self.source], outputs=[self.stage_output], options={'option': option},
+                  tools={'tool': '1'}),
+            Stage('downstream', transform_file, dict(source=self.stage_output, output=self.downstream_output,
+                                                     transform=exclaim),
+                  inputs=[self.stage_output], outputs=[self.downstream_output], tools={'tool': '1'}),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_stages(stages, manifest, incremental=incremental)
+        return manifest.rebuilt
+
+    def test_unchanged_stages_are_reused(self):
+        self.assertEqual(self.run_pipeline(), ['stage', 'downstream'])
+        self.assertEqual(self.run_pipeline(), [])
+        self.assertEqual(self.run_pipeline(incremental=False), ['stage', 'downstream'])
+
+    def test_changed_input_rebuilds_stage_and_downstream(self):
+        self.run_pipeline()
+        self.write(self.source, 'b')
+        self.assertEqual(self.run_pipeline(), ['stage', 'downstream'])
+
+    def test_identical_upstream_output_reuses_downstream(self):
+        """A rebuilt stage that writes the same output does not rebuild the stages after it"""
+        self.run_pipeline(transform=str.upper)
+        self.write(self.source, 'A')
+        self.assertEqual(self.run_pipeline(transform=str.upper), ['stage'])
+
+    def test_changed_option_rebuilds(self):
+        self.run_pipeline(option='x')
+        self.assertEqual(self.run_pipeline(option='y'), ['stage'])
+
+    def test_modified_or_missing_output_rebuilds(self):
+        self.run_pipeline()
+        self.write(self.downstream_output, 'edited')
+        self.assertEqual(self.run_pipeline(), ['downstream'])
+        os.remove(self.downstream_output)
+        self.assertEqual(self.run_pipeline(), ['downstream'])
+
+    def test_file_hashes_reused_for_unchanged_files(self):
+        manifest = BuildManifest(self.manifest_path)
+        sha = manifest.file_hash(self.source)
+        manifest.file_hashes[os.path.abspath(self.source)]['sha256'] = 'recorded'
+        self.assertEqual(manifest.file_hash(self.source), 'recorded')
+        self.write(self.source, 'changed content')
+        self.assertNotEqual(manifest.file_hash(self.source), sha)
+
+    def test_schema_files(self):
+        """A schema's inputs include the schemas it imports, directly or not, once each"""
+        self.write(self.path('code.yaml'), 'imports:\n  - linkml:types\n  - core\n  - part\n')
+        self.write(self.path('part.yaml'), 'imports:\n  - core\n')
+        self.write(self.path('core.yaml'), 'imports:\n  - code\n')
+        self.assertEqual(schema_files(self.path('code.yaml')),
+                         [self.path('code.yaml'), self.path('core.yaml'), self.path('part.yaml')])
+        self.write(self.path('set.yaml'), 'imports:\n  - missing\n')
+        self.assertEqual(schema_files(self.path('set.yaml')), [self.path('set.yaml'), self.path('missing.yaml')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Unit tests: code ingest"""
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import pandas as pd
+
+from comp_loinc.ingest.code_ingest import CodeIngest, CodePartGroups, PART_PREDICATE_MAP
+
+try:
+    from tests.config import PROJECT_DIR, TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR, TEST_STATIC_DIR
+
+CODE_SCHEMA = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema', 'code_schema.yaml')
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+
+
+class CodeIngestTests(unittest.TestCase):
+    """CodeIngest tests against a small copy of the release files"""
+
+    def setUp(self):
+        self.code_dir = tempfile.mkdtemp()
+        for name in ['Loinc.csv', 'LoincPartLink_Primary.csv']:
+            shutil.copy(os.path.join(CODE_INPUT_DIR, name), self.code_dir)
+        loinc = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), dtype=str)
+        lpl = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'), dtype=str)
+        self.linked_codes = [x for x in loinc['LOINC_NUM'] if x in set(lpl['LoincNumber'])]
+        self.unlinked_codes = [x for x in loinc['LOINC_NUM'] if x not in set(lpl['LoincNumber'])][:2]
+        self.included_codes = list(reversed(self.linked_codes)) + self.unlinked_codes + ['0000000-0']
+        with open(os.path.join(self.code_dir, 'included_codes.tsv'), 'w') as f:
+            f.write("\n".join(self.included_codes) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.code_dir)
+
+    def test_generate_codes_in_included_order(self):
+        """Every included code with a row and part links becomes a class, in included_codes.tsv order"""
+        lcc = CodeIngest(CODE_SCHEMA, self.code_dir)
+        self.assertEqual(
+            [x.loinc_number for x in lcc.code_classes], list(reversed(self.linked_codes)))
+        code_class = lcc.code_classes[0]
+        row = lcc.included_code_dataframe.loc[code_class.loinc_number]
+        self.assertEqual(code_class.formal_name, row.LoincFormalName)
+        self.assertEqual(code_class.long_common_name, row.LONG_COMMON_NAME)
+        self.assertIsNotNone(code_class.has_component)
+
+    def test_release_zip(self):
+        """Code classes read from the release zip, in chunks, match the ones read from the extracted files"""
+        zip_path = os.path.join(self.code_dir, 'Loinc_2.74.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as release_zip:
+            release_zip.write(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), 'Loinc_2.74/LoincTable/Loinc.csv')
+            release_zip.write(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'),
+                              'Loinc_2.74/AccessoryFiles/PartFile/LoincPartLink_Primary.csv')
+        zip_code_dir = os.path.join(self.code_dir, 'included_only')
+        os.mkdir(zip_code_dir)
+        shutil.copy(os.path.join(self.code_dir, 'included_codes.tsv'), zip_code_dir)
+        expected = CodeIngest(CODE_SCHEMA, self.code_dir)
+        lcc = CodeIngest(CODE_SCHEMA, zip_code_dir, release_zip=zip_path, chunk_size=10)
+        self.assertEqual(list(lcc.code_classes), list(expected.code_classes))
+
+    def test_missing_codes_side_table(self):
+        """Included codes that are not in Loinc.csv or LoincPartLink_Primary.csv are reported"""
+        lcc = CodeIngest(CODE_SCHEMA, self.code_dir)
+        missing = set(zip(lcc.missing_codes['LOINC_NUM'], lcc.missing_codes['missing_from']))
+        expected = {('0000000-0', 'Loinc.csv'), ('0000000-0', 'LoincPartLink_Primary.csv')}
+        expected.update((x, 'LoincPartLink_Primary.csv') for x in self.unlinked_codes)
+        self.assertEqual(missing, expected)
+
+        outpath = os.path.join(self.code_dir, 'missing_codes.tsv')
+        lcc.write_missing_codes(outpath)
+        self.assertEqual(len(pd.read_csv(outpath, sep="\t")), len(expected))
+
+    def test_concatentate_formal_name(self):
+        """Vectorized formal names match the row-wise astype(str) join, including empty columns"""
+        loinc = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), dtype=str)
+        cols = ['COMPONENT', 'PROPERTY', 'TIME_ASPCT', 'SYSTEM', 'SCALE_TYP', 'METHOD_TYP']
+        expected = loinc[cols].apply(lambda row: ':'.join(row.values.astype(str)), axis=1)
+        self.assertTrue(loinc['METHOD_TYP'].isna().any())
+        self.assertEqual(CodeIngest.concatentate_formal_name(loinc)['LoincFormalName'].tolist(), expected.tolist())
+
+    def test_code_part_groups(self):
+        """Grouped parts and has_* predicates match a per-row walk of the part links"""
+        lpl = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'), dtype=str)
+        groups = CodePartGroups(lpl)
+        self.assertEqual(len(groups), lpl['LoincNumber'].nunique())
+        for code, data in lpl.groupby('LoincNumber'):
+            expected_params = {}
+            for part, part_type in zip(data['PartNumber'], data['PartTypeName']):
+                if part_type in PART_PREDICATE_MAP:
+                    expected_params[PART_PREDICATE_MAP[part_type]] = f"loinc:{part}"
+            self.assertEqual(groups.parts(code), list(zip(data['PartNumber'], data['PartTypeName'])))
+            self.assertEqual(groups.predicate_params(code), expected_params)
@@ -0,0 +1,64 @@
+"""Unit tests: composed class ingest"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from comp_loinc.ingest.composed_ingest import ComposedClasses
+
+try:
+    from tests.config import PROJECT_DIR, TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR, TEST_STATIC_DIR
+
+GROUPING_SCHEMA = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema', 'grouping_classes_schema.yaml')
+PART_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input')
+COMPOSED_DATA = """- id: loinc:CC-LP14559-6
+  "@type": CodeByComponent
+  label: Microorganisms Component Class
+  has_component: loinc:LP14559-6
+"""
+
+
+class ComposedClassesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.work_dir, 'composed_classes_data.yaml')
+        with open(self.data_file, 'w') as f:
+            f.write(COMPOSED_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_part_classes(self):
+        """A class for every COMPONENT part, with the hand-written class taking precedence"""
+        cc = ComposedClasses(GROUPING_SCHEMA, self.data_file, PART_INPUT_DIR, validate='full')
+        parts = pd.read_csv(os.path.join(PART_INPUT_DIR, 'ComponentTree100.tsv'), sep='\t', dtype=str)
+        components = set(parts.loc[parts['ChildPartTypeName'] == 'COMPONENT', 'ChildPartNumber'])
+        self.assertEqual({str(x.id) for x in cc.composed_classes}, {f'loinc:CC-{x}' for x in components})
+        labels = {str(x.id): x.label for x in cc.composed_classes}
+        self.assertEqual(labels['loinc:CC-LP14559-6'], 'Microorganisms Component Class')
+        self.assertEqual(labels['loinc:CC-LP98185-9'], 'Bacteria. Component Class')
+
+        output = os.path.join(self.work_dir, 'composed.owl')
+        cc.write_to_output(output)
+        with open(output) as f:
+            owl = f.read()
+        self.assertIn('EquivalentClasses(\n        loinc:CC-LP98185-9\n            '
+                      'ObjectSomeValuesFrom( loinc:hasComponent loinc:LP98185-9 )\n    )', owl)
+
+    def test_system_classes(self):
+        cc = ComposedClasses(GROUPING_SCHEMA)
+        cc.add_part_classes(pd.DataFrame({
+            'ChildPartNumber': ['LP7057-5', 'LP7057-5', 'LP7576-4'], 'ChildPart': ['Bld', 'Blood', 'Ser'],
+            'ChildPartTypeName': ['SYSTEM', 'SYSTEM', 'SYSTEM']}))
+        self.assertEqual([(str(x.id), x.label, str(x.has_system)) for x in cc.composed_classes], [
+            ('loinc:SC-LP7057-5', 'Bld System Class', 'loinc:LP7057-5'),
+            ('loinc:SC-LP7576-4', 'Ser System Class', 'loinc:LP7576-4')])
+
+
+if __name__ == '__main__':
+    unittest.main()
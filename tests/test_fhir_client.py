@@ -0,0 +1,127 @@
+"""Unit tests: FHIR client"""
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from comp_loinc.mapping.fhir_client import FhirClient, FhirRequestError, FhirResponse, RateLimiter
+
+CONCEPT_MAP_URL = 'http://loinc.org/cm/loinc-parts-to-chebi'
+
+
+def element(code):
+    return {'code': code, 'target': [{'code': f'CHEBI:{code}', 'display': code, 'equivalence': 'equivalent'}]}
+
+
+class StubFhirHandler(BaseHTTPRequestHandler):
+    """ConceptMap search split over two pages, the first with two groups, with ETag revalidation"""
+    pages = {}
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get('If-None-Match')))
+        page = self.pages.get(self.path.split('page=')[-1] if 'page=' in self.path else '1')
+        etag = f'"{self.path}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/fhir+json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FhirClientTests(unittest.TestCase):
+    """FhirClient against a local stub FHIR server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubFhirHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        StubFhirHandler.pages = {
+            '1': {
+                'resourceType': 'Bundle',
+                'link': [{'relation': 'next', 'url': f'{cls.base_url}/ConceptMap/?page=2'}],
+                'entry': [{'resource': {'resourceType': 'ConceptMap', 'group': [
+                    {'element': [element('LP1-1'), element('LP2-2')]}, {'element': [element('LP3-3')]}]}}],
+            },
+            '2': {
+                'resourceType': 'Bundle',
+                'link': [{'relation': 'self', 'url': f'{cls.base_url}/ConceptMap/?page=2'}],
+                'entry': [{'resource': {'resourceType': 'ConceptMap', 'group': [{'element': [element('LP4-4')]}]}}],
+            },
+        }
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        StubFhirHandler.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def codes(self, client):
+        return [x['code'] for x in client.concept_map_elements(CONCEPT_MAP_URL)]
+
+    def test_pagination_and_conditional_requests(self):
+        client = FhirClient(self.base_url, cache_directory=self.cache_dir, backoff=0)
+        self.assertEqual(self.codes(client), ['LP1-1', 'LP2-2', 'LP3-3', 'LP4-4'])
+        self.assertEqual([etag for _, etag in StubFhirHandler.requests], [None, None])
+        self.assertEqual(self.codes(client), ['LP1-1', 'LP2-2', 'LP3-3', 'LP4-4'])
+        self.assertTrue(all(etag is not None for _, etag in StubFhirHandler.requests[2:]))
+
+    def test_offline(self):
+        with self.assertRaises(FhirRequestError):
+            self.codes(FhirClient(self.base_url, cache_directory=self.cache_dir, offline=True))
+        self.codes(FhirClient(self.base_url, cache_directory=self.cache_dir))
+        n_requests = len(StubFhirHandler.requests)
+        offline = FhirClient('http://unreachable.invalid', cache_directory=self.cache_dir, offline=True)
+        offline.base_url = self.base_url
+        self.assertEqual(self.codes(offline), ['LP1-1', 'LP2-2', 'LP3-3', 'LP4-4'])
+        self.assertEqual(len(StubFhirHandler.requests), n_requests)
+
+    def test_retries(self):
+        """Retryable statuses and connection errors are retried, up to the retry limit"""
+        responses = [FhirResponse(503, {}, b''), ConnectionError('reset'), FhirResponse(200, {}, b'{"ok": true}')]
+
+        def transport(url, headers, auth, timeout):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        client = FhirClient(self.base_url, transport=transport, retries=2, backoff=0)
+        self.assertEqual(client.get_json(f'{self.base_url}/metadata'), {'ok': True})
+        responses.extend([FhirResponse(503, {}, b'')] * 3)
+        with self.assertRaises(FhirRequestError):
+            client.get_json(f'{self.base_url}/metadata')
+
+    def test_rate_limit(self):
+        """Requests from several threads are spaced out to the rate limit"""
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter.wait) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
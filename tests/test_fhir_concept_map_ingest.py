@@ -0,0 +1,130 @@
+"""Unit tests: FHIR ConceptMap ingest"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from comp_loinc.mapping.fhir_concept_map_ingest import ConceptMapSource, MappingIngest
+
+CHEBI = ConceptMapSource('chebi', 'http://loinc.org/cm/loinc-parts-to-chebi', 'CHEBI',
+                         'http://purl.obolibrary.org/obo/CHEBI_')
+RADLEX = ConceptMapSource('radlex', 'http://loinc.org/cm/loinc-parts-to-radlex', 'RID', 'http://radlex.org/RID/')
+
+
+def concept_map(*elements):
+    return {'resourceType': 'Bundle', 'entry': [{'resource': {'resourceType': 'ConceptMap',
+                                                              'group': [{'element': list(elements)}]}}]}
+
+
+class StubConceptMapHandler(BaseHTTPRequestHandler):
+    """ConceptMap searches answered by canonical URL"""
+    concept_maps = {
+        CHEBI.url: concept_map(
+            {'code': 'LP1-1', 'target': [{'code': 'CHEBI:1', 'display': 'one', 'equivalence': 'equivalent'}]},
+            {'code': 'LP2-2', 'target': [{'code': 'CHEBI:2', 'display': 'two', 'equivalence': 'relatedto'},
+                                         {'code': 'CHEBI:3', 'display': 'three', 'equivalence': 'wider'}]}),
+        RADLEX.url: concept_map(
+            {'code': 'LP3-3', 'target': [{'code': 'RID3', 'display': 'three', 'equivalence': 'equivalent'}]},
+            {'code': 'LP4-4', 'target': [{'code': 'RID4', 'display': 'four', 'equivalence': 'unmatched'}]}),
+    }
+
+    def do_GET(self):
+        url = parse_qs(urlparse(self.path).query)['url'][0]
+        body = json.dumps(self.concept_maps[url]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/fhir+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MappingIngestTests(unittest.TestCase):
+    """MappingIngest against a local stub FHIR server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubConceptMapHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_concept_maps(self):
+        sssom_dir = os.path.join(self.work_dir, 'sssom')
+        owl_dir = os.path.join(self.work_dir, 'owl')
+        ingest = MappingIngest([CHEBI, RADLEX], owl_dir, sssom_dir, user='user', pwd='pwd',
+                               fhir_endpoint=self.base_url, max_workers=2, rate_limit=100)
+        self.assertEqual(ingest.run(), {'chebi': 3, 'radlex': 1})
+
+        chebi = pd.read_csv(os.path.join(sssom_dir, 'loinc2chebi.tsv'), sep='\t', comment='#')
+        self.assertEqual(list(chebi['predicate_id']), ['skos:exactMatch', 'skos:relatedMatch', 'skos:broadMatch'])
+        self.assertEqual(list(chebi['object_id']), ['CHEBI:1', 'CHEBI:2', 'CHEBI:3'])
+        with open(os.path.join(sssom_dir, 'loinc2radlex.tsv')) as f:
+            radlex_tsv = f.read()
+        self.assertIn(f'#mapping_set_id: {RADLEX.url}', radlex_tsv)
+        self.assertIn('#  RID: http://radlex.org/RID/', radlex_tsv)
+        radlex = pd.read_csv(os.path.join(sssom_dir, 'loinc2radlex.tsv'), sep='\t', comment='#')
+        self.assertEqual(list(radlex['subject_id']), ['loinc:LP3-3'])
+        self.assertEqual(list(radlex['object_id']), ['RID:RID3'])
+        with open(os.path.join(owl_dir, 'loinc2radlex.owl')) as f:
+            radlex_owl = f.read()
+        self.assertIn(f'Ontology( <{RADLEX.url}>', radlex_owl)
+        self.assertIn('AnnotationAssertion( '
+                      'Annotation( sssom:mapping_justification <https://w3id.org/sempavHumanCuration> ) '
+                      'Annotation( sssom:object_label "three" ) '
+                      'skos:exactMatch <https://loinc.org/LP3-3> <http://radlex.org/RID/RID3> )', radlex_owl)
+
+    def test_owl_only(self):
+        """Without an SSSOM directory only the OWL files are written"""
+        owl_dir = os.path.join(self.work_dir, 'owl')
+        MappingIngest([CHEBI], owl_dir, user='user', pwd='pwd', fhir_endpoint=self.base_url).run()
+        self.assertEqual(os.listdir(self.work_dir), ['owl'])
+        with open(os.path.join(owl_dir, 'loinc2chebi.owl')) as f:
+            axioms = [line for line in f if line.startswith('    AnnotationAssertion(')]
+        self.assertEqual(len(axioms), 3)
+
+    def test_failed_fetch(self):
+        """A ConceptMap that fails part way leaves the files of the previous run, and no temporary files"""
+        sssom_dir = os.path.join(self.work_dir, 'sssom')
+        owl_dir = os.path.join(self.work_dir, 'owl')
+        ingest = MappingIngest([CHEBI], owl_dir, sssom_dir, user='user', pwd='pwd', fhir_endpoint=self.base_url)
+        ingest.run()
+        previous = {}
+        for directory in [owl_dir, sssom_dir]:
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name)) as f:
+                    previous[os.path.join(directory, name)] = f.read()
+
+        def failing_elements(url):
+            yield {'code': 'LP1-1', 'target': [{'code': 'CHEBI:1', 'display': 'one', 'equivalence': 'equivalent'}]}
+            raise ConnectionError('connection reset')
+
+        ingest.fhir_client.concept_map_elements = failing_elements
+        with self.assertRaises(ConnectionError):
+            ingest.ingest(CHEBI)
+        self.assertEqual(sorted(os.listdir(owl_dir) + os.listdir(sssom_dir)), ['loinc2chebi.owl', 'loinc2chebi.tsv'])
+        for path, content in previous.items():
+            with open(path) as f:
+                self.assertEqual(f.read(), content, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
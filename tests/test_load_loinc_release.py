@@ -0,0 +1,69 @@
+"""Unit tests: load LOINC release"""
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from comp_loinc.ingest.load_loinc_release import LoadLoincRelease
+from comp_loinc.ingest.table_cache import CACHE_AVAILABLE
+
+try:
+    from tests.config import TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import TEST_STATIC_DIR
+
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+PART_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input')
+
+
+class LoadLoincReleaseTests(unittest.TestCase):
+    """Only the used release files are read out of the zip"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.release_dir = os.path.join(self.work_dir, 'loinc_release')
+        os.mkdir(self.release_dir)
+        with zipfile.ZipFile(os.path.join(self.release_dir, 'Loinc_2.74.zip'), 'w', zipfile.ZIP_DEFLATED) as z:
+            z.write(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), 'Loinc_2.74/LoincTable/Loinc.csv')
+            z.write(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'),
+                    'Loinc_2.74/AccessoryFiles/PartFile/LoincPartLink_Primary.csv')
+            z.write(os.path.join(PART_INPUT_DIR, 'ComponentTree100.tsv'),
+                    'Loinc_2.74/AccessoryFiles/PartFile/ComponentTree100.tsv')
+            z.writestr('Loinc_2.74/AccessoryFiles/Unused/Unused.csv', 'x' * 10000)
+        self.code_dir = os.path.join(self.work_dir, 'code_files')
+        self.part_dir = os.path.join(self.work_dir, 'part_files')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def assert_same_file(self, path, expected_path):
+        with open(path, 'rb') as f, open(expected_path, 'rb') as expected:
+            self.assertEqual(f.read(), expected.read())
+
+    def test_copies_only_code_files(self):
+        LoadLoincRelease(self.release_dir, code_directory=self.code_dir, part_directory=self.part_dir)
+        self.assertEqual(sorted(os.listdir(self.code_dir)), ['Loinc.csv', 'LoincPartLink_Primary.csv'])
+        self.assert_same_file(os.path.join(self.code_dir, 'Loinc.csv'), os.path.join(CODE_INPUT_DIR, 'Loinc.csv'))
+        self.assertFalse(os.path.exists(self.part_dir))
+        self.assertEqual(sorted(os.listdir(self.release_dir)), ['Loinc_2.74.zip'])
+
+    def test_part_members(self):
+        LoadLoincRelease(self.release_dir, code_directory=self.code_dir, part_directory=self.part_dir,
+                         part_members=['AccessoryFiles/PartFile/ComponentTree100.tsv'])
+        self.assert_same_file(os.path.join(self.part_dir, 'ComponentTree100.tsv'),
+                              os.path.join(PART_INPUT_DIR, 'ComponentTree100.tsv'))
+
+    def test_missing_member(self):
+        with self.assertRaises(FileNotFoundError):
+            LoadLoincRelease(self.release_dir, code_directory=self.code_dir, part_members=['PartFile/Missing.tsv'])
+
+    @unittest.skipUnless(CACHE_AVAILABLE, 'pyarrow is not installed')
+    def test_cache_directory(self):
+        cache_dir = os.path.join(self.work_dir, 'cache')
+        LoadLoincRelease(self.release_dir, code_directory=self.code_dir, cache_directory=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+"""Unit tests: the CLI pipeline, the steps that shell out to ROBOT, and CLI start-up"""
+import contextlib
+import io
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from comp_loinc import main
+
+try:
+    from tests.config import TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import TEST_STATIC_DIR
+
+# Stand-in for the robot script: records its arguments and writes each `-o` output
+FAKE_ROBOT = """#!/bin/sh
+echo "$@" > "$(dirname "$0")/args.txt"
+while [ $# -gt 0 ]; do
+  if [ "$1" = "-o" ]; then echo "Ontology()" > "$2"; fi
+  shift
+done
+"""
+# Stand-in for a robot run that fails
+FAILING_ROBOT = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/args.txt"
+exit 3
+"""
+# Budget for the cumulative import time of `main.py --help`, and packages it must not import
+HELP_IMPORT_BUDGET_S = 1.0
+HEAVY_PACKAGES = {'pandas', 'numpy', 'rdflib', 'linkml', 'linkml_runtime', 'linkml_owl', 'funowl', 'sssom', 'requests'}
+
+
+class MergeReasonTests(unittest.TestCase):
+    """merge-reason runs one chained ROBOT command"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.owl_dir = os.path.join(self.work_dir, 'owl files')
+        os.mkdir(self.owl_dir)
+        for name in ['b.owl', 'a.owl', 'notes.txt']:
+            open(os.path.join(self.owl_dir, name), 'w').close()
+        self.robot = os.path.join(self.work_dir, 'robot')
+        with open(self.robot, 'w') as f:
+            f.write(FAKE_ROBOT)
+        os.chmod(self.robot, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_merge_reason(self):
+        merged = os.path.join(self.work_dir, 'merged.owl')
+        reasoned = os.path.join(self.work_dir, 'reasoned.owl')
+        stdout = io.StringIO()
+        with mock.patch.object(main, 'ROBOT_BIN_PATH', self.robot), contextlib.redirect_stdout(stdout):
+            main.merge_reason_owl(owl_directory=self.owl_dir, merged_output=merged, owl_reasoner='elk',
+                                  output=reasoned)
+        with open(os.path.join(self.work_dir, 'args.txt')) as f:
+            args = f.read().strip()
+        a, b = os.path.join(self.owl_dir, 'a.owl'), os.path.join(self.owl_dir, 'b.owl')
+        self.assertEqual(args, f"merge -i {a} -i {b} -o {merged} reason -r elk -o {reasoned}")
+        self.assertTrue(os.path.exists(merged) and os.path.exists(reasoned))
+        self.assertRegex(stdout.getvalue(), r"merge: [\d.]+s, reason: [\d.]+s, total: [\d.]+s")
+
+
+class PipelineTests(unittest.TestCase):
+    """The `all` pipeline on the test release files, with the default schemas and a stand-in for ROBOT"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        code_directory = os.path.join(self.work_dir, 'code_files')
+        os.mkdir(code_directory)
+        code_input = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+        for name in ['Loinc.csv', 'LoincPartLink_Primary.csv']:
+            shutil.copy(os.path.join(code_input, name), code_directory)
+        with open(os.path.join(code_input, 'Loinc.csv')) as f:
+            codes = [line.split(',')[0].strip('"') for line in f.readlines()[1:]]
+        with open(os.path.join(code_directory, 'included_codes.tsv'), 'w') as f:
+            f.write("\n".join(codes) + "\n")
+        output = os.path.join(self.work_dir, 'output')
+        owl_directory = os.path.join(output, 'owl_component_files')
+        os.makedirs(owl_directory)
+        self.paths = dict(
+            main.DEFAULTS,
+            part_directory=os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input'),
+            code_directory=code_directory,
+            cache_directory=os.path.join(self.work_dir, 'cache'),
+            owl_directory=owl_directory,
+            manifest=os.path.join(output, 'build_manifest.json'),
+            merged_owl=os.path.join(output, 'merged_loinc.owl'),
+            **{'output.parts': os.path.join(owl_directory, 'part_ontology.owl'),
+               'output.codes': os.path.join(owl_directory, 'code_classes.owl'),
+               'output.composed': os.path.join(owl_directory, 'composed_component_classes.owl'),
+               'output.merge': os.path.join(output, 'merged_loinc.owl'),
+               'output.reason': os.path.join(output, 'merged_reasoned_loinc.owl')})
+        self.robot = os.path.join(self.work_dir, 'robot')
+        with open(self.robot, 'w') as f:
+            f.write(FAKE_ROBOT)
+        os.chmod(self.robot, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_default_schemas_exist(self):
+        for key in ['schema_file.parts', 'schema_file.codes', 'schema_file.composed', 'code_file']:
+            self.assertTrue(os.path.isfile(main.DEFAULTS[key]), key)
+
+    def test_schema_imports_are_inputs(self):
+        """The ingest stages are rebuilt when a schema imported by theirs changes"""
+        part_schema = os.path.join(main.SCHEMA_DIR, 'part_schema.yaml')
+        for stage in main.pipeline_stages(self.paths)[:3]:
+            self.assertIn(part_schema, stage.inputs, stage.name)
+            self.assertIn(os.path.join(main.SCHEMA_DIR, 'comp_loinc.yaml'), stage.inputs, stage.name)
+
+    def test_run_pipeline(self):
+        for robot_chain in [False, True]:
+            with self.subTest(robot_chain=robot_chain):
+                with mock.patch.object(main, 'ROBOT_BIN_PATH', self.robot), \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    main.run_pipeline(self.paths, incremental=False, robot_chain=robot_chain, jobs=1,
+                                      with_mappings=False, metrics_out=None, profile=None)
+                for key in ['output.parts', 'output.codes', 'output.composed']:
+                    with open(self.paths[key]) as f:
+                        self.assertRegex(f.read(), r'\n    (SubClassOf|EquivalentClasses)\(', key)
+                if not robot_chain:
+                    with open(self.paths['output.merge']) as f:
+                        merged = f.read()
+                    for key in ['output.parts', 'output.codes', 'output.composed']:
+                        with open(self.paths[key]) as f:
+                            self.assertIn(f.read().splitlines()[-2].strip(), merged, key)
+                self.assertTrue(os.path.exists(self.paths['output.reason']))
+                with open(os.path.join(self.work_dir, 'args.txt')) as f:
+                    self.assertIn(f"-o {self.paths['output.reason']}", f.read())
+
+    def test_robot_failure(self):
+        """A failed ROBOT run fails its stage, which is not recorded, and its dependents do not run"""
+        with open(self.robot, 'w') as f:
+            f.write(FAILING_ROBOT)
+        with mock.patch.object(main, 'ROBOT_BIN_PATH', self.robot):
+            stages = main.pipeline_stages(self.paths)
+        merge = next(x for x in stages if x.name == 'merge')
+        merge.kwargs['engine'] = 'robot'
+        build_manifest = main.BuildManifest(self.paths['manifest'])
+        with mock.patch.object(main, 'ROBOT_BIN_PATH', self.robot), contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaisesRegex(main.PipelineError, 'Stages failed: merge; not run: reason'):
+                main.run_stages(stages, build_manifest)
+        self.assertEqual(sorted(build_manifest.stages), ['codes', 'composed', 'parts'])
+        with open(os.path.join(self.work_dir, 'args.txt')) as f:
+            self.assertEqual([x.split()[0] for x in f.read().splitlines()], ['merge'])
+        self.assertFalse(os.path.exists(self.paths['output.reason']))
+
+        build_manifest = main.BuildManifest(self.paths['manifest'])
+        with mock.patch.object(main, 'ROBOT_BIN_PATH', self.robot), contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaisesRegex(main.PipelineError, 'Stages failed: reason'):
+                main.run_stages(main.pipeline_stages(self.paths), build_manifest)
+        self.assertNotIn('reason', build_manifest.stages)
+
+
+class ImportTimeTests(unittest.TestCase):
+    """The CLI imports the ingest dependencies only in the commands that use them"""
+
+    def test_help_import_time(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', main.__file__, '--help'], capture_output=True,
+                                text=True)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        total_us = 0
+        packages = set()
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '[us]' in line:
+                continue
+            _, cumulative_us, name = line[len('import time:'):].split('|')
+            if not name.startswith('  '):
+                total_us += int(cumulative_us)
+            packages.add(name.strip().split('.')[0])
+        self.assertEqual(packages & HEAVY_PACKAGES, set())
+        self.assertLess(total_us / 1e6, HELP_IMPORT_BUDGET_S)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit tests: stage and step metrics"""
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from comp_loinc.metrics import open_stages, stage, step, write_metrics
+
+
+def allocate(n):
+    return [str(i) for i in range(n)]
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_steps(self):
+        """Steps are recorded in the innermost open stage, with their counts and attributes"""
+        with step('outside'):
+            pass
+        with stage('codes') as metrics:
+            with step('csv_read', file='Loinc.csv') as read_metrics:
+                read_metrics.count(rows=len(allocate(1000)))
+            with step('subprocess'):
+                subprocess.call([sys.executable, '-c', 'sum(range(10 ** 6))'])
+        self.assertEqual(open_stages, [])
+        stage_metrics = metrics.as_dict()
+        self.assertEqual(stage_metrics['stage'], 'codes')
+        self.assertEqual([x['step'] for x in stage_metrics['steps']], ['csv_read', 'subprocess'])
+        csv_read, subprocess_step = stage_metrics['steps']
+        self.assertEqual(csv_read['file'], 'Loinc.csv')
+        self.assertEqual(csv_read['counts'], {'rows': 1000})
+        for key in ['wall_s', 'cpu_s', 'child_cpu_s', 'peak_rss_mb']:
+            self.assertIsNotNone(csv_read[key], key)
+        self.assertGreater(subprocess_step['child_cpu_s'], 0)
+        self.assertGreaterEqual(stage_metrics['wall_s'], csv_read['wall_s'] + subprocess_step['wall_s'])
+        self.assertNotIn('profile', stage_metrics)
+
+    def test_profiles(self):
+        profile_path = os.path.join(self.work_dir, 'codes.prof')
+        with stage('codes', profile='cprofile', profile_path=profile_path) as metrics:
+            allocate(1000)
+        functions = [x['function'] for x in metrics.profile['top_cumulative']]
+        self.assertTrue(any(x.endswith('(allocate)') for x in functions), functions)
+        self.assertTrue(any('allocate' in x[2] for x in pstats.Stats(profile_path).stats))
+
+        with stage('parts', profile='tracemalloc') as metrics:
+            data = allocate(100000)
+        self.assertGreater(metrics.profile['peak_mb'], 1)
+        self.assertTrue(metrics.profile['top_allocations'])
+        del data
+        with self.assertRaises(ValueError):
+            with stage('parts', profile='yappi'):
+                pass
+
+    def test_write_metrics(self):
+        path = os.path.join(self.work_dir, 'out', 'metrics.json')
+        with stage('parts') as metrics:
+            pass
+        write_metrics(path, [metrics.as_dict()], jobs=2)
+        with open(path) as f:
+            written = json.load(f)
+        self.assertEqual(written['jobs'], 2)
+        self.assertEqual([x['stage'] for x in written['stages']], ['parts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Unit tests: OWL merge"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from comp_loinc.owl_merge import OFNSyntaxError, merge_ofn, read_axioms, read_header
+
+PARTS = """Prefix( loinc: = <https://loinc.org/> )
+Prefix( rdfs: = <http://www.w3.org/2000/01/rdf-schema#> )
+
+Ontology( loinc:part
+    Annotation( rdfs:comment "part ontology" )
+    AnnotationAssertion( rdfs:label loinc:LP1-1 "one (1)" )
+    AnnotationAssertion( rdfs:label loinc:LP2-2 "two \\" ) <x>
+    and more" )
+    SubClassOf( loinc:LP2-2 loinc:LP1-1 )
+)"""
+COMPOSED = """Prefix( loinc: = <https://loinc.org/> )
+
+Ontology( loinc:grouping_classes
+    EquivalentClasses(
+        loinc:CC-LP1-1
+            ObjectSomeValuesFrom( loinc:hasComponent loinc:LP1-1 )
+    )
+    SubClassOf( loinc:LP2-2 loinc:LP1-1 ) )"""
+
+
+class MergeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.parts = self.write('parts.owl', PARTS)
+        self.composed = self.write('composed.owl', COMPOSED)
+        self.empty = self.write('empty.owl', "Prefix( skos: = <http://www.w3.org/2004/02/skos/core#> )\n\n"
+                                             "Ontology( <http://example.org/empty> )")
+        self.output = os.path.join(self.work_dir, 'merged.owl')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.work_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_read_axioms(self):
+        self.assertEqual(read_header(self.parts)[1], 'loinc:part')
+        self.assertEqual(read_header(self.empty)[1], '<http://example.org/empty>')
+        self.assertEqual(list(read_axioms(self.parts)), [
+            'AnnotationAssertion( rdfs:label loinc:LP1-1 "one (1)" )',
+            'AnnotationAssertion( rdfs:label loinc:LP2-2 "two \\" ) <x>\n    and more" )',
+            'SubClassOf( loinc:LP2-2 loinc:LP1-1 )'])
+        self.assertEqual(list(read_axioms(self.composed)), [
+            'EquivalentClasses(\n        loinc:CC-LP1-1\n'
+            '            ObjectSomeValuesFrom( loinc:hasComponent loinc:LP1-1 )\n    )',
+            'SubClassOf( loinc:LP2-2 loinc:LP1-1 )'])
+        self.assertEqual(list(read_axioms(self.empty)), [])
+
+    def test_merge(self):
+        stats = merge_ofn([self.parts, self.composed, self.empty], self.output)
+        self.assertEqual(stats, {'files': 3, 'axioms': 4, 'duplicates': 1})
+        self.assertEqual(read_header(self.output), ({
+            'loinc': 'https://loinc.org/', 'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+            'skos': 'http://www.w3.org/2004/02/skos/core#'}, 'loinc:part'))
+        self.assertEqual(list(read_axioms(self.output)),
+                         list(read_axioms(self.parts)) + list(read_axioms(self.composed))[:1])
+        with open(self.output) as f:
+            merged = f.read()
+        self.assertNotIn('part ontology', merged)
+
+        parallel_output = os.path.join(self.work_dir, 'parallel_merged.owl')
+        merge_ofn([self.parts, self.composed, self.empty], parallel_output, workers=2)
+        with open(parallel_output) as f:
+            self.assertEqual(f.read(), merged)
+
+    def test_unsupported(self):
+        rdf_xml = self.write('rdf.owl', '<?xml version="1.0"?>\n<rdf:RDF/>')
+        with self.assertRaises(OFNSyntaxError):
+            merge_ofn([self.parts, rdf_xml], self.output)
+        conflict = self.write('conflict.owl', "Prefix( loinc: = <http://loinc.org/> )\nOntology( loinc:x )")
+        with self.assertRaises(OFNSyntaxError):
+            merge_ofn([self.parts, conflict], self.output)
+        truncated = self.write('truncated.owl', PARTS[:-10])
+        with self.assertRaises(OFNSyntaxError):
+            merge_ofn([truncated], self.output)
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ['composed.owl', 'conflict.owl', 'empty.owl', 'parts.owl',
+                                                            'rdf.owl', 'truncated.owl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
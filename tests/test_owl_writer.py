@@ -0,0 +1,78 @@
+"""Unit tests: streaming OWL writer"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+import yaml
+from linkml_owl.dumpers.owl_dumper import OWLDumper
+from linkml_runtime import SchemaView
+
+from comp_loinc import datamodel
+from comp_loinc.datamodel import ComponentClass
+from comp_loinc.ingest.code_ingest import CodeIngest
+from comp_loinc.ingest.owl_writer import StreamingOWLWriter
+from comp_loinc.ingest.part_ingest import PartOntology
+from comp_loinc.ingest.records import LinkMLRecord
+
+try:
+    from tests.config import PROJECT_DIR, TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR, TEST_STATIC_DIR
+
+SCHEMA_DIR = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema')
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+
+
+class StreamingOWLWriterTests(unittest.TestCase):
+    """StreamingOWLWriter output is identical to OWLDumper.dumps"""
+
+    def assert_same_as_owl_dumper(self, instances, schema_file):
+        """instances may be records; OWLDumper gets their full dataclass instances"""
+        sv = SchemaView(os.path.join(SCHEMA_DIR, schema_file))
+        dataclass_instances = [x.to_linkml() if isinstance(x, LinkMLRecord) else x for x in instances]
+        expected = OWLDumper().dumps(dataclass_instances, schema=sv.schema)
+        output = io.StringIO()
+        StreamingOWLWriter(sv).write_stream(iter(instances), output)
+        self.assertEqual(output.getvalue(), expected)
+
+    def test_parts(self):
+        """Part classes, including owl:Thing parents"""
+        po = PartOntology(os.path.join(SCHEMA_DIR, 'part_schema.yaml'),
+                          os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input'))
+        po.generate_ontology()
+        self.assert_same_as_owl_dumper(po.part_classes, 'part_schema.yaml')
+
+    def test_codes(self):
+        """Code classes with ObjectSomeValuesFrom part restrictions"""
+        code_dir = tempfile.mkdtemp()
+        try:
+            for name in ['Loinc.csv', 'LoincPartLink_Primary.csv']:
+                shutil.copy(os.path.join(CODE_INPUT_DIR, name), code_dir)
+            loinc = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), dtype=str)
+            with open(os.path.join(code_dir, 'included_codes.tsv'), 'w') as f:
+                f.write("\n".join(loinc['LOINC_NUM']))
+            lcc = CodeIngest(os.path.join(SCHEMA_DIR, 'code_schema.yaml'), code_dir)
+        finally:
+            shutil.rmtree(code_dir)
+        self.assertTrue(lcc.code_classes)
+        self.assert_same_as_owl_dumper(lcc.code_classes, 'code_schema.yaml')
+
+    def test_composed_classes(self):
+        """Grouping classes with EquivalentClasses axioms"""
+        with open(os.path.join(PROJECT_DIR, 'data', 'composed_classes_data.yaml')) as f:
+            records = yaml.safe_load(f)
+        instances = [getattr(datamodel, record.pop('@type'))(**record) for record in records]
+        self.assert_same_as_owl_dumper(instances, 'grouping_classes_schema.yaml')
+
+    def test_literals_and_empty_ontology(self):
+        """Literals that need escaping, and an ontology without axioms"""
+        labels = ['a "quoted" label', 'line\nbreak', 'ünïcödé', '', 'x@en', '12', 'a;b (c)']
+        instances = [
+            ComponentClass(id=f'loinc:LP{i}-1', part_number=f'LP{i}-1', label=label, subClassOf=['owl:Thing'])
+            for i, label in enumerate(labels)
+        ]
+        self.assert_same_as_owl_dumper(instances, 'part_schema.yaml')
+        self.assert_same_as_owl_dumper([], 'part_schema.yaml')
@@ -0,0 +1,119 @@
+"""Unit tests: part ingest"""
+import os
+import tempfile
+import unittest
+import zipfile
+
+import pandas as pd
+
+from comp_loinc.ingest.part_ingest import PART_TYPE_CLASSES, PartOntology, build_part_params, part_file_sources
+from comp_loinc.ingest.source_data_utils import loincify
+
+try:
+    from tests.config import PROJECT_DIR, TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR, TEST_STATIC_DIR
+
+PART_SCHEMA = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema', 'part_schema.yaml')
+PART_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input')
+
+
+def reference_part_params(parts_df):
+    """The per-group loop that build_part_params replaced"""
+    part_params = []
+    part_groups = parts_df.groupby("ChildPartNumber")[['ChildPart', "ChildPartTypeName", "ParentPartNumber"]]
+    for pg in part_groups:
+        params = {"id": loincify(pg[0]), "part_number": pg[0]}
+        part_attributes = pg[1].reset_index()
+        params['label'] = part_attributes["ChildPart"].unique()[0]
+        params['part_type'] = part_attributes["ChildPartTypeName"].unique()[0]
+        parent_part_numbers = [
+            loincify(x) for x in part_attributes['ParentPartNumber'].unique() if loincify(x) != params['id']
+        ]
+        params['subClassOf'] = parent_part_numbers if len(parent_part_numbers) else "owl:Thing"
+        part_params.append(params)
+    return part_params
+
+
+def part_set(parts):
+    """Set of (id, label, part_type, subClassOf) of part records"""
+    return {(x.id, x.label, x.part_type, tuple(x.subClassOf)) for x in parts}
+
+
+def part_params_set(part_params):
+    """Set of (id, label, part_type, subClassOf) of part params, with empty values as 'nan' like the records"""
+    return {
+        (x['id'], str(x['label']), str(x['part_type']),
+         tuple(x['subClassOf']) if isinstance(x['subClassOf'], list) else (x['subClassOf'],))
+        for x in part_params
+    }
+
+
+class PartOntologyTests(unittest.TestCase):
+    """PartOntology tests against the part file fixture"""
+
+    def test_part_zip(self):
+        """Part files read from a zip, in chunks, give the same parts as the part file directory"""
+        expected = PartOntology(PART_SCHEMA, PART_INPUT_DIR)
+        expected.generate_ontology()
+        with tempfile.TemporaryDirectory() as work_dir:
+            zip_path = os.path.join(work_dir, 'part_files.zip')
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as part_zip:
+                for name in os.listdir(PART_INPUT_DIR):
+                    part_zip.write(os.path.join(PART_INPUT_DIR, name), f'part_files/{name}')
+            po = PartOntology(PART_SCHEMA, zip_path, cache_directory=os.path.join(work_dir, 'cache'), chunk_size=25)
+            po.generate_ontology()
+        self.assertEqual(po.part_classes, expected.part_classes)
+
+    def test_part_file_sources(self):
+        """Directories and zips keep the same, case insensitive, `.tsv` files, and must have at least one"""
+        names = ['ComponentTree.tsv', 'SystemTree.TSV', 'README.txt']
+        with tempfile.TemporaryDirectory() as work_dir:
+            part_dir = os.path.join(work_dir, 'part_files')
+            os.mkdir(part_dir)
+            zip_path = os.path.join(work_dir, 'part_files.zip')
+            with zipfile.ZipFile(zip_path, 'w') as part_zip:
+                for name in names:
+                    open(os.path.join(part_dir, name), 'w').close()
+                    part_zip.writestr(name, '')
+            self.assertEqual(sorted(os.path.basename(path) for path, _ in part_file_sources(part_dir)), names[:2])
+            self.assertEqual(sorted(member for _, member in part_file_sources(zip_path)), names[:2])
+
+            for name in names[:2]:
+                os.remove(os.path.join(part_dir, name))
+            with zipfile.ZipFile(zip_path, 'w') as part_zip:
+                part_zip.writestr('README.txt', '')
+            for path in [part_dir, zip_path]:
+                with self.assertRaisesRegex(FileNotFoundError, f"No part hierarchy files .* in {path}"):
+                    part_file_sources(path)
+
+    def test_part_classes_match_groupby_loop(self):
+        """The vectorized build gives the same (id, label, part_type, subClassOf) as the per-group loop"""
+        po = PartOntology(PART_SCHEMA, PART_INPUT_DIR)
+        po.generate_ontology()
+        expected = [
+            params for params in reference_part_params(po.all_parts_df) if params['part_type'] in PART_TYPE_CLASSES
+        ]
+        self.assertTrue(po.part_classes)
+        self.assertEqual(part_set(po.part_classes), part_params_set(expected))
+        self.assertEqual([x.id for x in po.part_classes], [x['id'] for x in expected])
+
+    def test_part_params_edge_cases(self):
+        """Self parents, repeated and empty parents, empty labels and parts spread over several files"""
+        nan = float('nan')
+        parts_df = pd.DataFrame({
+            'ParentPartNumber': ['LP2-2', 'LP1-1', 'LP3-3', 'LP2-2', nan, 'LP4-4', 'LP4-4', 'LP9-9'],
+            'ChildPartNumber': ['LP1-1', 'LP1-1', 'LP1-1', 'LP1-1', 'LP5-5', 'LP4-4', 'LP4-4', 'LP3-3'],
+            'ChildPart': ['one', 'one again', 'one', 'one', 'five', nan, 'four', 'three'],
+            'ChildPartTypeName': pd.Categorical(['COMPONENT', 'CLASS', 'COMPONENT', 'COMPONENT', 'SYSTEM',
+                                                 'METHOD', 'METHOD', 'TIME']),
+        }, index=[0, 1, 2, 3, 0, 1, 2, 0])
+        part_params = build_part_params(parts_df)
+        self.assertEqual(part_params_set(part_params), part_params_set(reference_part_params(parts_df)))
+        self.assertEqual([x['id'] for x in part_params], ['loinc:LP1-1', 'loinc:LP3-3', 'loinc:LP4-4', 'loinc:LP5-5'])
+        self.assertEqual(part_params[0]['subClassOf'], ['loinc:LP2-2', 'loinc:LP3-3'])
+        self.assertEqual(part_params[2]['subClassOf'], "owl:Thing")
+        self.assertEqual(part_params[3]['subClassOf'], ['loinc:nan'])
+
+if __name__ == '__main__':
+    unittest.main()
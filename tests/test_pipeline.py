@@ -0,0 +1,132 @@
+"""Unit tests: pipeline scheduler"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from comp_loinc.build_manifest import BuildManifest
+from comp_loinc.pipeline import PipelineError, Stage, critical_path, run_stages, stage_dependencies, \
+    topological_order
+
+
+def write_file(output, text, started=None, wait_for=None, timeout=60.0):
+    """Write text to output; with started and wait_for, mark this build started and first wait until the build that
+    marks wait_for has started, which only happens when the two run at the same time"""
+    if started:
+        open(started, 'w').close()
+    deadline = time.monotonic() + timeout
+    while wait_for and not os.path.exists(wait_for):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{wait_for} was not started while building {output}")
+        time.sleep(0.01)
+    with open(output, 'w') as f:
+        f.write(text)
+
+
+def concatenate(inputs, output):
+    with open(output, 'w') as f:
+        for path in inputs:
+            with open(path) as input_file:
+                f.write(input_file.read())
+
+
+def fail(output):
+    raise RuntimeError(f"cannot build {output}")
+
+
+class PipelineTests(unittest.TestCase):
+    """Two producers writing into one directory, a merge of the directory and a stage after the merge"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.owl_dir = os.path.join(self.work_dir, 'owl')
+        os.mkdir(self.owl_dir)
+        self.a = os.path.join(self.owl_dir, 'a.owl')
+        self.b = os.path.join(self.owl_dir, 'b.owl')
+        self.merged = os.path.join(self.work_dir, 'merged.owl')
+        self.reasoned = os.path.join(self.work_dir, 'reasoned.owl')
+        self.manifest = BuildManifest(os.path.join(self.work_dir, 'manifest.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def stages(self, b_build=write_file, rendezvous=False):
+        """With rendezvous, each producer waits until the other has started"""
+        started = {x: os.path.join(self.work_dir, f'{x}.started') if rendezvous else None for x in 'ab'}
+        return [
+            Stage('reason', concatenate, dict(inputs=[self.merged], output=self.reasoned),
+                  inputs=[self.merged], outputs=[self.reasoned]),
+            Stage('a', write_file, dict(output=self.a, text='a', started=started['a'], wait_for=started['b']),
+                  inputs=[], outputs=[self.a]),
+            Stage('b', b_build, dict(output=self.b, text='b', started=started['b'], wait_for=started['a'])
+                  if b_build is write_file else dict(output=self.b), inputs=[], outputs=[self.b]),
+            Stage('merge', concatenate, dict(inputs=[self.a, self.b], output=self.merged),
+                  inputs=[self.owl_dir], outputs=[self.merged]),
+        ]
+
+    def run_quietly(self, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            result = run_stages(*args, **kwargs)
+        return result, stdout.getvalue()
+
+    def test_graph(self):
+        stages = self.stages()
+        dependencies = stage_dependencies(stages)
+        self.assertEqual(dependencies, {'reason': {'merge'}, 'a': set(), 'b': set(), 'merge': {'a', 'b'}})
+        self.assertEqual([x.name for x in topological_order(stages, dependencies)], ['a', 'b', 'merge', 'reason'])
+        self.assertEqual(critical_path(stages, dependencies, {'a': 1.0, 'b': 3.0, 'merge': 1.0, 'reason': 2.0}),
+                         (['b', 'merge', 'reason'], 6.0))
+        with self.assertRaises(ValueError):
+            topological_order(stages, dict(dependencies, a={'reason'}))
+
+    def test_run_stages(self):
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                wall_times, output = self.run_quietly(self.stages(), self.manifest, jobs=jobs)
+                with open(self.reasoned) as f:
+                    self.assertEqual(f.read(), 'ab')
+                self.assertEqual(set(wall_times), {'a', 'b', 'merge', 'reason'})
+                self.assertIn('Critical path: ', output)
+        # the producers run side by side: each finishes only once the other has started
+        wall_times, _ = self.run_quietly(self.stages(rendezvous=True), self.manifest, jobs=2)
+        self.assertEqual(set(wall_times), {'a', 'b', 'merge', 'reason'})
+        _, output = self.run_quietly(self.stages(), self.manifest, incremental=True)
+        self.assertEqual(self.manifest.reused, ['a', 'b', 'merge', 'reason'])
+
+    def test_always_run(self):
+        """A stage marked always_run is built in incremental runs, and the stages after it are reused if its outputs
+        are unchanged"""
+        self.run_quietly(self.stages(), self.manifest)
+        stages = self.stages()
+        stages[1].always_run = True
+        _, output = self.run_quietly(stages, self.manifest, incremental=True)
+        self.assertEqual(self.manifest.reused, ['b', 'merge', 'reason'])
+        self.assertNotIn('Reusing a:', output)
+
+    def test_metrics(self):
+        """Metrics of every stage built, including those built in worker processes, are written as JSON"""
+        metrics_out = os.path.join(self.work_dir, 'metrics.json')
+        self.run_quietly(self.stages(), self.manifest, jobs=2, metrics_out=metrics_out, profile='cprofile')
+        with open(metrics_out) as f:
+            metrics = json.load(f)
+        self.assertEqual(sorted(x['stage'] for x in metrics['stages']), ['a', 'b', 'merge', 'reason'])
+        self.assertEqual(metrics['critical_path']['stages'][-2:], ['merge', 'reason'])
+        self.assertEqual(metrics['failed'], [])
+        for stage in metrics['stages']:
+            self.assertTrue(os.path.exists(stage['profile']['path']))
+
+    def test_failed_stage(self):
+        """Stages depending on a failed stage do not run, the others do"""
+        with self.assertRaises(PipelineError) as context, contextlib.redirect_stdout(io.StringIO()):
+            run_stages(self.stages(b_build=fail), self.manifest, jobs=2)
+        self.assertIn('Stages failed: b; not run: merge, reason', str(context.exception))
+        self.assertTrue(os.path.exists(self.a))
+        self.assertFalse(os.path.exists(self.merged))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Unit tests: progress reporting"""
+import io
+import time
+import unittest
+
+from comp_loinc.progress import Progress, format_seconds, track
+
+
+class TTYStream(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class ProgressTests(unittest.TestCase):
+
+    def test_log_output(self):
+        """Without a terminal, full report lines are written at most every log_interval seconds"""
+        stream = io.StringIO()
+        items = list(track(range(100000), 'Writing', unit='classes', stream=stream))
+        self.assertEqual(len(items), 100000)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertRegex(lines[0], r'^Writing: 100000 classes in \d+\.\ds \(\d+ classes/s\)$')
+        self.assertNotIn('\r', stream.getvalue())
+
+        stream = io.StringIO()
+        with Progress('Merging', total=4, unit='files', log_interval=0.05, stream=stream) as progress:
+            for _ in range(4):
+                time.sleep(0.06)
+                progress.update()
+        lines = stream.getvalue().splitlines()
+        self.assertGreaterEqual(len(lines), 3)
+        self.assertRegex(lines[0], r'^Merging: 1/4 files \(25%\), \d+ files/s, ETA \d+s$')
+        self.assertTrue(lines[-1].startswith('Merging: 4 files in '))
+
+    def test_terminal_output(self):
+        """On a terminal the report line is rewritten in place, and the clock is not read for every item"""
+        stream = TTYStream()
+        progress = Progress('Building', interval=0.01, stream=stream)
+        for _ in range(20000):
+            progress.update()
+        self.assertGreater(progress.next_check - progress.count, 1)
+        time.sleep(0.02)
+        progress.update(progress.next_check - progress.count)
+        progress.close()
+        output = stream.getvalue()
+        self.assertTrue(output.startswith('\rBuilding: '))
+        self.assertEqual(output.count('\n'), 1)
+        self.assertTrue(output.endswith('\033[K\n'))
+
+    def test_format_seconds(self):
+        self.assertEqual([format_seconds(x) for x in [5, 185, 3720]], ['5s', '3m05s', '1h02m'])
+
+
+if __name__ == '__main__':
+    unittest.main()
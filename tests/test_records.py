@@ -0,0 +1,74 @@
+"""Unit tests: bulk LinkML records"""
+import os
+import unittest
+
+from linkml_runtime import SchemaView
+
+from comp_loinc.datamodel import ComponentClass, LoincCodeClass
+from comp_loinc.ingest.records import RecordTable, record_type, validate_records
+
+try:
+    from tests.config import PROJECT_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR
+
+SCHEMA_DIR = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema')
+
+
+class RecordTests(unittest.TestCase):
+    """Records hold the same values as the LinkML dataclasses they stand in for"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.code_sv = SchemaView(os.path.join(SCHEMA_DIR, 'code_schema.yaml'))
+        cls.part_sv = SchemaView(os.path.join(SCHEMA_DIR, 'part_schema.yaml'))
+
+    def test_record_matches_dataclass(self):
+        """Per-row records coerce values and wrap multivalued slots like __post_init__"""
+        params = {'id': 'loinc:LP1-1', 'part_number': 'LP1-1', 'label': float('nan'), 'subClassOf': 'owl:Thing'}
+        record = record_type(ComponentClass, self.part_sv)(**params)
+        instance = ComponentClass(**params)
+        self.assertEqual(record.label, 'nan')
+        self.assertEqual(record.subClassOf, ['owl:Thing'])
+        self.assertEqual(record.to_linkml(), instance)
+
+    def test_record_table(self):
+        """Columns become records, with scalar columns shared by every row"""
+        table = RecordTable(LoincCodeClass, self.code_sv, {
+            'id': ['loinc:1-8', 'loinc:2-6'],
+            'loinc_number': ['1-8', '2-6'],
+            'status': ['ACTIVE', None],
+            'subClassOf': 'loinc:lc0000001',
+            'has_component': ['loinc:LP1-1', None],
+        }, validate='full')
+        self.assertEqual(len(table), 2)
+        self.assertEqual([x.loinc_number for x in table], ['1-8', '2-6'])
+        self.assertEqual(table[1].subClassOf, ['loinc:lc0000001'])
+        self.assertIsNone(table[1].has_component)
+        self.assertEqual(table.to_dataclasses(), [
+            LoincCodeClass(id='loinc:1-8', loinc_number='1-8', status='ACTIVE', subClassOf='loinc:lc0000001',
+                           has_component='loinc:LP1-1'),
+            LoincCodeClass(id='loinc:2-6', loinc_number='2-6', subClassOf='loinc:lc0000001'),
+        ])
+
+    def test_record_table_checks_columns(self):
+        """Unknown slots, missing identifiers and ragged columns are rejected"""
+        with self.assertRaises(ValueError):
+            RecordTable(LoincCodeClass, self.code_sv, {'id': ['loinc:1-8'], 'not_a_slot': ['x']})
+        with self.assertRaises(ValueError):
+            RecordTable(LoincCodeClass, self.code_sv, {'loinc_number': ['1-8']})
+        with self.assertRaises(ValueError):
+            RecordTable(LoincCodeClass, self.code_sv, {'id': ['loinc:1-8'], 'loinc_number': ['1-8', '2-6']})
+
+    def test_validate_records(self):
+        """Validation builds the dataclasses, which reject invalid values"""
+        records = [record_type(ComponentClass, self.part_sv)(id=None, label='no identifier')]
+        validate_records(records, 'none')
+        with self.assertRaises(ValueError):
+            validate_records(records, 'full')
+        with self.assertRaises(ValueError):
+            validate_records(records, 'every other one')
+
+
+if __name__ == '__main__':
+    unittest.main()
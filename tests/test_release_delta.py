@@ -0,0 +1,169 @@
+"""Unit tests: release delta"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+import typer
+from linkml_runtime import SchemaView
+
+from comp_loinc import main
+from comp_loinc.datamodel import ComponentClass
+from comp_loinc.ingest.code_ingest import load_code_tables
+from comp_loinc.ingest.owl_writer import StreamingOWLWriter
+from comp_loinc.ingest.records import record_type
+from comp_loinc.ingest.release_delta import ReleaseDelta, candidate_codes
+from comp_loinc.ingest.table_cache import CACHE_AVAILABLE, load_table_snapshot
+
+try:
+    from tests.config import PROJECT_DIR, TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import PROJECT_DIR, TEST_STATIC_DIR
+
+SCHEMA_DIR = os.path.join(PROJECT_DIR, 'src', 'comp_loinc', 'schema')
+CODE_SCHEMA = os.path.join(SCHEMA_DIR, 'code_schema.yaml')
+PART_SCHEMA = os.path.join(SCHEMA_DIR, 'part_schema.yaml')
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+PART_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input')
+
+
+def axiom_lines(path):
+    with open(path) as f:
+        return {line.rstrip('\n') for line in f if line.startswith('    ')}
+
+
+@unittest.skipUnless(CACHE_AVAILABLE, 'the release delta reads the previous release from the table cache')
+class ReleaseDeltaTests(unittest.TestCase):
+    """Patching the previous release's OWL files gives the axioms of a full build of the new release"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work_dir, 'cache')
+        self.code_owl = os.path.join(self.work_dir, 'code_classes.owl')
+        self.part_owl = os.path.join(self.work_dir, 'part_ontology.owl')
+        loinc = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), dtype=str, keep_default_na=False)
+        lpl = pd.read_csv(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'), dtype=str, keep_default_na=False)
+        codes = [x for x in loinc['LOINC_NUM'] if x in set(lpl['LoincNumber'])]
+        self.changed, self.deprecated, self.removed, self.added, self.relinked, self.unchanged = codes[:6]
+
+        # the previous release is built, and its files deleted, before the new release is written
+        previous_dir = self.release_dir('previous', loinc, lpl, [x for x in codes if x != self.added])
+        self.build(previous_dir, PART_INPUT_DIR, self.code_owl, self.part_owl)
+        shutil.rmtree(previous_dir)
+
+        loinc = loinc.set_index('LOINC_NUM', drop=False)
+        loinc.loc[self.changed, ['LONG_COMMON_NAME', 'VersionLastChanged', 'CHNG_TYPE']] = ['A changed name', '2.75',
+                                                                                            'MIN']
+        loinc.loc[self.deprecated, ['STATUS', 'VersionLastChanged', 'CHNG_TYPE']] = ['DEPRECATED', '2.75', 'DEL']
+        # a change without a new VersionLastChanged is not picked up, as LOINC always sets it
+        self.unchanged_short_name = loinc.loc[self.unchanged, 'SHORTNAME']
+        loinc.loc[self.unchanged, 'SHORTNAME'] = 'Not a release change'
+        relinked_component = (lpl['LoincNumber'] == self.relinked) & (lpl['PartTypeName'] == 'COMPONENT')
+        lpl.loc[relinked_component, 'PartNumber'] = 'LP15157-8'
+        self.release_dir_path = self.release_dir('release', loinc, lpl, [x for x in codes if x != self.removed])
+        self.part_dir = os.path.join(self.work_dir, 'part_files')
+        os.mkdir(self.part_dir)
+        parts = pd.read_csv(os.path.join(PART_INPUT_DIR, 'ComponentTree100.tsv'), sep='\t', dtype=str,
+                            keep_default_na=False)
+        self.renamed_part = parts['ChildPartNumber'].iloc[-1]
+        parts.loc[parts['ChildPartNumber'] == self.renamed_part, 'ChildPart'] = 'A renamed part'
+        parts.to_csv(os.path.join(self.part_dir, 'ComponentTree100.tsv'), sep='\t', index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def release_dir(self, name, loinc, lpl, included_codes):
+        path = os.path.join(self.work_dir, name)
+        os.mkdir(path)
+        loinc.to_csv(os.path.join(path, 'Loinc.csv'), index=False)
+        lpl.to_csv(os.path.join(path, 'LoincPartLink_Primary.csv'), index=False)
+        with open(os.path.join(path, 'included_codes.tsv'), 'w') as f:
+            f.write("\n".join(included_codes))
+        return path
+
+    def build(self, code_directory, part_directory, code_owl, part_owl, cache_directory=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.build_codes(schema_file=CODE_SCHEMA, code_directory=code_directory, output=code_owl,
+                             missing_codes_output=None, cache_directory=cache_directory or self.cache_dir,
+                             release_zip=None, chunk_size=None)
+            main.build_part_ontology(schema_file=PART_SCHEMA, part_directory=part_directory, output=part_owl,
+                                     cache_directory=cache_directory or self.cache_dir, chunk_size=None)
+
+    def delta(self, parts):
+        report = os.path.join(self.work_dir, 'release_changes.tsv')
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            main.build_delta(code_directory=self.release_dir_path, release_zip=None, part_directory=self.part_dir,
+                             code_schema_file=CODE_SCHEMA, part_schema_file=PART_SCHEMA, code_owl=self.code_owl,
+                             part_owl=self.part_owl, report=report, cache_directory=self.cache_dir, parts=parts)
+        return pd.read_csv(report, sep='\t', dtype=str).set_index('id'), stdout.getvalue()
+
+    def test_candidate_codes(self):
+        """Codes are rebuilt if their change columns or part links changed, or they were added or removed"""
+        previous_tables, snapshot = load_table_snapshot(self.cache_dir, self.code_owl)
+        included_codes = [x for x in snapshot['included_codes'] if x != self.removed] + [self.added]
+        codes = candidate_codes(previous_tables, load_code_tables(self.release_dir_path), snapshot['included_codes'],
+                                included_codes)
+        self.assertEqual(codes, {self.changed, self.deprecated, self.removed, self.added, self.relinked})
+
+    def test_code_delta(self):
+        report, stdout = self.delta(parts=False)
+        self.assertIn("5 candidate codes", stdout)
+        full_build_path = os.path.join(self.work_dir, 'full_code_classes.owl')
+        loinc_csv = os.path.join(self.release_dir_path, 'Loinc.csv')
+        with open(loinc_csv) as f:
+            loinc = f.read()
+        with open(loinc_csv, 'w') as f:
+            f.write(loinc.replace('Not a release change', self.unchanged_short_name))
+        self.build(self.release_dir_path, PART_INPUT_DIR, full_build_path, os.path.join(self.work_dir, 'parts.owl'),
+                   cache_directory=os.path.join(self.work_dir, 'full_build_cache'))
+        self.assertEqual(axiom_lines(self.code_owl), axiom_lines(full_build_path))
+
+        self.assertEqual(report.loc[f'loinc:{self.changed}', 'change'], 'changed')
+        self.assertEqual(report.loc[f'loinc:{self.changed}', 'changed_slots'], 'long_common_name')
+        self.assertEqual(report.loc[f'loinc:{self.changed}', 'CHNG_TYPE'], 'MIN')
+        self.assertEqual(report.loc[f'loinc:{self.changed}', 'VersionLastChanged'], '2.75')
+        self.assertEqual(report.loc[f'loinc:{self.deprecated}', 'change'], 'deprecated')
+        self.assertEqual(report.loc[f'loinc:{self.removed}', 'change'], 'removed')
+        self.assertEqual(report.loc[f'loinc:{self.added}', 'change'], 'added')
+        self.assertEqual(report.loc[f'loinc:{self.relinked}', 'changed_slots'], 'has_component')
+        self.assertNotIn(f'loinc:{self.unchanged}', report.index)
+
+        # the patched ontology is recorded as built from the new release
+        report, stdout = self.delta(parts=False)
+        self.assertIn("0 candidate codes", stdout)
+        self.assertEqual(len(report), 0)
+
+    def test_part_delta(self):
+        report, _ = self.delta(parts=True)
+        full_build_path = os.path.join(self.work_dir, 'full_part_ontology.owl')
+        self.build(self.release_dir_path, self.part_dir, os.path.join(self.work_dir, 'codes.owl'), full_build_path,
+                   cache_directory=os.path.join(self.work_dir, 'full_build_cache'))
+        self.assertEqual(axiom_lines(self.part_owl), axiom_lines(full_build_path))
+        self.assertEqual(report.loc[f'loinc:{self.renamed_part}', 'change'], 'changed')
+        self.assertEqual(report.loc[f'loinc:{self.renamed_part}', 'changed_slots'], 'label')
+
+    def test_no_snapshot(self):
+        """An ontology built without the table cache cannot be updated"""
+        shutil.rmtree(os.path.join(self.cache_dir, 'snapshots'))
+        with self.assertRaises(typer.Exit):
+            self.delta(parts=False)
+
+    def test_patch_empty_ontology(self):
+        """Classes added to an ontology without axioms"""
+        writer = StreamingOWLWriter(SchemaView(PART_SCHEMA))
+        part = record_type(ComponentClass, writer.sv)(id='loinc:LP1-1', label='one', subClassOf='owl:Thing')
+        owl_path = os.path.join(self.work_dir, 'parts.owl')
+        full_build_path = os.path.join(self.work_dir, 'full_parts.owl')
+        writer.write([], owl_path)
+        writer.write([part], full_build_path)
+        ReleaseDelta([], [part]).patch_owl(writer, owl_path)
+        with open(owl_path) as patched, open(full_build_path) as full_build:
+            self.assertEqual(patched.read().rstrip('\n'), full_build.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Unit tests: release table loading"""
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import pandas as pd
+
+from comp_loinc.ingest.release_tables import read_release_table, find_zip_member, CSV_ENGINE, LOINC_COLUMNS, \
+    LOINC_CATEGORICAL_COLUMNS, LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS, PART_COLUMNS, PART_CATEGORICAL_COLUMNS
+
+try:
+    from tests.config import TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import TEST_STATIC_DIR
+
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+PART_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_1_parts', 'input')
+
+TABLES = [
+    (os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS, ","),
+    (os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'), LPL_COLUMNS, LPL_CATEGORICAL_COLUMNS, ","),
+    (os.path.join(PART_INPUT_DIR, 'ComponentTree100.tsv'), PART_COLUMNS, PART_CATEGORICAL_COLUMNS, "\t"),
+]
+
+
+class ReadReleaseTableTests(unittest.TestCase):
+    """read_release_table tests"""
+
+    def test_pruned_columns_match_full_read(self):
+        """Pruned, categorical reads hold the same values as a full `dtype=str` read, with every available engine"""
+        for path, columns, categorical_columns, sep in TABLES:
+            expected = pd.read_csv(path, sep=sep, dtype=str)[columns]
+            for engine in sorted({'c', CSV_ENGINE}):
+                with self.subTest(table=os.path.basename(path), engine=engine):
+                    df = read_release_table(path, columns, categorical_columns, sep=sep, engine=engine)
+                    self.assertEqual(list(df.columns), columns)
+                    for col in categorical_columns:
+                        self.assertIsInstance(df[col].dtype, pd.CategoricalDtype)
+                    pd.testing.assert_frame_equal(df.astype(object), expected)
+
+
+class ReleaseZipTableTests(unittest.TestCase):
+    """Tables parsed from a release zip, and in chunks, match the tables parsed from the extracted files"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.work_dir, 'Loinc_2.74.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as release_zip:
+            for path, _, _, _ in TABLES:
+                release_zip.write(path, f'Loinc_2.74/Tables/{os.path.basename(path)}')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_zip_and_chunked_reads_match(self):
+        for path, columns, categorical_columns, sep in TABLES:
+            expected = read_release_table(path, columns, categorical_columns, sep=sep)
+            member = f'Tables/{os.path.basename(path)}'
+            for chunk_size in [None, 7, 1000]:
+                with self.subTest(table=os.path.basename(path), chunk_size=chunk_size):
+                    df = read_release_table(path, columns, categorical_columns, sep=sep, chunk_size=chunk_size)
+                    pd.testing.assert_frame_equal(df.astype(object), expected.astype(object))
+                    df = read_release_table(self.zip_path, columns, categorical_columns, sep=sep, member=member,
+                                            chunk_size=chunk_size)
+                    for col in categorical_columns:
+                        self.assertIsInstance(df[col].dtype, pd.CategoricalDtype)
+                    pd.testing.assert_frame_equal(df.astype(object), expected.astype(object))
+
+    def test_missing_member(self):
+        with zipfile.ZipFile(self.zip_path) as release_zip:
+            self.assertEqual(find_zip_member(release_zip, 'Loinc.csv').filename, 'Loinc_2.74/Tables/Loinc.csv')
+            with self.assertRaises(FileNotFoundError):
+                find_zip_member(release_zip, 'oinc.csv')
@@ -0,0 +1,34 @@
+"""Unit tests: SSSOM to OWL"""
+import io
+import unittest
+
+from comp_loinc.mapping.mapping_utils import context_metadata
+from comp_loinc.mapping.sssom_owl import SSSOMOWLWriter
+
+
+class SSSOMOWLWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        metadata = context_metadata({'loinc': 'https://loinc.org/'}, mapping_set_id='http://loinc.org/cm/test')
+        self.writer = SSSOMOWLWriter(metadata, predicates=['skos:exactMatch'])
+
+    def test_write_stream(self):
+        output = io.StringIO()
+        mappings = [('loinc:LP1-1', 'skos:exactMatch', 'CHEBI:1', 'say "one" \\ 1', 'sempav:HumanCuration'),
+                    ('loinc:LP2-2', 'skos:exactMatch', 'CHEBI:2', None, 'sempav:HumanCuration')]
+        self.assertEqual(self.writer.write_stream(iter(mappings), output), 2)
+        lines = output.getvalue().splitlines()
+        self.assertIn('Prefix( CHEBI: = <http://purl.obolibrary.org/obo/CHEBI_> )', lines)
+        self.assertIn('Ontology( <http://loinc.org/cm/test>', lines)
+        self.assertIn('    Declaration( AnnotationProperty( skos:exactMatch ) )', lines)
+        self.assertEqual(lines[-3:], [
+            '    AnnotationAssertion( Annotation( sssom:mapping_justification <https://w3id.org/sempavHumanCuration> ) '
+            'Annotation( sssom:object_label "say \\"one\\" \\\\ 1" ) skos:exactMatch <https://loinc.org/LP1-1> '
+            '<http://purl.obolibrary.org/obo/CHEBI_1> )',
+            '    AnnotationAssertion( Annotation( sssom:mapping_justification <https://w3id.org/sempavHumanCuration> ) '
+            'skos:exactMatch <https://loinc.org/LP2-2> <http://purl.obolibrary.org/obo/CHEBI_2> )',
+            ')'])
+
+
+if __name__ == '__main__':
+    unittest.main()
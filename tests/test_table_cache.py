@@ -0,0 +1,52 @@
+"""Unit tests: release table cache"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from comp_loinc.ingest.release_tables import read_release_table, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS
+from comp_loinc.ingest.table_cache import load_release_table, cache_path, CACHE_AVAILABLE
+
+try:
+    from tests.config import TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import TEST_STATIC_DIR
+
+LOINC_CSV = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input', 'Loinc.csv')
+
+
+@unittest.skipUnless(CACHE_AVAILABLE, 'the table cache needs pyarrow')
+class TableCacheTests(unittest.TestCase):
+    """load_release_table tests"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.loinc_csv = shutil.copy(LOINC_CSV, self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self):
+        return load_release_table(self.loinc_csv, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS,
+                                  cache_directory=self.cache_dir)
+
+    def test_cache_hit_matches_source(self):
+        """A cached table reads back identical to parsing the source file"""
+        expected = read_release_table(self.loinc_csv, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS)
+        self.load()
+        entry = cache_path(self.cache_dir, self.loinc_csv, LOINC_COLUMNS, LOINC_CATEGORICAL_COLUMNS)
+        self.assertTrue(os.path.exists(entry))
+        pd.testing.assert_frame_equal(self.load(), expected)
+
+    def test_changed_file_rebuilds(self):
+        """Changing the source file content invalidates its cache entry"""
+        self.load()
+        with open(self.loinc_csv) as f:
+            lines = f.readlines()
+        with open(self.loinc_csv, 'w') as f:
+            f.writelines(lines[:10])
+        self.assertEqual(len(self.load()), 9)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
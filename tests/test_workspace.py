@@ -0,0 +1,65 @@
+"""Unit tests: release workspaces"""
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from comp_loinc.main import DEFAULTS
+from comp_loinc.workspace import release_paths, prepare_release_workspace, OUTPUT_PATHS
+
+try:
+    from tests.config import TEST_STATIC_DIR
+except ModuleNotFoundError:
+    from config import TEST_STATIC_DIR
+
+CODE_INPUT_DIR = os.path.join(TEST_STATIC_DIR, 'test_python_api_2_codes', 'input')
+
+
+class ReleaseWorkspaceTests(unittest.TestCase):
+    """Each release gets its own code files and outputs, and shares the table cache"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.release_dir = os.path.join(self.data_dir, 'loinc_release')
+        os.mkdir(self.release_dir)
+        for release in ['2.74', '2.76']:
+            with zipfile.ZipFile(os.path.join(self.release_dir, f'Loinc_{release}.zip'), 'w') as release_zip:
+                release_zip.write(os.path.join(CODE_INPUT_DIR, 'Loinc.csv'), f'Loinc_{release}/LoincTable/Loinc.csv')
+                release_zip.write(os.path.join(CODE_INPUT_DIR, 'LoincPartLink_Primary.csv'),
+                                  f'Loinc_{release}/AccessoryFiles/PartFile/LoincPartLink_Primary.csv')
+        self.shared_code_dir = os.path.join(self.data_dir, 'code_files')
+        os.mkdir(self.shared_code_dir)
+        with open(os.path.join(self.shared_code_dir, 'included_codes.tsv'), 'w') as f:
+            f.write('1-8\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_release_paths(self):
+        paths = {release: release_paths(DEFAULTS, self.data_dir, release) for release in ['2.74', '2.76']}
+        for release, release_path in paths.items():
+            workspace = os.path.join(self.data_dir, 'releases', release)
+            for key in list(OUTPUT_PATHS) + ['code_directory']:
+                self.assertTrue(release_path[key].startswith(workspace + os.sep), key)
+            self.assertEqual(release_path['cache_directory'], DEFAULTS['cache_directory'])
+            self.assertEqual(release_path['part_directory'], DEFAULTS['part_directory'])
+        self.assertNotEqual(paths['2.74']['output.reason'], paths['2.76']['output.reason'])
+
+        os.makedirs(os.path.join(self.data_dir, 'releases', '2.74', 'part_files'))
+        self.assertEqual(release_paths(DEFAULTS, self.data_dir, '2.74')['part_directory'],
+                         os.path.join(self.data_dir, 'releases', '2.74', 'part_files'))
+
+    def test_prepare_release_workspace(self):
+        paths = release_paths(DEFAULTS, self.data_dir, '2.76')
+        prepare_release_workspace(paths, '2.76', self.release_dir, self.shared_code_dir)
+        self.assertEqual(sorted(os.listdir(paths['code_directory'])),
+                         ['Loinc.csv', 'LoincPartLink_Primary.csv', 'included_codes.tsv'])
+        self.assertTrue(os.path.isdir(paths['owl_directory']))
+        with self.assertRaises(Exception):
+            prepare_release_workspace(release_paths(DEFAULTS, self.data_dir, '2.7'), '2.7', self.release_dir,
+                                      self.shared_code_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()